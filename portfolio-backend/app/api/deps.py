@@ -4,7 +4,7 @@ from fastapi.security import OAuth2PasswordBearer
 import jwt
 from jwt.exceptions import PyJWTError as JWTError
 from pydantic import ValidationError
-from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm import Session
 
 from app.core.database import get_db
 from app.core.config import settings
@@ -25,7 +25,8 @@ def get_current_user(
 ) -> models.User:
     """
     Validate and decode the JWT token to get the current user.
-    Loads roles and permissions for authorization checks.
+    Roles and permissions are not loaded: authorization checks read the user's cached
+    effective permissions (see ``PermissionChecker.effective_permissions``).
     
     Token extraction priority:
     1. httpOnly cookie (secure, recommended)
@@ -69,10 +70,7 @@ def get_current_user(
         logger.error(f"Token validation error: {str(e)}")
         raise credentials_exception
     
-    # Load user with roles and permissions for authorization checks
-    user = db.query(models.User).options(
-        selectinload(models.User.roles).selectinload(models.Role.permissions)
-    ).filter(models.User.username == token_data.username).first()
+    user = db.query(models.User).filter(models.User.username == token_data.username).first()
     
     if user is None:
         raise credentials_exception
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Response
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import text
@@ -21,9 +21,13 @@ from app.schemas.agent import (
     ChatRequest,
 )
 from app.models.agent import Agent, AgentCredential, AgentTemplate
-from app.services.chat_service import run_agent_test, run_agent_chat
-from app.services.chat_service_async import run_agent_chat_stream
+from app.services.chat_service import run_agent_test
+from app.services.chat_service_async import run_agent_chat_async, run_agent_chat_stream
+from app.observability.timing import StageTimer
 from app.services.credential_service import CredentialService
+from app.services.agent_cache import invalidate_agent_cache
+from app.services.cache_service import cache_service
+from app.rag import answer_cache
 
 router = APIRouter()
 
@@ -114,6 +118,7 @@ def update_credential(
     credential.updated_by = current_user.id
 
     db.commit()
+    invalidate_agent_cache()
     db.refresh(credential)
     return credential
 
@@ -141,6 +146,7 @@ def rotate_credential(
     credential.api_key_encrypted = CredentialService.encrypt_api_key(db, body.api_key)
     credential.updated_by = current_user.id
     db.commit()
+    invalidate_agent_cache()
     db.refresh(credential)
     return credential
 
@@ -311,6 +317,7 @@ def delete_credential(
     
     db.delete(credential)
     db.commit()
+    invalidate_agent_cache()
     return {"message": "Credential deleted successfully"}
 
 
@@ -372,7 +379,10 @@ def update_agent(
         raise HTTPException(status_code=404, detail="Agent not found")
     for k, v in agent_in.model_dump(exclude_unset=True).items():
         setattr(agent, k, v)
+    answer_cache.invalidate_agent(db, agent_id)
     db.commit()
+    invalidate_agent_cache()
+    cache_service.invalidate_agent(agent_id)
     db.refresh(agent)
     return agent
 
@@ -389,7 +399,10 @@ def delete_agent(
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     db.delete(agent)
+    answer_cache.invalidate_agent(db, agent_id)
     db.commit()
+    invalidate_agent_cache()
+    cache_service.invalidate_agent(agent_id)
     return {"message": "Agent deleted successfully"}
 
 
@@ -418,7 +431,10 @@ def upsert_template(
     # Ensure only one default per agent
     if tpl_in.is_default:
         db.query(AgentTemplate).filter(AgentTemplate.agent_id == tpl.agent_id, AgentTemplate.id != tpl.id).update({AgentTemplate.is_default: False})
+    answer_cache.invalidate_agent(db, tpl.agent_id)
     db.commit()
+    invalidate_agent_cache()
+    cache_service.invalidate_agent(tpl.agent_id)
     db.refresh(tpl)
     return tpl
 
@@ -447,21 +463,25 @@ def test_agent(
 
 
 @router.post("/{agent_id}/chat")
-def agent_chat(
+async def agent_chat(
     *,
     db: Session = Depends(deps.get_db),
     agent_id: int,
     payload: ChatRequest,
+    response: Response,
     current_user=Depends(deps.get_current_user),
 ):
-    # Non-streaming response
-    return run_agent_chat(db, agent_id=agent_id, user_message=payload.message, session_id=payload.session_id, template_id=None, portfolio_id=payload.portfolio_id, portfolio_query=getattr(payload, 'portfolio_query', None), language_id=getattr(payload, 'language_id', None))
+    # Non-streaming response; per-stage latencies are exposed as Server-Timing
+    timer = StageTimer(agent_id=agent_id)
+    try:
+        return await run_agent_chat_async(db, agent_id=agent_id, user_message=payload.message, session_id=payload.session_id, template_id=None, portfolio_id=payload.portfolio_id, portfolio_query=getattr(payload, 'portfolio_query', None), language_id=getattr(payload, 'language_id', None), timer=timer)
+    finally:
+        response.headers["Server-Timing"] = timer.server_timing()
 
 
 @router.post("/{agent_id}/chat/stream")
 async def agent_chat_stream(
     *,
-    db: Session = Depends(deps.get_db),
     agent_id: int,
     payload: ChatRequest,
     current_user=Depends(deps.get_current_user),
@@ -471,7 +491,7 @@ async def agent_chat_stream(
     
     Returns a stream of JSON events:
     - {"type": "token", "content": "text chunk"}
-    - {"type": "done", "citations": [...], "cached": true/false}
+    - {"type": "done", "citations": [...], "cached": true/false, "server_timing": "..."}
     - {"type": "error", "message": "error details"}
     
     Performance improvements:
@@ -479,9 +499,10 @@ async def agent_chat_stream(
     - Cached responses: <5ms for identical queries
     - Dynamic context sizing based on query complexity
     """
+    # The stream opens its own session: the request-scoped one is closed before the body is sent
     return StreamingResponse(
         run_agent_chat_stream(
-            db,
+            None,
             agent_id=agent_id,
             user_message=payload.message,
             session_id=payload.session_id,
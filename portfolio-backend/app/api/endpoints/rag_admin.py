@@ -10,6 +10,10 @@ from app.api import deps
 from app.core.database import SessionLocal
 from app.core.security_decorators import require_system_admin
 from app.rag.indexer import index_record
+from app.rag.embedding import embedding_batcher
+from concurrent.futures import ThreadPoolExecutor
+from app.rag.scope import rebuild_source_scope
+from app.rag.reindex import SUPPORTED_TABLES, run_reindex, reindex_progress
 from app import models
 from pydantic import BaseModel
 from app.observability.metrics import rag_index_jobs, rag_retire_jobs, rag_chunks_retired
@@ -112,22 +116,53 @@ def _reindex_table(db: Session, table: str, limit: Optional[int], offset: int) -
         rows = db.execute(text(q), {"lim": limit, "off": offset}).fetchall()
     else:
         rows = db.execute(text(q)).fetchall()
-    for (rid,) in rows:
-        index_record(db, table, str(rid))
-        total += 1
-        # Reflect processed jobs in metrics when running inline
-        try:
-            if rag_index_jobs:
-                rag_index_jobs.inc()
-        except Exception:
-            pass
+    workers = max(1, int(os.getenv("RAG_REINDEX_WORKERS", "4")))
+    if workers == 1:
+        for (rid,) in rows:
+            with embedding_batcher.producer():
+                index_record(db, table, str(rid))
+            total += 1
+            _count_index_job()
+        return total
+
+    # Index records concurrently (one session per worker) so the shared embedding
+    # batcher can coalesce their texts into fewer provider calls
+    def _index_one(rid: str) -> None:
+        with SessionLocal() as worker_db, embedding_batcher.producer():
+            index_record(worker_db, table, rid)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-reindex") as pool:
+        for _ in pool.map(_index_one, [str(rid) for (rid,) in rows]):
+            total += 1
+            _count_index_job()
     return total
 
 
-def _background_reindex(tables: List[str], limit: Optional[int], offset: int) -> None:
+def _count_index_job() -> None:
+    # Reflect processed jobs in metrics when running inline
+    try:
+        if rag_index_jobs:
+            rag_index_jobs.inc()
+    except Exception:
+        pass
+
+
+def _background_reindex(tables: List[str], limit: Optional[int], offset: int, resume: bool = True) -> None:
     with SessionLocal() as db:
         processed = 0
         try:
+            if limit is None and not offset:
+                # Full pass: keyset ranges on a worker pool with resumable cursors
+                try:
+                    processed += run_reindex(tables, resume=resume, session_factory=SessionLocal)
+                except Exception:
+                    try:
+                        db.rollback()
+                    except Exception:
+                        pass
+                    logger.exception("bulk reindex failed")
+                tables = []
+            # Explicit limit/offset windows keep the simple per-table walk
             for t in tables:
                 try:
                     processed += _reindex_table(db, t, limit, offset)
@@ -143,6 +178,14 @@ def _background_reindex(tables: List[str], limit: Optional[int], offset: int) ->
                     except Exception:
                         pass
         finally:
+            # Full rebuild of the portfolio scope map after a bulk pass
+            try:
+                rebuild_source_scope(db)
+            except Exception:
+                try:
+                    db.rollback()
+                except Exception:
+                    pass
             # Always mark finished and clear active flag, even if errors occurred
             try:
                 db.execute(text(
@@ -167,6 +210,8 @@ class ReindexRequest(BaseModel):
     tables: Optional[List[str]] = None
     limit: Optional[int] = None
     offset: int = 0
+    # Continue an interrupted full pass from the saved per-table cursors
+    resume: bool = True
 
 
 @router.post("/reindex")
@@ -177,20 +222,7 @@ def reindex_all(
     current_user: models.User = Depends(deps.get_current_user),
     db: Session = Depends(deps.get_db),
 ) -> Any:
-    supported = [
-        "categories",
-        "projects",
-        "portfolios",
-        "sections",
-        "experiences",
-        "category_types",
-        "languages",
-        "translations",
-        "skills",
-        "skill_types",
-        "project_attachments",
-        "portfolio_attachments",
-    ]
+    supported = SUPPORTED_TABLES
     to_run = req.tables or supported
     for t in to_run:
         if t not in supported:
@@ -212,18 +244,25 @@ def reindex_all(
             db.rollback()
         except Exception:
             pass
-    background_tasks.add_task(_background_reindex, to_run, req.limit, req.offset)
-    return {"scheduled": to_run, "limit": req.limit, "offset": req.offset}
+    background_tasks.add_task(_background_reindex, to_run, req.limit, req.offset, req.resume)
+    return {"scheduled": to_run, "limit": req.limit, "offset": req.offset, "resume": req.resume}
 
 
 @router.get("/status")
 @require_system_admin()
 def get_status(
-    source_table: str,
-    source_id: str,
+    source_table: Optional[str] = None,
+    source_id: Optional[str] = None,
     db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_user),
 ) -> Any:
+    if not source_table or not source_id:
+        # Without a record, report bulk reindex progress (throughput / ETA)
+        try:
+            return {"reindex": reindex_progress(db)}
+        except Exception as e:
+            logger.warning(f"reindex progress unavailable: {e}")
+            return {"reindex": None}
     row = db.execute(text(
         "SELECT source_table, source_id, last_indexed_at, last_error, updated_at FROM rag_index_status WHERE source_table=:t AND source_id=:i"
     ), {"t": source_table, "i": source_id}).mappings().first()
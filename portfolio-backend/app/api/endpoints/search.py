@@ -4,7 +4,8 @@ from sqlalchemy import text
 from typing import Any
 
 from app.api import deps
-from app.observability.metrics import rag_vector_search_seconds, rag_hybrid_search_seconds, rag_embedding_list_seconds
+from app.observability.metrics import rag_vector_search_seconds, rag_embedding_list_seconds
+from app.services import rag_service
 from time import perf_counter
 
 router = APIRouter()
@@ -85,52 +86,23 @@ def hybrid_search(
         vec = embed_text_batch([q])[0]
     except Exception:
         raise HTTPException(status_code=500, detail="Embedding provider not available")
-    vec_str = f"[{', '.join(str(x) for x in vec)}]"
     tenant_id = getattr(current_user, 'tenant_id', 'default') if current_user else 'default'
-    t0 = perf_counter()
     if model not in {"text-embedding-3-small", "text-embedding-3-large"}:
         raise HTTPException(status_code=400, detail="Unsupported model")
-    rows = db.execute(text(
-        """
-        WITH
-        q AS (SELECT CAST(:q AS vector) AS qvec),
-        fts AS (
-          SELECT id, source_table, source_id, source_field, part_index, text,
-                 ts_rank_cd(tsv, websearch_to_tsquery('english', :term)) AS fts_score
-          FROM rag_chunk
-          WHERE is_deleted = FALSE AND visibility IN ('public','internal') AND tenant_id = :tid AND tsv @@ websearch_to_tsquery('english', :term)
-          ORDER BY fts_score DESC
-          LIMIT :l
-        ),
-        vs AS (
-          SELECT c.id, c.source_table, c.source_id, c.source_field, c.part_index, c.text,
-                 (COALESCE(e.embedding_vec, e.embedding::vector) <=> q.qvec) AS distance
-          FROM rag_embedding e
-          JOIN rag_chunk c ON c.id = e.chunk_id
-          JOIN q ON TRUE
-          WHERE e.model = :m AND e.modality = 'text' AND c.is_deleted = FALSE AND c.visibility IN ('public','internal') AND c.tenant_id = :tid
-          ORDER BY distance
-          LIMIT :l
-        ),
-        unioned AS (
-          SELECT id, source_table, source_id, source_field, part_index, text,
-                 (1.0 / (:k + ROW_NUMBER() OVER (ORDER BY fts_score DESC))) AS rrf
-          FROM fts
-          UNION ALL
-          SELECT id, source_table, source_id, source_field, part_index, text,
-                 (1.0 / (:k + ROW_NUMBER() OVER (ORDER BY distance ASC))) AS rrf
-          FROM vs
-        )
-        SELECT id, source_table, source_id, source_field, part_index, text,
-               SUM(rrf) AS rrf_score
-        FROM unioned
-        GROUP BY id, source_table, source_id, source_field, part_index, text
-        ORDER BY rrf_score DESC
-        LIMIT :l
-        """
-    ), {"q": vec_str, "m": model, "l": limit, "term": q, "tid": tenant_id, "k": rrf_k}).mappings().all()
-    if rag_hybrid_search_seconds:
-        rag_hybrid_search_seconds.observe(perf_counter() - t0)
-    return {"model": model, "k": rrf_k, "items": [{**dict(r), "rrf_score": float(r["rrf_score"]) if r.get("rrf_score") is not None else None} for r in rows]}
-
-
+    # Same fusion as hybrid-mode agent chat; a search box query requires every term
+    items = rag_service.hybrid_search(
+        db, qvec=vec, query_text=q, model=model, k=limit, score_threshold=None, rrf_k=rrf_k,
+        tenant_id=tenant_id, visibility=["public", "internal"], match_all_terms=True,
+    )
+    return {"model": model, "k": rrf_k, "items": [
+        {
+            "id": it["chunk_id"],
+            "source_table": it["source_table"],
+            "source_id": it["source_id"],
+            "source_field": it["source_field"],
+            "part_index": it["part_index"],
+            "text": it["text"],
+            "rrf_score": it.get("rrf_score"),
+        }
+        for it in items
+    ]}
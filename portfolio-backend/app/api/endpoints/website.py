@@ -3,8 +3,11 @@ Website API endpoints - Public facing endpoints for portfolio website.
 No authentication required for viewing content.
 """
 from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import Any, Optional, List
+from typing import Any, AsyncIterator, Dict, Optional, List, Tuple
+from time import perf_counter
 from pydantic import BaseModel, Field
 from app.api import deps
 from app.crud import portfolio as portfolio_crud, experience as experience_crud
@@ -12,7 +15,9 @@ from app.schemas.portfolio import PortfolioOut
 from app.schemas.experience import Experience as ExperienceSchema
 from app.api.endpoints.portfolios import process_portfolios_for_response
 from app.core.logging import setup_logger
-from app.services.chat_service import run_agent_chat
+from app.services.chat_service_async import run_agent_chat_async, stream_chat_events, sse_stream, stream_session
+from app.observability.timing import StageTimer
+from app.observability.metrics import chat_stream_first_token_seconds, chat_stream_failovers
 from app.models.agent import Agent
 
 # Set up logger
@@ -36,6 +41,35 @@ def _get_active_fallback_agent_ids(db: Session, exclude_agent_ids: List[int], li
     return [int(row[0]) for row in rows]
 
 
+def _get_candidate_agent_ids(db: Session, portfolio: Any) -> List[int]:
+    """Portfolio default agent first, then other active agents; 503 when there is none."""
+    candidate_agent_ids: List[int] = []
+    if portfolio.default_agent_id:
+        candidate_agent_ids.append(int(portfolio.default_agent_id))
+
+    candidate_agent_ids.extend(
+        _get_active_fallback_agent_ids(db, exclude_agent_ids=candidate_agent_ids, limit=5)
+    )
+
+    if not candidate_agent_ids:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No active AI agent is available for this portfolio"
+        )
+    return candidate_agent_ids
+
+
+def _load_chat_portfolio(db: Session, portfolio_id: int, full_details: bool) -> Tuple[Any, List[int]]:
+    """Portfolio and its candidate agent ids; 404 when the portfolio does not exist."""
+    portfolio = portfolio_crud.get_portfolio(db, portfolio_id=portfolio_id, full_details=full_details)
+    if not portfolio:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Portfolio with ID {portfolio_id} not found"
+        )
+    return portfolio, _get_candidate_agent_ids(db, portfolio)
+
+
 @router.get("/experiences", response_model=List[ExperienceSchema])
 def get_public_experiences(
     response: Response,
@@ -289,9 +323,10 @@ def filter_by_language(portfolio_data: dict, language_code: str) -> dict:
 
 
 @router.post("/chat/portfolios/{portfolio_id}")
-def chat_with_portfolio_agent(
+async def chat_with_portfolio_agent(
     portfolio_id: int,
     payload: PublicPortfolioChatRequest,
+    response: Response,
     db: Session = Depends(deps.get_db),
 ) -> Any:
     """
@@ -300,31 +335,13 @@ def chat_with_portfolio_agent(
     """
     logger.info(f"Website chat requested for portfolio {portfolio_id}")
 
-    portfolio = portfolio_crud.get_portfolio(db, portfolio_id=portfolio_id, full_details=True)
-    if not portfolio:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Portfolio with ID {portfolio_id} not found"
-        )
-
-    candidate_agent_ids: List[int] = []
-    if portfolio.default_agent_id:
-        candidate_agent_ids.append(int(portfolio.default_agent_id))
-
-    candidate_agent_ids.extend(
-        _get_active_fallback_agent_ids(db, exclude_agent_ids=candidate_agent_ids, limit=5)
-    )
-
-    if not candidate_agent_ids:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="No active AI agent is available for this portfolio"
-        )
+    portfolio, candidate_agent_ids = await run_in_threadpool(_load_chat_portfolio, db, portfolio_id, True)
 
     attempt_errors: List[str] = []
     for attempt_index, candidate_agent_id in enumerate(candidate_agent_ids):
+        timer = StageTimer(agent_id=candidate_agent_id)
         try:
-            result = run_agent_chat(
+            result = await run_agent_chat_async(
                 db,
                 agent_id=candidate_agent_id,
                 user_message=payload.message,
@@ -332,10 +349,12 @@ def chat_with_portfolio_agent(
                 portfolio_id=portfolio_id,
                 language_id=payload.language_id,
                 raise_on_provider_error=True,
+                timer=timer,
             )
             result["agent_id"] = candidate_agent_id
             result["used_default_agent"] = bool(portfolio.default_agent_id) and candidate_agent_id == int(portfolio.default_agent_id)
             result["fallback_agent_used"] = bool(portfolio.default_agent_id) and candidate_agent_id != int(portfolio.default_agent_id)
+            response.headers["Server-Timing"] = timer.server_timing()
             return result
         except ValueError as exc:
             err = f"agent={candidate_agent_id} value_error={str(exc)}"
@@ -356,3 +375,121 @@ def chat_with_portfolio_agent(
         status_code=status.HTTP_502_BAD_GATEWAY,
         detail="AI assistant is temporarily unavailable. Please try again."
     )
+
+
+async def _failover_chat_events(
+    *,
+    portfolio_id: int,
+    default_agent_id: Optional[int],
+    candidate_agent_ids: List[int],
+    payload: PublicPortfolioChatRequest,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Stream from the first candidate agent that gets to its first token.
+
+    Once a token has been sent the answer is committed to that agent; later errors are
+    reported in the stream instead of restarting with another agent. The stream outlives the
+    request-scoped session, so it uses its own.
+    """
+    async with stream_session() as db:
+        async for event in _failover_attempts(
+            db,
+            portfolio_id=portfolio_id,
+            default_agent_id=default_agent_id,
+            candidate_agent_ids=candidate_agent_ids,
+            payload=payload,
+        ):
+            yield event
+
+
+async def _failover_attempts(
+    db: Session,
+    *,
+    portfolio_id: int,
+    default_agent_id: Optional[int],
+    candidate_agent_ids: List[int],
+    payload: PublicPortfolioChatRequest,
+) -> AsyncIterator[Dict[str, Any]]:
+    started = perf_counter()
+    attempt_errors: List[str] = []
+    for attempt_index, candidate_agent_id in enumerate(candidate_agent_ids):
+        timer = StageTimer(agent_id=candidate_agent_id)
+        first_token = True
+        try:
+            async for event in stream_chat_events(
+                db,
+                agent_id=candidate_agent_id,
+                user_message=payload.message,
+                session_id=payload.session_id if attempt_index == 0 else None,
+                portfolio_id=portfolio_id,
+                language_id=payload.language_id,
+                timer=timer,
+                raise_before_first_token=True,
+            ):
+                if first_token and event.get("type") == "token":
+                    first_token = False
+                    try:
+                        if chat_stream_first_token_seconds:
+                            chat_stream_first_token_seconds.labels(failover=str(attempt_index > 0).lower()).observe(perf_counter() - started)
+                    except Exception:
+                        pass
+                if event.get("type") == "done":
+                    event["agent_id"] = candidate_agent_id
+                    event["used_default_agent"] = bool(default_agent_id) and candidate_agent_id == default_agent_id
+                    event["fallback_agent_used"] = bool(default_agent_id) and candidate_agent_id != default_agent_id
+                yield event
+            return
+        except Exception as exc:
+            if not first_token:
+                logger.warning(f"Website chat stream failed mid-answer for portfolio {portfolio_id}: agent={candidate_agent_id} error={str(exc)}")
+                yield {"type": "error", "message": "AI assistant is temporarily unavailable. Please try again."}
+                return
+            err = f"agent={candidate_agent_id} error={str(exc)}"
+            attempt_errors.append(err)
+            logger.warning(f"Website chat stream attempt failed for portfolio {portfolio_id}: {err}")
+            try:
+                if chat_stream_failovers:
+                    chat_stream_failovers.inc()
+            except Exception:
+                pass
+            continue
+        finally:
+            timer.observe()
+
+    logger.error(
+        f"All agent chat stream attempts failed for portfolio {portfolio_id}. "
+        f"default_agent_id={default_agent_id}, attempts={attempt_errors}"
+    )
+    yield {"type": "error", "message": "AI assistant is temporarily unavailable. Please try again."}
+
+
+@router.post("/chat/portfolios/{portfolio_id}/stream")
+def stream_chat_with_portfolio_agent(
+    portfolio_id: int,
+    payload: PublicPortfolioChatRequest,
+    db: Session = Depends(deps.get_db),
+) -> StreamingResponse:
+    """
+    Streaming (Server-Sent Events) variant of the public chat endpoint.
+
+    Emits ``token`` events as the answer is generated, then a ``done`` event with citations,
+    session and agent information (same fields as the blocking endpoint). If an agent fails
+    before its first token, the next candidate agent is tried transparently.
+    """
+    logger.info(f"Website chat stream requested for portfolio {portfolio_id}")
+
+    portfolio, candidate_agent_ids = _load_chat_portfolio(db, portfolio_id, False)
+    default_agent_id = int(portfolio.default_agent_id) if portfolio.default_agent_id else None
+
+    return StreamingResponse(
+        sse_stream(_failover_chat_events(
+            portfolio_id=portfolio_id,
+            default_agent_id=default_agent_id,
+            candidate_agent_ids=candidate_agent_ids,
+            payload=payload,
+        )),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Disable nginx buffering
+        }
+    )
@@ -1,19 +1,107 @@
 import asyncio
+import os
+import threading
 from functools import wraps
-from typing import List, Callable, Any
+from time import monotonic
+from typing import List, Callable, Any, Dict, FrozenSet, Tuple
 from fastapi import HTTPException, status
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from app.models.user import User
+from app.services.cache_service import cache_service
 from app.core.logging import setup_logger
 
 logger = setup_logger("app.core.security_decorators")
 
+# Manage permissions that grant multiple permissions
+MANAGE_PERMISSIONS = {
+    "MANAGE_ROLES": ["VIEW_ROLES", "CREATE_ROLE", "EDIT_ROLE", "DELETE_ROLE"],
+    "MANAGE_USERS": ["VIEW_USERS", "CREATE_USER", "EDIT_USER", "DELETE_USER"],
+    "MANAGE_PERMISSIONS": ["VIEW_PERMISSIONS", "CREATE_PERMISSION", "EDIT_PERMISSION", "DELETE_PERMISSION"],
+    "MANAGE_SKILLS": ["VIEW_SKILLS", "CREATE_SKILL", "EDIT_SKILL", "DELETE_SKILL"],
+    "MANAGE_SKILL_TYPES": ["VIEW_SKILL_TYPES", "CREATE_SKILL_TYPE", "EDIT_SKILL_TYPE", "DELETE_SKILL_TYPE"],
+    "MANAGE_CATEGORIES": ["VIEW_CATEGORIES", "CREATE_CATEGORY", "EDIT_CATEGORY", "DELETE_CATEGORY"],
+    "MANAGE_CATEGORY_TYPES": ["VIEW_CATEGORY_TYPES", "CREATE_CATEGORY_TYPE", "EDIT_CATEGORY_TYPE", "DELETE_CATEGORY_TYPE"],
+    "MANAGE_PORTFOLIOS": [
+        "VIEW_PORTFOLIOS", "CREATE_PORTFOLIO", "EDIT_PORTFOLIO", "DELETE_PORTFOLIO",
+        # include portfolio image/attachment granular rights under manage portfolios umbrella
+        "VIEW_PORTFOLIO_IMAGES", "UPLOAD_PORTFOLIO_IMAGES", "EDIT_PORTFOLIO_IMAGES", "DELETE_PORTFOLIO_IMAGES",
+        "VIEW_PORTFOLIO_ATTACHMENTS", "UPLOAD_PORTFOLIO_ATTACHMENTS", "EDIT_PORTFOLIO_ATTACHMENTS", "DELETE_PORTFOLIO_ATTACHMENTS"
+    ],
+    "MANAGE_PROJECTS": ["VIEW_PROJECTS", "CREATE_PROJECT", "EDIT_PROJECT", "DELETE_PROJECT", "VIEW_PROJECT_IMAGES", "UPLOAD_PROJECT_IMAGES", "EDIT_PROJECT_IMAGES", "DELETE_PROJECT_IMAGES", "VIEW_PROJECT_ATTACHMENTS", "UPLOAD_PROJECT_ATTACHMENTS", "EDIT_PROJECT_ATTACHMENTS", "DELETE_PROJECT_ATTACHMENTS"],
+    "MANAGE_PROJECT_IMAGES": ["VIEW_PROJECT_IMAGES", "UPLOAD_PROJECT_IMAGES", "EDIT_PROJECT_IMAGES", "DELETE_PROJECT_IMAGES"],
+    "MANAGE_PROJECT_ATTACHMENTS": ["VIEW_PROJECT_ATTACHMENTS", "UPLOAD_PROJECT_ATTACHMENTS", "EDIT_PROJECT_ATTACHMENTS", "DELETE_PROJECT_ATTACHMENTS"],
+    "MANAGE_PORTFOLIO_IMAGES": ["VIEW_PORTFOLIO_IMAGES", "UPLOAD_PORTFOLIO_IMAGES", "EDIT_PORTFOLIO_IMAGES", "DELETE_PORTFOLIO_IMAGES"],
+    "MANAGE_PORTFOLIO_ATTACHMENTS": ["VIEW_PORTFOLIO_ATTACHMENTS", "UPLOAD_PORTFOLIO_ATTACHMENTS", "EDIT_PORTFOLIO_ATTACHMENTS", "DELETE_PORTFOLIO_ATTACHMENTS"],
+    "MANAGE_EXPERIENCES": ["VIEW_EXPERIENCES", "CREATE_EXPERIENCE", "EDIT_EXPERIENCE", "DELETE_EXPERIENCE"],
+    "MANAGE_LANGUAGES": ["VIEW_LANGUAGES", "CREATE_LANGUAGE", "EDIT_LANGUAGE", "DELETE_LANGUAGE"],
+    "MANAGE_SECTIONS": ["VIEW_SECTIONS", "CREATE_SECTION", "EDIT_SECTION", "DELETE_SECTION"],
+    "MANAGE_TRANSLATIONS": ["VIEW_TRANSLATIONS", "CREATE_TRANSLATION", "EDIT_TRANSLATION", "DELETE_TRANSLATION"],
+    "MANAGE_CAREER": ["VIEW_CAREER"],
+}
+
+# Seconds a cached permission set is trusted: the process copy when Redis is unavailable, and
+# the Redis entry, so a missed invalidation (failed INCR) is stale for no longer either way
+_PERMISSION_CACHE_TTL = float(os.getenv("PERMISSION_CACHE_TTL", "60"))
+
+
 class PermissionChecker:
-    """Centralized permission checking logic with systemadmin support"""
+    """Centralized permission checking logic with systemadmin support
+
+    Each user's effective permissions (role permissions plus everything their MANAGE_*
+    permissions grant) are flattened once and cached in process and in Redis under a
+    permissions generation. Role, permission and user-role changes bump the generation
+    (see ``mark_permissions_changed``), so a check is one cache lookup per request.
+    """
     
     def __init__(self):
         self.system_admin_users = ["systemadmin"]
         self.super_admin_permission = "SYSTEM_ADMIN"
+        self._cache: Dict[int, Tuple[str, FrozenSet[str], float]] = {}
+        self._local_generation = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _flatten(user: User) -> FrozenSet[str]:
+        permissions = {permission.name for role in user.roles for permission in role.permissions}
+        for manage_perm in permissions & MANAGE_PERMISSIONS.keys():
+            permissions.update(MANAGE_PERMISSIONS[manage_perm])
+        return frozenset(permissions)
+    
+    def effective_permissions(self, user: User) -> FrozenSet[str]:
+        """Names of all permissions the user holds, directly or through a manage permission"""
+        # Memoized on the instance, so several checks in one request share a lookup
+        memo = getattr(user, "_effective_permissions", None)
+        if memo is not None:
+            return memo
+        if getattr(user, "id", None) is None:
+            return self._flatten(user)
+        
+        generation, shared = cache_service.get_user_permissions(user.id)
+        now = monotonic()
+        if generation is None:
+            generation = f"local:{self._local_generation}"
+        with self._lock:
+            entry = self._cache.get(user.id)
+        if entry and entry[0] == generation and entry[2] > now:
+            permissions = entry[1]
+        elif shared is not None:
+            permissions = frozenset(shared)
+        else:
+            permissions = self._flatten(user)
+            if not generation.startswith("local:"):
+                cache_service.set_user_permissions(user.id, generation, permissions, ttl_seconds=max(1, int(_PERMISSION_CACHE_TTL)))
+        with self._lock:
+            self._cache[user.id] = (generation, permissions, now + _PERMISSION_CACHE_TTL)
+        user._effective_permissions = permissions
+        return permissions
+    
+    def invalidate(self) -> None:
+        """Drop every cached permission set, here and (through Redis) in the other workers"""
+        with self._lock:
+            self._local_generation += 1
+            self._cache.clear()
+        cache_service.invalidate_permissions()
     
     def is_system_admin(self, user: User) -> bool:
         """Check if user is systemadmin or has SYSTEM_ADMIN permission"""
@@ -22,12 +110,7 @@ class PermissionChecker:
             return True
         
         # Check for SYSTEM_ADMIN permission
-        for role in user.roles:
-            for permission in role.permissions:
-                if permission.name == self.super_admin_permission:
-                    return True
-        
-        return False
+        return self.super_admin_permission in self.effective_permissions(user)
     
     def user_has_permission(self, user: User, required_permission: str) -> bool:
         """Check if user has specific permission or a manage permission that grants it"""
@@ -39,51 +122,10 @@ class PermissionChecker:
             logger.debug(f"System admin {user.username} granted access to {required_permission}")
             return True
         
-        
-        # Define manage permissions that grant multiple permissions
-        manage_permissions = {
-            "MANAGE_ROLES": ["VIEW_ROLES", "CREATE_ROLE", "EDIT_ROLE", "DELETE_ROLE"],
-            "MANAGE_USERS": ["VIEW_USERS", "CREATE_USER", "EDIT_USER", "DELETE_USER"],
-            "MANAGE_PERMISSIONS": ["VIEW_PERMISSIONS", "CREATE_PERMISSION", "EDIT_PERMISSION", "DELETE_PERMISSION"],
-            "MANAGE_SKILLS": ["VIEW_SKILLS", "CREATE_SKILL", "EDIT_SKILL", "DELETE_SKILL"],
-            "MANAGE_SKILL_TYPES": ["VIEW_SKILL_TYPES", "CREATE_SKILL_TYPE", "EDIT_SKILL_TYPE", "DELETE_SKILL_TYPE"],
-            "MANAGE_CATEGORIES": ["VIEW_CATEGORIES", "CREATE_CATEGORY", "EDIT_CATEGORY", "DELETE_CATEGORY"],
-            "MANAGE_CATEGORY_TYPES": ["VIEW_CATEGORY_TYPES", "CREATE_CATEGORY_TYPE", "EDIT_CATEGORY_TYPE", "DELETE_CATEGORY_TYPE"],
-            "MANAGE_PORTFOLIOS": [
-                "VIEW_PORTFOLIOS", "CREATE_PORTFOLIO", "EDIT_PORTFOLIO", "DELETE_PORTFOLIO",
-                # include portfolio image/attachment granular rights under manage portfolios umbrella
-                "VIEW_PORTFOLIO_IMAGES", "UPLOAD_PORTFOLIO_IMAGES", "EDIT_PORTFOLIO_IMAGES", "DELETE_PORTFOLIO_IMAGES",
-                "VIEW_PORTFOLIO_ATTACHMENTS", "UPLOAD_PORTFOLIO_ATTACHMENTS", "EDIT_PORTFOLIO_ATTACHMENTS", "DELETE_PORTFOLIO_ATTACHMENTS"
-            ],
-            "MANAGE_PROJECTS": ["VIEW_PROJECTS", "CREATE_PROJECT", "EDIT_PROJECT", "DELETE_PROJECT", "VIEW_PROJECT_IMAGES", "UPLOAD_PROJECT_IMAGES", "EDIT_PROJECT_IMAGES", "DELETE_PROJECT_IMAGES", "VIEW_PROJECT_ATTACHMENTS", "UPLOAD_PROJECT_ATTACHMENTS", "EDIT_PROJECT_ATTACHMENTS", "DELETE_PROJECT_ATTACHMENTS"],
-            "MANAGE_PROJECT_IMAGES": ["VIEW_PROJECT_IMAGES", "UPLOAD_PROJECT_IMAGES", "EDIT_PROJECT_IMAGES", "DELETE_PROJECT_IMAGES"],
-            "MANAGE_PROJECT_ATTACHMENTS": ["VIEW_PROJECT_ATTACHMENTS", "UPLOAD_PROJECT_ATTACHMENTS", "EDIT_PROJECT_ATTACHMENTS", "DELETE_PROJECT_ATTACHMENTS"],
-            "MANAGE_PORTFOLIO_IMAGES": ["VIEW_PORTFOLIO_IMAGES", "UPLOAD_PORTFOLIO_IMAGES", "EDIT_PORTFOLIO_IMAGES", "DELETE_PORTFOLIO_IMAGES"],
-            "MANAGE_PORTFOLIO_ATTACHMENTS": ["VIEW_PORTFOLIO_ATTACHMENTS", "UPLOAD_PORTFOLIO_ATTACHMENTS", "EDIT_PORTFOLIO_ATTACHMENTS", "DELETE_PORTFOLIO_ATTACHMENTS"],
-            "MANAGE_EXPERIENCES": ["VIEW_EXPERIENCES", "CREATE_EXPERIENCE", "EDIT_EXPERIENCE", "DELETE_EXPERIENCE"],
-            "MANAGE_LANGUAGES": ["VIEW_LANGUAGES", "CREATE_LANGUAGE", "EDIT_LANGUAGE", "DELETE_LANGUAGE"],
-            "MANAGE_SECTIONS": ["VIEW_SECTIONS", "CREATE_SECTION", "EDIT_SECTION", "DELETE_SECTION"],
-            "MANAGE_TRANSLATIONS": ["VIEW_TRANSLATIONS", "CREATE_TRANSLATION", "EDIT_TRANSLATION", "DELETE_TRANSLATION"],
-            "MANAGE_CAREER": ["VIEW_CAREER"],
-        }
-        
-        # Get all user permissions
-        user_permissions = set()
-        for role in user.roles:
-            for permission in role.permissions:
-                user_permissions.add(permission.name)
-        
-        # Check if user has the required permission directly
-        if required_permission in user_permissions:
+        if required_permission in self.effective_permissions(user):
             logger.debug(f"User {user.username} has required permission {required_permission}")
             return True
         
-        # Check if user has a manage permission that grants the required permission
-        for manage_perm, granted_permissions in manage_permissions.items():
-            if manage_perm in user_permissions and required_permission in granted_permissions:
-                logger.debug(f"User {user.username} has manage permission {manage_perm} which grants {required_permission}")
-                return True
-        
         logger.debug(f"User {user.username} lacks permission {required_permission}")
         return False
     
@@ -104,89 +146,95 @@ class PermissionChecker:
 # Global permission checker instance
 permission_checker = PermissionChecker()
 
+
+def mark_permissions_changed(db: Session) -> None:
+    """Invalidate cached permission sets once ``db`` commits (roles, permissions or user roles changed)"""
+    db.info["permissions_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    # After the commit, so a worker cannot re-cache the old assignments under the new generation
+    if session.info.pop("permissions_changed", False):
+        try:
+            permission_checker.invalidate()
+        except Exception as e:
+            logger.warning(f"Permission cache invalidation failed: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop("permissions_changed", None)
+
+def _current_user(kwargs: dict) -> User:
+    # Find current_user in kwargs (from Depends injection)
+    for value in kwargs.values():
+        if isinstance(value, User):
+            return value
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Authentication required"
+    )
+
+
+def _guard(func: Callable, check: Callable[[User], None]) -> Callable:
+    """Wrap ``func`` so ``check(current_user)`` runs first, keeping it sync or async.
+
+    FastAPI runs sync endpoints in its threadpool and awaits coroutines on the event loop,
+    so a sync endpoint must stay sync or its blocking database work would run on the loop.
+    """
+    if asyncio.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            check(_current_user(kwargs))
+            return await func(*args, **kwargs)
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        check(_current_user(kwargs))
+        return func(*args, **kwargs)
+    return wrapper
+
+
 def require_permission(permission: str):
     """Decorator to require specific permission for endpoint access"""
+    def check(current_user: User) -> None:
+        if not permission_checker.user_has_permission(current_user, permission):
+            logger.warning(f"User {current_user.username} denied access to {permission}")
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Insufficient permissions. Required: {permission}"
+            )
+
     def decorator(func: Callable) -> Callable:
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            # Extract current_user from dependency injection
-            current_user = None
-            
-            # Find current_user in kwargs (from Depends injection)
-            for key, value in kwargs.items():
-                if isinstance(value, User):
-                    current_user = value
-                    break
-            
-            if not current_user:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Authentication required"
-                )
-            
-            if not permission_checker.user_has_permission(current_user, permission):
-                logger.warning(f"User {current_user.username} denied access to {permission}")
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=f"Insufficient permissions. Required: {permission}"
-                )
-            
-            return await func(*args, **kwargs) if asyncio.iscoroutinefunction(func) else func(*args, **kwargs)
-        return wrapper
+        return _guard(func, check)
     return decorator
 
 def require_any_permission(permissions: List[str]):
     """Decorator to require any of the specified permissions"""
+    def check(current_user: User) -> None:
+        if not permission_checker.user_has_any_permission(current_user, permissions):
+            logger.warning(f"User {current_user.username} denied access. Required any of: {permissions}")
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Insufficient permissions. Required any of: {', '.join(permissions)}"
+            )
+
     def decorator(func: Callable) -> Callable:
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            current_user = None
-            for key, value in kwargs.items():
-                if isinstance(value, User):
-                    current_user = value
-                    break
-            
-            if not current_user:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Authentication required"
-                )
-            
-            if not permission_checker.user_has_any_permission(current_user, permissions):
-                logger.warning(f"User {current_user.username} denied access. Required any of: {permissions}")
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=f"Insufficient permissions. Required any of: {', '.join(permissions)}"
-                )
-            
-            return await func(*args, **kwargs) if asyncio.iscoroutinefunction(func) else func(*args, **kwargs)
-        return wrapper
+        return _guard(func, check)
     return decorator
 
 def require_system_admin():
     """Decorator to require system admin access"""
+    def check(current_user: User) -> None:
+        if not permission_checker.is_system_admin(current_user):
+            logger.warning(f"User {current_user.username} denied system admin access")
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="System administrator access required"
+            )
+
     def decorator(func: Callable) -> Callable:
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            current_user = None
-            for key, value in kwargs.items():
-                if isinstance(value, User):
-                    current_user = value
-                    break
-            
-            if not current_user:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Authentication required"
-                )
-            
-            if not permission_checker.is_system_admin(current_user):
-                logger.warning(f"User {current_user.username} denied system admin access")
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="System administrator access required"
-                )
-            
-            return await func(*args, **kwargs) if asyncio.iscoroutinefunction(func) else func(*args, **kwargs)
-        return wrapper
-    return decorator 
\ No newline at end of file
+        return _guard(func, check)
+    return decorator
@@ -8,6 +8,7 @@ from typing import List, Tuple, Optional, Dict, Any
 from app.core.logging import setup_logger
 from app.api.utils.query_builder import QueryBuilder
 from app.core.db import db_transaction # Import db_transaction
+from app.core.security_decorators import mark_permissions_changed
 
 # Set up logger
 logger = setup_logger("app.crud.permission")
@@ -100,6 +101,7 @@ def create_permission(db: Session, permission_in: PermissionCreate) -> Permissio
     db.add(db_permission)
     db.flush() # Flush to get the ID before returning
     db.refresh(db_permission)
+    mark_permissions_changed(db)
     logger.info(f"Permission '{db_permission.name}' (ID: {db_permission.id}) created successfully.")
     return db_permission
 
@@ -141,6 +143,7 @@ def update_permission(db: Session, permission_id: int, permission_in: Permission
     db.add(db_permission) # Add to session to mark as dirty
     db.flush()
     db.refresh(db_permission)
+    mark_permissions_changed(db)
     logger.info(f"Permission '{db_permission.name}' (ID: {permission_id}) updated successfully.")
     return db_permission
 
@@ -181,6 +184,7 @@ def delete_permission(db: Session, permission_id: int) -> Optional[Permission]:
     deleted_name = db_permission.name # Store name for logging before deletion
     db.delete(db_permission)
     db.flush()
+    mark_permissions_changed(db)
     logger.info(f"Permission '{deleted_name}' (ID: {permission_id}) deleted successfully.")
     # Return the object as it was before deletion for potential use in response
     # The object state might be unpredictable after commit, but contains the ID/data.
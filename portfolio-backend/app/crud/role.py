@@ -10,6 +10,7 @@ from fastapi import HTTPException
 from app.core.logging import setup_logger
 from app.api.utils.query_builder import QueryBuilder
 from app.core.db import db_transaction
+from app.core.security_decorators import mark_permissions_changed
 
 # Set up logger
 logger = setup_logger("app.crud.role")
@@ -211,6 +212,7 @@ def create_role(db: Session, role_in: RoleCreate) -> Role:
     
     db.add(db_role)
     db.flush()  # Flush to get the ID but don't commit yet (handled by decorator)
+    mark_permissions_changed(db)
     
     logger.info(f"Role '{db_role.name}' created with ID: {db_role.id}")
     return db_role
@@ -269,6 +271,7 @@ def update_role(db: Session, role_id: int, role_in: RoleUpdate) -> Optional[Role
         setattr(db_role, field, value)
     
     db.flush()  # Flush to ensure changes are visible but don't commit yet (handled by decorator)
+    mark_permissions_changed(db)
     
     logger.info(f"Role '{db_role.name}' (ID: {db_role.id}) updated successfully")
     return db_role
@@ -307,6 +310,7 @@ def delete_role(db: Session, role_id: int) -> Optional[Role]:
     # Delete the role
     db.delete(db_role)
     db.flush()  # Flush but don't commit (handled by decorator)
+    mark_permissions_changed(db)
     
     logger.info(f"Role '{role_name}' (ID: {role_id}) deleted successfully")
     return db_role
@@ -367,6 +371,7 @@ def initialize_core_roles(db: Session):
     
     if count > 0:
         db.flush()
+        mark_permissions_changed(db)
         logger.info(f"Created {count} new core roles")
     else:
         logger.info("All core roles already exist")
@@ -6,6 +6,7 @@ from app.schemas.user import UserCreate, UserUpdate, Filter
 import logging
 from app.core.logging import setup_logger
 from app.api.utils.query_builder import QueryBuilder
+from app.core.security_decorators import mark_permissions_changed
 
 # Set up logger
 logger = logging.getLogger(__name__)
@@ -179,6 +180,7 @@ def update_user(
     if user_update.roles is not None:
         roles = db.query(Role).filter(Role.id.in_(user_update.roles)).all()
         db_user.roles = roles
+        mark_permissions_changed(db)
     
     # Commit changes
     db.commit()
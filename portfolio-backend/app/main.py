@@ -134,6 +134,12 @@ async def lifespan(app: FastAPI):
             s.commit()
     except Exception:
         pass
+    # Resume debounced RAG events persisted by a previous process (Redis backend)
+    try:
+        from app.rag.debounce import start_scheduler as _start_debounce
+        _start_debounce()
+    except Exception:
+        pass
     # Log celery readiness
     try:
         if _celery_enabled():
@@ -147,7 +153,21 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down Portfolio API...")
-    
+
+    # Dispatch debounced RAG events still pending in this process
+    try:
+        from app.rag.debounce import shutdown_scheduler as _shutdown_debounce
+        _shutdown_debounce()
+    except Exception:
+        pass
+
+    # Close pooled LLM provider clients
+    try:
+        from app.services.llm.providers import close_providers
+        await close_providers()
+    except Exception:
+        pass
+
     # Close rate limiter
     await rate_limiter.close()
     
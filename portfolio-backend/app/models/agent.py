@@ -44,8 +44,10 @@ class Agent(Base):
     top_k = Column(Integer, nullable=False, default=8)
     score_threshold = Column(Float, nullable=True)
     max_context_tokens = Column(Integer, nullable=False, default=4000)
-    rerank_provider = Column(String(50), nullable=True)  # optional, stubbed
-    rerank_model = Column(String(100), nullable=True)
+    retrieval_mode = Column(String(20), nullable=False, default="vector", server_default="vector")  # vector | hybrid
+    rerank_provider = Column(String(50), nullable=True)  # None | bm25 | cross-encoder (see app.rag.rerank)
+    rerank_model = Column(String(100), nullable=True)  # cross-encoder model name
+    rerank_candidates = Column(Integer, nullable=True)  # candidates retrieved before reranking to top_k
 
     # Generation configuration
     chat_model = Column(String(100), nullable=True)
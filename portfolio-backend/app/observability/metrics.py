@@ -14,6 +14,12 @@ rag_retire_seconds = Histogram('rag_retire_seconds', 'Time spent retiring a reco
 rag_vector_search_seconds = Histogram('rag_vector_search_seconds', 'Vector search latency') if Histogram else None
 rag_hybrid_search_seconds = Histogram('rag_hybrid_search_seconds', 'Hybrid search latency') if Histogram else None
 rag_embedding_list_seconds = Histogram('rag_embedding_list_seconds', 'Embedding list latency') if Histogram else None
+rag_answer_cache_similarity = Histogram('rag_answer_cache_similarity', 'Cosine similarity of the closest cached answer', buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 1.0)) if Histogram else None
+rag_rerank_seconds = Histogram('rag_rerank_seconds', 'Rerank stage latency', ['provider']) if Histogram else None
+rag_context_tokens = Histogram('rag_context_tokens', 'Tokens of retrieved context packed into a chat prompt', buckets=(0, 250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000, 16000)) if Histogram else None
+chat_stage_seconds = Histogram('chat_stage_seconds', 'Chat pipeline stage latency', ['stage', 'agent', 'provider'], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)) if Histogram else None
+chat_stream_first_token_seconds = Histogram('chat_stream_first_token_seconds', 'Public chat stream time to first token, including agent failover', ['failover'], buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 12, 20, 30, 60)) if Histogram else None
+rag_embed_batch_size = Histogram('rag_embed_batch_size', 'Texts per embedding provider call made by the batcher', buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)) if Histogram else None
 
 
 # Counters
@@ -24,5 +30,11 @@ rag_chunks_updated = Counter('rag_chunks_updated_total', 'Chunks updated (checks
 rag_chunks_skipped = Counter('rag_chunks_skipped_total', 'Chunks skipped (no change)') if Counter else None
 rag_chunks_retired = Counter('rag_chunks_retired_total', 'Chunks retired (marked deleted)') if Counter else None
 rag_embeddings_upserted = Counter('rag_embeddings_upserted_total', 'Embeddings upserted') if Counter else None
+rag_embedding_store_hits = Counter('rag_embedding_store_hits_total', 'Chunk embeddings reused from the (model, checksum) store') if Counter else None
+rag_embed_batch_flushes = Counter('rag_embed_batch_flushes_total', 'Embedding batcher flushes by reason', ['reason']) if Counter else None
+rag_embedding_provider_texts = Counter('rag_embedding_provider_texts_total', 'Texts sent to the embedding provider by the indexer') if Counter else None
 
 
+rag_query_embed_cache = Counter('rag_query_embed_cache_total', 'Query embedding lookups by result (memory, redis, miss)', ['result']) if Counter else None
+rag_answer_cache_lookups = Counter('rag_answer_cache_lookups_total', 'Semantic answer cache lookups by result (hit, miss)', ['result']) if Counter else None
+chat_stream_failovers = Counter('chat_stream_failovers_total', 'Public chat streams that moved to the next candidate agent before the first token') if Counter else None
@@ -0,0 +1,74 @@
+"""
+Per-stage timing of a chat request.
+
+A ``StageTimer`` collects the duration of each pipeline stage (setup, cache, embed, search,
+retry_search, fallback, enrich, history, llm_ttft, llm, persist). ``observe()`` exports them
+to the ``chat_stage_seconds{stage,agent,provider}`` histogram, and ``server_timing()`` renders
+them as a ``Server-Timing`` header value that browser devtools show per request.
+
+Stages may run on worker threads, and a stage recorded twice (e.g. two cache lookups)
+accumulates.
+"""
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, Iterator, Optional
+import threading
+
+from app.observability.metrics import chat_stage_seconds
+
+
+class StageTimer:
+    def __init__(self, agent_id: Optional[int] = None, provider: Optional[str] = None):
+        self.agent = str(agent_id) if agent_id is not None else ""
+        self.provider = provider or ""
+        self.started = perf_counter()
+        self._stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._observed = False
+
+    def label(self, *, agent_id: Optional[int] = None, provider: Optional[str] = None) -> None:
+        if agent_id is not None:
+            self.agent = str(agent_id)
+        if provider:
+            self.provider = provider.lower()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + max(0.0, seconds)
+
+    def since_start(self, stage: str) -> None:
+        """Record the time elapsed since the request started (used for setup and TTFT)."""
+        self.record(stage, perf_counter() - self.started)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - t0)
+
+    @property
+    def stages(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._stages)
+
+    def observe(self) -> None:
+        """Export the recorded stages once; later calls are no-ops."""
+        with self._lock:
+            if self._observed:
+                return
+            self._observed = True
+            stages = dict(self._stages)
+        if not chat_stage_seconds:
+            return
+        for stage, seconds in stages.items():
+            try:
+                chat_stage_seconds.labels(stage=stage, agent=self.agent, provider=self.provider).observe(seconds)
+            except Exception:
+                pass
+
+    def server_timing(self) -> str:
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        parts.append(f"total;dur={(perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
@@ -59,17 +59,30 @@ def _register_tasks(app: Celery) -> None:
     def task_index_record(self, ev: Dict[str, Any]) -> None:
         from app.core.database import SessionLocal
         from app.rag.indexer import index_record, _set_status  # type: ignore
+        from app.rag.embedding import embedding_batcher
+        from app.queue.job_lock import run_exclusive
         src_table = ev.get("source_table")
         src_id = ev.get("source_id")
-        with SessionLocal() as db:
-            try:
-                index_record(db, src_table, src_id)
-            except Exception as e:
+
+        def _index() -> None:
+            # Concurrent tasks in a threaded/gevent worker share one embedding batch
+            with SessionLocal() as db, embedding_batcher.producer():
                 try:
-                    _set_status(db, src_table, src_id, error=str(e))
-                except Exception:
-                    pass
-                raise
+                    index_record(db, src_table, src_id)
+                except Exception as e:
+                    try:
+                        _set_status(db, src_table, src_id, error=str(e))
+                    except Exception:
+                        pass
+                    raise
+
+        # Duplicate deliveries for a record already being indexed collapse into one rerun
+        run_exclusive("index", str(src_table), str(src_id), _index)
+
+    @app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={"max_retries": 2}, time_limit=3600, soft_time_limit=3300)
+    def task_reindex_range(self, table: str, lo: Any, hi: Any) -> int:
+        from app.rag.reindex import index_range
+        return index_range(table, lo, hi)
 
     @app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={"max_retries": 5})
     def task_retire_record(self, ev: Dict[str, Any]) -> None:
@@ -0,0 +1,195 @@
+"""
+Lease-based de-duplication of inline RAG jobs across processes.
+
+``run_exclusive(kind, table, id, fn)`` runs ``fn`` unless the same job is already
+running somewhere. A caller that finds the job busy leaves a "rerun" mark instead of
+running concurrently; the lease holder re-runs once before releasing, so the newest
+state is always indexed and no update is lost.
+
+Backends (``RAG_JOB_LOCK_BACKEND`` = auto | redis | postgres | local):
+
+- redis: ``SET key token NX PX ttl`` with an atomic check-rerun-and-release script.
+- postgres: session advisory lock (64-bit ``hashtextextended`` key) on a dedicated
+  connection; the rerun mark is a ``rag_job_rerun`` row.
+- local: in-process only (tests, sqlite).
+
+Leases are always released in ``finally`` so a failed job never leaves its key stuck.
+"""
+import logging
+import os
+import threading
+import uuid
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+_LEASE_MS = int(os.getenv("RAG_JOB_LEASE_MS", "600000"))
+
+# Returns 1 released, 0 rerun requested (lease kept), -1 lease no longer ours
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return -1 end
+if redis.call('DEL', KEYS[2]) == 1 then return 0 end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+_DROP_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+_local_lock = threading.Lock()
+# key -> rerun requested while running
+_local_running: Dict[str, bool] = {}
+
+_redis = None
+_redis_scripts: Dict[str, object] = {}
+
+
+def _backend() -> str:
+    mode = os.getenv("RAG_JOB_LOCK_BACKEND", "auto").lower()
+    if mode in ("auto", "redis") and _redis_client():
+        return "redis"
+    if mode in ("auto", "postgres"):
+        try:
+            from app.core.database import engine
+            if engine.dialect.name == "postgresql":
+                return "postgres"
+        except Exception:
+            pass
+    return "local"
+
+
+def _redis_client():
+    global _redis
+    if _redis is not None:
+        return _redis
+    if not os.getenv("REDIS_URL") and os.getenv("RAG_JOB_LOCK_BACKEND", "auto").lower() != "redis":
+        _redis = False
+        return _redis
+    try:
+        from redis import Redis
+        client = Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True, socket_timeout=5)
+        client.ping()
+        _redis_scripts["release"] = client.register_script(_RELEASE_LUA)
+        _redis_scripts["drop"] = client.register_script(_DROP_LUA)
+        _redis = client
+    except Exception as e:
+        logger.warning(f"job lock redis unavailable, falling back: {e}")
+        _redis = False
+    return _redis
+
+
+def _run_redis(key: str, fn: Callable[[], None]) -> bool:
+    r = _redis_client()
+    lease_key, rerun_key = f"rag:job:{key}", f"rag:job:{key}:rerun"
+    token = uuid.uuid4().hex
+    if not r.set(lease_key, token, nx=True, px=_LEASE_MS):
+        r.set(rerun_key, "1", px=_LEASE_MS)
+        # The holder may have released just before the mark landed; try once more
+        if not r.set(lease_key, token, nx=True, px=_LEASE_MS):
+            return False
+    r.delete(rerun_key)
+    try:
+        while True:
+            fn()
+            if _redis_scripts["release"](keys=[lease_key, rerun_key], args=[token]) != 0:
+                return True
+    except BaseException:
+        try:
+            _redis_scripts["drop"](keys=[lease_key], args=[token])
+        except Exception:
+            pass
+        raise
+
+
+def _pg_try_lock(conn, params) -> bool:
+    got = bool(conn.execute(text("SELECT pg_try_advisory_lock(hashtextextended(:k, 0))"), params).scalar())
+    conn.commit()
+    return got
+
+
+def _pg_unlock(conn, params) -> None:
+    conn.execute(text("SELECT pg_advisory_unlock(hashtextextended(:k, 0))"), params)
+    conn.commit()
+
+
+def _run_postgres(key: str, fn: Callable[[], None]) -> bool:
+    from app.core.database import engine
+    params = {"k": f"rag_job:{key}"}
+    with engine.connect() as conn:
+        if not _pg_try_lock(conn, params):
+            # Leave a rerun mark; if it cannot be recorded the error propagates rather than
+            # dropping the event. The holder may have released just before the mark landed.
+            conn.execute(text("INSERT INTO rag_job_rerun (job_key) VALUES (:k) ON CONFLICT DO NOTHING"), params)
+            conn.commit()
+            if not _pg_try_lock(conn, params):
+                return False
+        locked = True
+        try:
+            while True:
+                conn.execute(text("DELETE FROM rag_job_rerun WHERE job_key = :k"), params)
+                conn.commit()
+                fn()
+                _pg_unlock(conn, params)
+                locked = False
+                # A mark left while fn ran (checked after unlocking, so a late one is never
+                # missed) means the newest state may not be indexed yet
+                pending = conn.execute(text("SELECT 1 FROM rag_job_rerun WHERE job_key = :k"), params).first()
+                conn.commit()
+                if not pending or not _pg_try_lock(conn, params):
+                    # Nothing pending, or another worker took the lease and runs it
+                    return True
+                locked = True
+        finally:
+            if locked:
+                try:
+                    _pg_unlock(conn, params)
+                except Exception:
+                    # Closing the connection drops session locks anyway
+                    conn.invalidate()
+
+
+def _run_local(key: str, fn: Callable[[], None]) -> bool:
+    with _local_lock:
+        if key in _local_running:
+            _local_running[key] = True
+            return False
+        _local_running[key] = False
+    try:
+        while True:
+            fn()
+            with _local_lock:
+                if not _local_running.get(key):
+                    _local_running.pop(key, None)
+                    return True
+                _local_running[key] = False
+    except BaseException:
+        with _local_lock:
+            _local_running.pop(key, None)
+        raise
+
+
+def run_exclusive(kind: str, source_table: str, source_id: str, fn: Callable[[], None], backend: Optional[str] = None) -> bool:
+    """Run ``fn`` under a per-job lease; returns False when deduplicated against a running job."""
+    key = f"{kind}:{source_table}:{source_id}"
+    backend = backend or _backend()
+    if backend == "redis":
+        try:
+            return _run_redis(key, fn)
+        except Exception as e:
+            if not _is_redis_error(e):
+                raise
+            logger.warning(f"job lock redis error, running with local lock: {e}")
+    elif backend == "postgres":
+        return _run_postgres(key, fn)
+    return _run_local(key, fn)
+
+
+def _is_redis_error(e: BaseException) -> bool:
+    try:
+        from redis.exceptions import RedisError
+        return isinstance(e, RedisError)
+    except Exception:
+        return False
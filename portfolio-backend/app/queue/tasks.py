@@ -1,19 +1,15 @@
-from typing import Dict, Any, Tuple
+from typing import Dict, Any
 from app.core.database import SessionLocal
 from app.rag.indexer import index_record, retire_record
+from app.rag.embedding import embedding_batcher
 from app.queue.celery_app import is_enabled as celery_enabled
+from app.queue.job_lock import run_exclusive
 from time import perf_counter
 import time
 import os
-try:
-    from prometheus_client import Counter, Histogram
-except Exception:  # optional dependency
-    Counter = Histogram = None  # type: ignore
-from app.observability.metrics import rag_index_jobs, rag_retire_jobs
+from app.observability.metrics import rag_index_jobs, rag_retire_jobs, rag_index_seconds, rag_retire_seconds
 from sqlalchemy import text
 
-_in_flight: set[Tuple[str, str, str]] = set()
-
 
 def _dead_letter(job_type: str, ev: Dict[str, Any], error: str, retries: int = 0) -> None:
     try:
@@ -54,6 +50,22 @@ def _enqueue_celery(ev: Dict[str, Any], task_name: str) -> bool:
         return False
 
 
+def _run_with_retries(job_type: str, ev: Dict[str, Any], job) -> None:
+    max_retries = int(os.getenv("RAG_INLINE_MAX_RETRIES", "2"))
+    backoff = float(os.getenv("RAG_INLINE_BACKOFF_SECONDS", "0.2"))
+    attempt = 0
+    while True:
+        try:
+            job()
+            return
+        except Exception as e:
+            if attempt >= max_retries:
+                _dead_letter(job_type, ev, str(e), retries=attempt)
+                raise
+            attempt += 1
+            time.sleep(backoff * attempt)
+
+
 def enqueue_index_job(ev: Dict[str, Any]) -> None:
     # Try celery; fallback to inline
     if _enqueue_celery(ev, "index"):
@@ -61,34 +73,20 @@ def enqueue_index_job(ev: Dict[str, Any]) -> None:
     start = perf_counter()
     source_table = ev.get('source_table')
     source_id = ev.get('source_id')
-    key = ("index", str(source_table), str(source_id))
-    if key in _in_flight:
+
+    def _index() -> None:
+        # Debounced jobs firing together share one embedding batch
+        with SessionLocal() as db, embedding_batcher.producer():
+            index_record(db, source_table, source_id)
+
+    # A duplicate of a running job only marks it for one rerun (see app.queue.job_lock)
+    if not run_exclusive("index", str(source_table), str(source_id), lambda: _run_with_retries('index', ev, _index)):
         return
-    _in_flight.add(key)
-    try:
-        max_retries = int(os.getenv("RAG_INLINE_MAX_RETRIES", "2"))
-        backoff = float(os.getenv("RAG_INLINE_BACKOFF_SECONDS", "0.2"))
-        attempt = 0
-        while True:
-            try:
-                with SessionLocal() as db:
-                    index_record(db, source_table, source_id)
-                break
-            except Exception as e:
-                if attempt >= max_retries:
-                    _dead_letter('index', ev, str(e), retries=attempt)
-                    raise
-                attempt += 1
-                time.sleep(backoff * attempt)
-    except Exception as e:
-        raise
     dur = perf_counter() - start
-    if Histogram:
-        _h = Histogram('rag_index_seconds', 'Time spent indexing a record')
-        _h.observe(dur)
+    if rag_index_seconds:
+        rag_index_seconds.observe(dur)
     if rag_index_jobs:
         rag_index_jobs.inc()
-    _in_flight.discard(key)
 
 
 def enqueue_delete_job(ev: Dict[str, Any]) -> None:
@@ -97,33 +95,15 @@ def enqueue_delete_job(ev: Dict[str, Any]) -> None:
     start = perf_counter()
     source_table = ev.get('source_table')
     source_id = ev.get('source_id')
-    key = ("retire", str(source_table), str(source_id))
-    if key in _in_flight:
+
+    def _retire() -> None:
+        with SessionLocal() as db:
+            retire_record(db, source_table, source_id)
+
+    if not run_exclusive("retire", str(source_table), str(source_id), lambda: _run_with_retries('retire', ev, _retire)):
         return
-    _in_flight.add(key)
-    try:
-        max_retries = int(os.getenv("RAG_INLINE_MAX_RETRIES", "2"))
-        backoff = float(os.getenv("RAG_INLINE_BACKOFF_SECONDS", "0.2"))
-        attempt = 0
-        while True:
-            try:
-                with SessionLocal() as db:
-                    retire_record(db, source_table, source_id)
-                break
-            except Exception as e:
-                if attempt >= max_retries:
-                    _dead_letter('retire', ev, str(e), retries=attempt)
-                    raise
-                attempt += 1
-                time.sleep(backoff * attempt)
-    except Exception:
-        raise
     dur = perf_counter() - start
-    if Histogram:
-        _h = Histogram('rag_retire_seconds', 'Time spent retiring a record')
-        _h.observe(dur)
+    if rag_retire_seconds:
+        rag_retire_seconds.observe(dur)
     if rag_retire_jobs:
         rag_retire_jobs.inc()
-    _in_flight.discard(key)
-
-
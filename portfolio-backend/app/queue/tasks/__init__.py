@@ -13,6 +13,7 @@ _spec.loader.exec_module(_legacy)
 
 enqueue_index_job = _legacy.enqueue_index_job
 enqueue_delete_job = _legacy.enqueue_delete_job
+_dead_letter = _legacy._dead_letter
 
 # Career tasks: only import when Celery broker is configured to avoid startup errors.
 from app.queue.celery_app import is_enabled as _celery_is_enabled
@@ -33,7 +33,7 @@ from app.models.portfolio import Portfolio, PortfolioAttachment, portfolio_exper
 from app.models.project import Project, ProjectText, project_skills
 from app.models.skill import SkillText
 from app.services.career_service import build_ai_context
-from app.services.llm.providers import AnthropicProvider, ProviderConfig, RateLimitError, build_provider
+from app.services.llm.providers import AnthropicProvider, ProviderConfig, RateLimitError, get_provider
 from celery import shared_task
 
 logger = logging.getLogger(__name__)
@@ -316,10 +316,11 @@ def _build_career_provider(db=None):
             model_override = _get_system_setting(db, "career.model")
             if cred_id:
                 config = CredentialService.resolve_provider_config(db, int(cred_id), model_override)
-                return build_provider(
+                return get_provider(
                     config["provider"],
                     api_key=config["api_key"],
                     base_url=config["base_url"],
+                    credential_id=int(cred_id),
                 )
         except Exception as e:
             logger.warning("Could not resolve career provider from DB credential: %s", e)
@@ -333,17 +334,18 @@ def _build_career_provider(db=None):
             cred_id = _get_system_setting(db, "anthropic.credential_id")
             if cred_id:
                 config = CredentialService.resolve_provider_config(db, int(cred_id))
-                return build_provider(
+                return get_provider(
                     config["provider"],
                     api_key=config["api_key"],
                     base_url=config["base_url"],
+                    credential_id=int(cred_id),
                 )
         except Exception as e:
             logger.warning("Could not resolve Anthropic fallback from DB credential: %s", e)
     if not api_key:
         api_key = settings.ANTHROPIC_API_KEY
     provider_name = settings.CAREER_AI_PROVIDER or "anthropic"
-    return build_provider(
+    return get_provider(
         provider_name,
         api_key=api_key,
         base_url=settings.CAREER_AI_BASE_URL or None,
@@ -398,10 +400,11 @@ def _build_career_fallback_provider(db=None):
             model_override = _get_system_setting(db, "career.fallback_model")
             if cred_id:
                 config = CredentialService.resolve_provider_config(db, int(cred_id), model_override)
-                provider = build_provider(
+                provider = get_provider(
                     config["provider"],
                     api_key=config["api_key"],
                     base_url=config["base_url"],
+                    credential_id=int(cred_id),
                 )
                 model = config["model"] or HAIKU_MODEL
                 return provider, model
@@ -417,10 +420,11 @@ def _build_career_fallback_provider(db=None):
                 cred_id = _get_system_setting(db, "anthropic.credential_id")
                 if cred_id:
                     config = CredentialService.resolve_provider_config(db, int(cred_id))
-                    provider = build_provider(
+                    provider = get_provider(
                         config["provider"],
                         api_key=config["api_key"],
                         base_url=config["base_url"],
+                        credential_id=int(cred_id),
                     )
                     return provider, config["model"] or HAIKU_MODEL
             except Exception as e:
@@ -428,9 +432,9 @@ def _build_career_fallback_provider(db=None):
         api_key = settings.ANTHROPIC_API_KEY
         if not api_key:
             return None, None
-        return build_provider("anthropic", api_key=api_key, base_url=None), HAIKU_MODEL
+        return get_provider("anthropic", api_key=api_key, base_url=None), HAIKU_MODEL
     api_key = settings.CAREER_AI_FALLBACK_API_KEY or settings.ANTHROPIC_API_KEY
-    provider = build_provider(
+    provider = get_provider(
         settings.CAREER_AI_FALLBACK_PROVIDER,
         api_key=api_key,
         base_url=settings.CAREER_AI_FALLBACK_BASE_URL or None,
@@ -0,0 +1,221 @@
+"""
+Semantic answer cache.
+
+Answered queries are stored with their embedding per (agent, portfolio, language). A new
+query reuses a stored answer when its cosine similarity to a stored query reaches
+``RAG_SEMANTIC_CACHE_THRESHOLD`` (default 0.92), so paraphrases such as "what projects do
+you have" / "which projects have you done?" skip retrieval and the LLM call.
+
+Entries expire after ``RAG_SEMANTIC_CACHE_TTL`` seconds and are dropped whenever the
+indexer changes a source that belongs to the portfolio (via ``rag_source_portfolio``)
+or the agent is edited. Unscoped entries (no portfolio) are dropped on any content change.
+Rows are also stamped with the agent/portfolio cache generation read before the lookup,
+and only rows of the current generation are served: an answer whose LLM call overlapped
+an invalidation is stored under the superseded generation and never returned.
+Each store keeps its scope at ``RAG_SEMANTIC_CACHE_MAX_PER_SCOPE`` live entries (newest
+first) and, at most every ``RAG_SEMANTIC_CACHE_PURGE_SECONDS`` per process, deletes every
+expired row, so the exact per-scope scan stays small.
+
+Writes run in a savepoint of the caller's session and are published by the caller's
+commit; nothing here commits.
+"""
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.observability.metrics import rag_answer_cache_lookups, rag_answer_cache_similarity
+
+logger = logging.getLogger(__name__)
+
+_MAX_PER_SCOPE = int(os.getenv("RAG_SEMANTIC_CACHE_MAX_PER_SCOPE", "200"))
+_PURGE_INTERVAL = float(os.getenv("RAG_SEMANTIC_CACHE_PURGE_SECONDS", "600"))
+_purge_lock = threading.Lock()
+_next_purge = 0.0
+
+
+def _enabled() -> bool:
+    return os.getenv("RAG_SEMANTIC_CACHE", "true").lower() == "true"
+
+
+def _threshold() -> float:
+    return float(os.getenv("RAG_SEMANTIC_CACHE_THRESHOLD", "0.92"))
+
+
+def _vec_param(qvec: List[float]) -> str:
+    return "[" + ", ".join(str(x) for x in qvec) + "]"
+
+
+def _count(result: str) -> None:
+    try:
+        if rag_answer_cache_lookups:
+            rag_answer_cache_lookups.labels(result=result).inc()
+    except Exception:
+        pass
+
+
+def _run_in_savepoint(db: Session, fn, what: str):
+    # Cache table may be missing (unit tests / pre-migration DBs); never break the caller's transaction
+    savepoint = None
+    try:
+        savepoint = db.begin_nested()
+        out = fn()
+        savepoint.commit()
+        return out
+    except Exception as e:
+        if savepoint is not None:
+            try:
+                savepoint.rollback()
+            except Exception:
+                pass
+        logger.debug(f"answer cache {what} skipped: {e}")
+        return None
+
+
+def lookup_answer(
+    db: Session,
+    *,
+    agent_id: int,
+    portfolio_id: Optional[int],
+    language_id: Optional[int],
+    model: str,
+    qvec: List[float],
+    generation: str = "",
+) -> Optional[Dict[str, Any]]:
+    """Return ``{"answer", "citations", "similarity"}`` of the closest cached query, if close enough."""
+    if not _enabled() or not qvec:
+        return None
+    params = {
+        "a": agent_id, "p": portfolio_id, "l": language_id, "m": model,
+        "d": len(qvec), "q": _vec_param(qvec), "g": generation,
+    }
+
+    def _query():
+        return db.execute(text(
+            """
+            SELECT answer, citations, 1 - (embedding_vec <=> CAST(:q AS vector)) AS similarity
+            FROM rag_answer_cache
+            WHERE agent_id = :a
+              AND portfolio_id IS NOT DISTINCT FROM :p
+              AND language_id IS NOT DISTINCT FROM :l
+              AND model = :m AND dim = :d
+              AND generation = :g
+              AND expires_at > NOW()
+            ORDER BY embedding_vec <=> CAST(:q AS vector)
+            LIMIT 1
+            """
+        ), params).mappings().first()
+
+    row = _run_in_savepoint(db, _query, "lookup")
+    similarity = float(row["similarity"]) if row else None
+    if similarity is not None:
+        try:
+            if rag_answer_cache_similarity:
+                rag_answer_cache_similarity.observe(similarity)
+        except Exception:
+            pass
+    if similarity is None or similarity < _threshold():
+        _count("miss")
+        return None
+    _count("hit")
+    citations = row["citations"]
+    if isinstance(citations, str):
+        citations = json.loads(citations)
+    return {"answer": row["answer"], "citations": citations or [], "similarity": similarity}
+
+
+def _purge_due() -> bool:
+    global _next_purge
+    now = time.monotonic()
+    with _purge_lock:
+        if now < _next_purge:
+            return False
+        _next_purge = now + _PURGE_INTERVAL
+        return True
+
+
+def store_answer(
+    db: Session,
+    *,
+    agent_id: int,
+    portfolio_id: Optional[int],
+    language_id: Optional[int],
+    model: str,
+    qvec: List[float],
+    query: str,
+    answer: str,
+    citations: List[Dict[str, Any]],
+    generation: str = "",
+    ttl_seconds: Optional[int] = None,
+) -> None:
+    """Best-effort insert of an answered query; visible to other workers once the caller commits."""
+    if not _enabled() or not qvec or not answer:
+        return
+    ttl = int(ttl_seconds if ttl_seconds is not None else os.getenv("RAG_SEMANTIC_CACHE_TTL", "86400"))
+    params = {
+        "a": agent_id, "p": portfolio_id, "l": language_id, "m": model, "d": len(qvec),
+        "q": _vec_param(qvec), "query": query, "answer": answer,
+        "c": json.dumps(citations or [], default=str), "g": generation, "ttl": ttl, "cap": _MAX_PER_SCOPE,
+    }
+    purge_all = _purge_due()
+
+    def _insert():
+        db.execute(text(
+            """
+            INSERT INTO rag_answer_cache
+                (agent_id, portfolio_id, language_id, model, dim, embedding_vec, query, answer, citations,
+                 generation, expires_at)
+            VALUES
+                (:a, :p, :l, :m, :d, CAST(:q AS vector), :query, :answer, CAST(:c AS JSONB),
+                 :g, NOW() + make_interval(secs => :ttl))
+            """
+        ), params)
+        # Keep the scope to its newest live entries
+        db.execute(text(
+            """
+            DELETE FROM rag_answer_cache
+            WHERE agent_id = :a
+              AND portfolio_id IS NOT DISTINCT FROM :p
+              AND language_id IS NOT DISTINCT FROM :l
+              AND model = :m AND dim = :d
+              AND (expires_at <= NOW() OR id NOT IN (
+                SELECT id FROM rag_answer_cache
+                WHERE agent_id = :a
+                  AND portfolio_id IS NOT DISTINCT FROM :p
+                  AND language_id IS NOT DISTINCT FROM :l
+                  AND model = :m AND dim = :d
+                ORDER BY created_at DESC, id DESC
+                LIMIT :cap
+              ))
+            """
+        ), params)
+        if purge_all:
+            db.execute(text("DELETE FROM rag_answer_cache WHERE expires_at <= NOW()"))
+        return True
+
+    _run_in_savepoint(db, _insert, "store")
+
+
+def invalidate_portfolios(db: Session, portfolio_ids: List[int]) -> None:
+    """Drop cached answers of ``portfolio_ids`` plus unscoped ones (they span all content)."""
+    def _delete():
+        db.execute(text(
+            "DELETE FROM rag_answer_cache WHERE portfolio_id IS NULL OR portfolio_id = ANY(:pids)"
+        ), {"pids": [int(p) for p in portfolio_ids]})
+        return True
+
+    _run_in_savepoint(db, _delete, "invalidation")
+
+
+def invalidate_agent(db: Session, agent_id: int) -> None:
+    """Drop every cached answer of an agent (prompt/model changes)."""
+    def _delete():
+        db.execute(text("DELETE FROM rag_answer_cache WHERE agent_id = :a"), {"a": agent_id})
+        return True
+
+    _run_in_savepoint(db, _delete, "invalidation")
@@ -1,4 +1,5 @@
 import os
+from typing import Iterable, Iterator
 
 
 def chunk_text(text: str, target_chars: int | None = None, overlap_chars: int | None = None):
@@ -20,3 +21,29 @@ def chunk_text(text: str, target_chars: int | None = None, overlap_chars: int |
     return chunks
 
 
+
+
+def chunk_stream(segments: Iterable[str], target_chars: int | None = None, overlap_chars: int | None = None, joiner: str = " ") -> Iterator[str]:
+    """Incremental chunk_text over text arriving in segments (e.g. PDF pages).
+
+    Yields the same chunks as ``chunk_text(joiner.join(s for s in segments if s))`` (empty
+    segments are skipped, so they add no joiner) while only buffering about one chunk of text.
+    """
+    if target_chars is None:
+        target_chars = int(os.getenv("CHUNK_CHARS", "4000"))
+    if overlap_chars is None:
+        overlap_chars = int(os.getenv("CHUNK_OVERLAP", "500"))
+    step = max(1, target_chars - overlap_chars)
+    buf = ""
+    first = True
+    for seg in segments:
+        if not seg:
+            continue
+        buf = seg if first else buf + joiner + seg
+        first = False
+        # Emit only once more text is known to follow, matching chunk_text's final chunk
+        while len(buf) > target_chars:
+            yield buf[:target_chars]
+            buf = buf[step:]
+    if buf:
+        yield buf
@@ -1,10 +1,43 @@
+"""
+Debounce RAG index/delete events per (source_table, source_id).
+
+A single scheduler thread owns a heap of due times; repeated events for the same
+record are merged and pushed back by the debounce window. Due events are handed to a
+small dispatch pool so slow index jobs do not delay the scheduler.
+
+With ``RAG_DEBOUNCE_BACKEND=redis`` pending events live in Redis (a sorted set of due
+times plus a hash of merged events), so they survive restarts and are shared by all
+uvicorn workers; each due entry is claimed atomically by exactly one worker. The event
+carries the name of its dispatcher (see ``_known_dispatchers``); events with any other
+dispatcher cannot be run by another process and stay on the in-process heap.
+"""
+import heapq
+import itertools
+import json
+import logging
 import os
 import threading
-from typing import Dict, Any, Tuple
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
+DispatchFn = Callable[[Dict[str, Any]], None]
 
-_timers: Dict[Tuple[str, str], threading.Timer] = {}
-_lock = threading.Lock()
+_REDIS_DUE_KEY = "rag:debounce:due"
+_REDIS_EV_KEY = "rag:debounce:ev"
+_REDIS_CLAIM_PAGE = 100
+
+# Atomically take a due entry: only the worker whose ZREM succeeds gets the event
+_CLAIM_LUA = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 1 then
+  local ev = redis.call('HGET', KEYS[2], ARGV[1])
+  redis.call('HDEL', KEYS[2], ARGV[1])
+  return ev
+end
+return false
+"""
 
 
 def _merge_events(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
@@ -23,35 +56,272 @@ def _merge_events(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
     return merged
 
 
-def schedule_event(ev: Dict[str, Any], dispatch_fn) -> None:
+def _default_dispatch(ev: Dict[str, Any]) -> None:
+    from app.queue.tasks import enqueue_index_job, enqueue_delete_job
+    if ev.get("op") == "delete":
+        enqueue_delete_job(ev)
+    else:
+        enqueue_index_job(ev)
+
+
+def _key_of(ev: Dict[str, Any]) -> str:
+    return f"{ev.get('source_table')}:{ev.get('source_id')}"
+
+
+def _known_dispatchers() -> Dict[str, DispatchFn]:
+    """Dispatchers every process can look up by the name stored with a Redis-held event."""
+    known: Dict[str, DispatchFn] = {"default": _default_dispatch}
+    try:
+        from app.queue.tasks import enqueue_index_job, enqueue_delete_job
+        known.update({"index": enqueue_index_job, "delete": enqueue_delete_job})
+    except Exception:
+        pass
+    return known
+
+
+def _dispatch_ref(fn: Optional[DispatchFn]) -> Optional[str]:
+    fn = fn or _default_dispatch
+    return next((name for name, known in _known_dispatchers().items() if known is fn), None)
+
+
+def _dead_letter_undispatched(ev: Dict[str, Any]) -> None:
+    # Replayed by POST /api/rag/dead_letters/retry
+    from app.queue.tasks import _dead_letter
+    _dead_letter("retire" if ev.get("op") == "delete" else "index", ev, "not dispatched before shutdown")
+
+
+class DebounceScheduler:
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[float, int, str]] = []
+        # key -> (merged event, dispatch fn, heap sequence of the live entry)
+        self._pending: Dict[str, Tuple[Dict[str, Any], DispatchFn, int]] = {}
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._redis = None
+        self._claim = None
+        self._poll = float(os.getenv("RAG_DEBOUNCE_POLL_SECONDS", "0.5"))
+
+    # -- backends -----------------------------------------------------------------
+    def _redis_client(self):
+        if self._redis is not None:
+            return self._redis
+        if os.getenv("RAG_DEBOUNCE_BACKEND", "memory").lower() != "redis":
+            return None
+        try:
+            from redis import Redis
+            client = Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True, socket_timeout=5)
+            client.ping()
+            self._claim = client.register_script(_CLAIM_LUA)
+            self._redis = client
+        except Exception as e:
+            logger.warning(f"debounce redis backend unavailable, using in-process heap: {e}")
+            self._redis = False
+        return self._redis
+
+    def _schedule_redis(self, client, key: str, ev: Dict[str, Any], due: float) -> None:
+        from redis import WatchError
+        with client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(_REDIS_EV_KEY)
+                    raw = pipe.hget(_REDIS_EV_KEY, key)
+                    merged = _merge_events(json.loads(raw), ev) if raw else ev
+                    pipe.multi()
+                    pipe.hset(_REDIS_EV_KEY, key, json.dumps(merged, default=str))
+                    pipe.zadd(_REDIS_DUE_KEY, {key: due})
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def _claim_due_redis(self, client, now: float) -> List[Tuple[Dict[str, Any], DispatchFn]]:
+        out: List[Tuple[Dict[str, Any], DispatchFn]] = []
+        for key in client.zrangebyscore(_REDIS_DUE_KEY, "-inf", now, start=0, num=_REDIS_CLAIM_PAGE):
+            raw = self._claim(keys=[_REDIS_DUE_KEY, _REDIS_EV_KEY], args=[key])
+            if not raw:
+                continue
+            try:
+                ev = json.loads(raw)
+            except Exception:
+                continue
+            ref = ev.pop("_dispatch", None) or "default"
+            fn = _known_dispatchers().get(ref)
+            if fn is None:
+                logger.warning(f"debounce dispatcher {ref!r} unknown, using default")
+                fn = _default_dispatch
+            out.append((ev, fn))
+        return out
+
+    # -- public API -----------------------------------------------------------------
+    def schedule(self, ev: Dict[str, Any], dispatch_fn: Optional[DispatchFn], window: float) -> None:
+        key = _key_of(ev)
+        due = time.time() + window
+        client = self._redis_client()
+        ref = _dispatch_ref(dispatch_fn) if client else None
+        if client and ref:
+            try:
+                self._schedule_redis(client, key, {**ev, "_dispatch": ref}, due)
+                self._ensure_thread()
+                return
+            except Exception as e:
+                logger.warning(f"debounce redis schedule failed, using in-process heap: {e}")
+        elif client:
+            logger.debug(f"debounce dispatcher for {key} is not shareable; keeping it in this process")
+        with self._cond:
+            prev = self._pending.get(key)
+            fn = dispatch_fn or _default_dispatch
+            if prev:
+                merged = _merge_events(prev[0], ev)
+                # Keep the dispatcher that matches the surviving operation
+                if merged is prev[0]:
+                    fn = prev[1]
+                ev = merged
+            seq = next(self._seq)
+            self._pending[key] = (ev, fn, seq)
+            heapq.heappush(self._heap, (due, seq, key))
+            self._cond.notify()
+        self._ensure_thread()
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Hand off every locally pending event (used on shutdown), blocking at most ``timeout`` seconds.
+
+        With the Redis backend the events are persisted there, due now, for another worker or
+        the next start. Otherwise they are dispatched on the pool; those that have not started
+        when the time is up are recorded in ``rag_dead_letter`` instead.
+        """
+        if timeout is None:
+            timeout = float(os.getenv("RAG_DEBOUNCE_FLUSH_SECONDS", "10"))
+        with self._cond:
+            items = list(self._pending.values())
+            self._pending.clear()
+            self._heap.clear()
+        if not items:
+            return
+        client = self._redis_client()
+        futures: Dict[Future, Dict[str, Any]] = {}
+        for ev, fn, _ in items:
+            ref = _dispatch_ref(fn) if client else None
+            if client and ref:
+                try:
+                    self._schedule_redis(client, _key_of(ev), {**ev, "_dispatch": ref}, time.time())
+                    continue
+                except Exception as e:
+                    logger.warning(f"debounce redis handoff failed for {_key_of(ev)}: {e}")
+            futures[self._dispatch(fn, ev)] = ev
+        if not futures:
+            return
+        _, not_done = wait(futures, timeout=timeout)
+        for fut in not_done:
+            # Jobs already running finish in the background; queued ones are parked
+            if fut.cancel():
+                try:
+                    _dead_letter_undispatched(futures[fut])
+                except Exception:
+                    logger.exception(f"debounce could not park {_key_of(futures[fut])}")
+        if not_done:
+            logger.warning(f"debounce flush timed out after {timeout}s with {len(not_done)} events unfinished")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush(timeout)
+        pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # -- internals --------------------------------------------------------------------
+    def _ensure_thread(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="rag-debounce", daemon=True)
+            self._thread.start()
+
+    def _dispatch(self, fn: DispatchFn, ev: Dict[str, Any]) -> Future:
+        def _call() -> None:
+            try:
+                fn(ev)
+            except Exception:
+                logger.exception(f"debounced dispatch failed for {_key_of(ev)}")
+
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=int(os.getenv("RAG_DEBOUNCE_DISPATCH_WORKERS", "4")),
+                thread_name_prefix="rag-debounce-dispatch",
+            )
+        return self._pool.submit(_call)
+
+    def _pop_due_local(self, now: float) -> List[Tuple[Dict[str, Any], DispatchFn]]:
+        due: List[Tuple[Dict[str, Any], DispatchFn]] = []
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, key = heapq.heappop(self._heap)
+            entry = self._pending.get(key)
+            # Skip heap entries superseded by a later reschedule
+            if entry and entry[2] == seq:
+                del self._pending[key]
+                due.append((entry[0], entry[1]))
+        return due
+
+    def _run(self) -> None:
+        backlog = False
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                now = time.time()
+                ready = self._pop_due_local(now)
+                if not ready and not backlog:
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    if self._redis:
+                        timeout = self._poll if timeout is None else min(timeout, self._poll)
+                    self._cond.wait(timeout=timeout)
+            for ev, fn in ready:
+                self._dispatch(fn, ev)
+            backlog = False
+            if self._redis:
+                try:
+                    claimed = self._claim_due_redis(self._redis, time.time())
+                    for ev, fn in claimed:
+                        self._dispatch(fn, ev)
+                    # A full page means more entries are already due; poll again without waiting
+                    backlog = len(claimed) >= _REDIS_CLAIM_PAGE
+                except Exception as e:
+                    logger.debug(f"debounce redis poll failed: {e}")
+
+
+scheduler = DebounceScheduler()
+
+
+def schedule_event(ev: Dict[str, Any], dispatch_fn: Optional[DispatchFn] = None) -> None:
     """
     Debounce enqueueing index/delete jobs within a small window.
     If RAG_DEBOUNCE_SECONDS is 0 or missing, dispatch immediately.
     """
     window = float(os.getenv("RAG_DEBOUNCE_SECONDS", "0"))
     if window <= 0:
-        dispatch_fn(ev)
+        (dispatch_fn or _default_dispatch)(ev)
         return
-    key = (ev.get("source_table"), ev.get("source_id"))
+    scheduler.schedule(ev, dispatch_fn, window)
 
-    def _fire():
-        with _lock:
-            _timers.pop(key, None)
-        dispatch_fn(ev)
 
-    with _lock:
-        t = _timers.get(key)
-        if t:
-            # Merge event and reset timer
-            try:
-                # type: ignore[attr-defined]
-                t.ev = _merge_events(getattr(t, "ev"), ev)  # attach state to timer
-            except Exception:
-                pass
-            t.cancel()
-        new_timer = threading.Timer(window, _fire)
-        setattr(new_timer, "ev", ev)
-        _timers[key] = new_timer
-        new_timer.start()
+def start_scheduler() -> None:
+    """Start polling at startup so events persisted in Redis by a previous process are picked up."""
+    if scheduler._redis_client():
+        scheduler._ensure_thread()
 
 
+def shutdown_scheduler() -> None:
+    """Stop the scheduler and hand off locally pending events (bounded by RAG_DEBOUNCE_FLUSH_SECONDS)."""
+    try:
+        scheduler.stop()
+    except Exception as e:
+        logger.warning(f"debounce shutdown failed: {e}")
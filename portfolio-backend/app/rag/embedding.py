@@ -1,6 +1,31 @@
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
 import os
 import math
+import threading
+import time
+
+from app.observability.metrics import rag_embed_batch_size, rag_embed_batch_flushes
+
+
+# Output dimensions of known embedding models, keyed by provider
+_KNOWN_DIMS: Dict[str, Dict[str, int]] = {
+    "openai": {
+        "text-embedding-3-small": 1536,
+        "text-embedding-3-large": 3072,
+        "text-embedding-ada-002": 1536,
+    },
+}
+_STUB_DIM = 8
+
+# Process-wide (provider, model) -> dim registry; see get_embedding_dim()
+_dims: Dict[Tuple[str, str], int] = {}
+_dims_lock = threading.Lock()
+# Failed resolutions are not retried before this many seconds (provider down or misconfigured)
+_DIM_RETRY_SECONDS = float(os.getenv("RAG_EMBED_DIM_RETRY_SECONDS", "60"))
+_dim_misses: Dict[Tuple[str, str], float] = {}
+# One resolution per (provider, model) at a time; other keys are not held up by a slow probe
+_dim_key_locks: Dict[Tuple[str, str], threading.Lock] = {}
 
 
 def _l2_normalize(vec: List[float]) -> List[float]:
@@ -8,33 +33,271 @@ def _l2_normalize(vec: List[float]) -> List[float]:
     return [x / norm for x in vec]
 
 
+class StubVector(list):
+    """Deterministic placeholder vector (no provider configured, or the provider failed)."""
+
+
+def is_stub_vector(vec: List[float]) -> bool:
+    """True for placeholder vectors, which must never be reused as the model's embedding."""
+    return isinstance(vec, StubVector)
+
+
 def _stub_vectors(texts: List[str]) -> List[List[float]]:
     vectors: List[List[float]] = []
     for t in texts:
         h = sum(ord(c) for c in (t[:256] or ''))
-        vec = [((h + i * 17) % 101) / 100.0 for i in range(8)]
-        vectors.append(_l2_normalize(vec))
+        vec = [((h + i * 17) % 101) / 100.0 for i in range(_STUB_DIM)]
+        vectors.append(StubVector(_l2_normalize(vec)))
     return vectors
 
 
-def embed_text_batch(texts: List[str]) -> List[List[float]]:
+def _resolve_provider() -> str:
     provider = os.getenv('EMBED_PROVIDER', '').lower()
     # Heuristic: if an OpenAI key exists but provider not set, assume openai
     if not provider and os.getenv('OPENAI_API_KEY'):
         provider = 'openai'
-    if not provider:
-        return _stub_vectors(texts)
+    return provider if provider == 'openai' else 'stub'
+
+
+def _current_model() -> str:
+    return os.getenv('EMBED_MODEL', 'text-embedding-3-small')
+
+
+def record_embedding_dim(model: str, dim: int, provider: Optional[str] = None) -> None:
+    """Remember the dimension observed for a model (called after successful provider calls)."""
+    if dim:
+        with _dims_lock:
+            _dims[(provider or _resolve_provider(), model)] = int(dim)
+
+
+def reset_embedding_dims() -> None:
+    with _dims_lock:
+        _dims.clear()
+        _dim_misses.clear()
+
+
+def get_embedding_dim(db=None, model: Optional[str] = None) -> int:
+    """Vector dimension for the active provider/model, resolved at most once per process.
+
+    Resolution order: registry, known model metadata, ``rag_embedding.dim`` already stored
+    for the model, then a single probe call. The registry is keyed by (provider, model), so
+    switching ``EMBED_MODEL`` or the provider resolves afresh. Returns 0 when unknown; a failed
+    resolution is remembered for ``RAG_EMBED_DIM_RETRY_SECONDS``.
+    """
+    provider = _resolve_provider()
+    model = model or _current_model()
+    key = (provider, model)
+    dim = _dims.get(key)
+    if dim:
+        return dim
+    if _dim_misses.get(key, 0.0) > time.monotonic():
+        return 0
+    with _dims_lock:
+        key_lock = _dim_key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        dim = _dims.get(key)
+        if dim:
+            return dim
+        if _dim_misses.get(key, 0.0) > time.monotonic():
+            return 0
+        if provider == 'stub':
+            dim = _STUB_DIM
+        else:
+            dim = _KNOWN_DIMS.get(provider, {}).get(model, 0)
+        if not dim and db is not None:
+            try:
+                from sqlalchemy import text
+                row = db.execute(text(
+                    "SELECT dim FROM rag_embedding WHERE model = :m AND modality = 'text' LIMIT 1"
+                ), {"m": model}).first()
+                dim = int(row[0]) if row and row[0] else 0
+            except Exception:
+                try:
+                    db.rollback()
+                except Exception:
+                    pass
+                dim = 0
+        if not dim:
+            try:
+                vecs = _embed_with_provider(provider, model, ["dimension probe"])
+                dim = len(vecs[0]) if vecs and vecs[0] else 0
+            except Exception:
+                dim = 0
+        with _dims_lock:
+            if dim:
+                _dims[key] = dim
+                _dim_misses.pop(key, None)
+            else:
+                _dim_misses[key] = time.monotonic() + _DIM_RETRY_SECONDS
+        return dim
+
+
+def _embed_with_provider(provider: str, model: str, texts: List[str]) -> List[List[float]]:
     if provider == 'openai':
-        try:
-            import openai
-            model = os.getenv('EMBED_MODEL', 'text-embedding-3-small')
-            client = openai.OpenAI()
-            # Batch embed
-            resp = client.embeddings.create(model=model, input=texts)
-            return [_l2_normalize(list(d.embedding)) for d in resp.data]
-        except Exception:
-            return _stub_vectors(texts)
+        import openai
+        client = openai.OpenAI()
+        # Batch embed
+        resp = client.embeddings.create(model=model, input=texts)
+        return [_l2_normalize(list(d.embedding)) for d in resp.data]
     # Add other providers here as needed
     return _stub_vectors(texts)
 
 
+def embed_text_batch(texts: List[str]) -> List[List[float]]:
+    provider = _resolve_provider()
+    if provider == 'stub':
+        return _stub_vectors(texts)
+    model = _current_model()
+    try:
+        vectors = _embed_with_provider(provider, model, texts)
+    except Exception:
+        return _stub_vectors(texts)
+    if vectors and vectors[0] and (provider, model) not in _dims:
+        record_embedding_dim(model, len(vectors[0]), provider)
+    return vectors
+
+
+class _EmbedRequest:
+    __slots__ = ("texts", "tokens", "created", "taken", "done", "result", "error")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.tokens = sum(len(t) // 4 + 1 for t in texts)
+        self.created = time.monotonic()
+        self.taken = False
+        self.done = False
+        self.result: List[List[float]] = []
+        self.error: Optional[BaseException] = None
+
+
+class EmbeddingBatcher:
+    """Coalesce embedding requests from concurrent indexing workers into fewer provider calls.
+
+    Callers block in :meth:`embed`; pending texts are flushed as one provider call when
+    the batch reaches ``max_items`` texts or ``max_tokens`` estimated tokens, when every
+    registered producer is waiting (nobody else can add to the batch), or when the oldest
+    request has waited ``max_wait_ms``. The flushing caller fans vectors back to the other
+    callers. Workers register with ``with embedding_batcher.producer():`` so a lone worker
+    flushes immediately instead of waiting for the deadline.
+    """
+
+    def __init__(self, embed_fn=None, max_items: Optional[int] = None, max_tokens: Optional[int] = None, max_wait_ms: Optional[float] = None):
+        self._embed_fn = embed_fn or (lambda texts: embed_text_batch(texts))
+        # OpenAI accepts up to 2048 inputs and ~300k tokens per embeddings request
+        self.max_items = max_items or int(os.getenv("EMBED_BATCH_MAX_ITEMS", "512"))
+        self.max_tokens = max_tokens or int(os.getenv("EMBED_BATCH_MAX_TOKENS", "200000"))
+        wait_ms = max_wait_ms if max_wait_ms is not None else float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "50"))
+        self.max_wait = wait_ms / 1000.0
+        self._cond = threading.Condition()
+        self._pending: List[_EmbedRequest] = []
+        self._in_flight = 0
+        self._producers = 0
+
+    @contextmanager
+    def producer(self) -> Iterator[None]:
+        with self._cond:
+            self._producers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._producers -= 1
+                # Fewer producers may make the remaining waiters eligible to flush
+                self._cond.notify_all()
+
+    def _flush_reason(self, now: float) -> Optional[str]:
+        if not self._pending:
+            return None
+        items = sum(len(r.texts) for r in self._pending)
+        if items >= self.max_items:
+            return "size"
+        if sum(r.tokens for r in self._pending) >= self.max_tokens:
+            return "tokens"
+        if len(self._pending) + self._in_flight >= self._producers:
+            return "idle"
+        if now - self._pending[0].created >= self.max_wait:
+            return "deadline"
+        return None
+
+    def _take_batch(self) -> List[_EmbedRequest]:
+        batch: List[_EmbedRequest] = []
+        items = tokens = 0
+        while self._pending:
+            req = self._pending[0]
+            if batch and (items + len(req.texts) > self.max_items or tokens + req.tokens > self.max_tokens):
+                break
+            self._pending.pop(0)
+            req.taken = True
+            batch.append(req)
+            items += len(req.texts)
+            tokens += req.tokens
+        return batch
+
+    def _run_batch(self, batch: List[_EmbedRequest], reason: str) -> None:
+        texts = [t for req in batch for t in req.texts]
+        vectors: List[List[float]] = []
+        error: Optional[BaseException] = None
+        try:
+            # A single oversized request is still split to respect the provider input cap
+            for start in range(0, len(texts), self.max_items):
+                part = texts[start:start + self.max_items]
+                vectors.extend(self._embed_fn(part))
+                if rag_embed_batch_size:
+                    try:
+                        rag_embed_batch_size.observe(len(part))
+                    except Exception:
+                        pass
+            if rag_embed_batch_flushes:
+                try:
+                    rag_embed_batch_flushes.labels(reason=reason).inc()
+                except Exception:
+                    pass
+        except BaseException as e:  # propagate to every caller in the batch
+            error = e
+        with self._cond:
+            offset = 0
+            for req in batch:
+                n = len(req.texts)
+                req.result = vectors[offset:offset + n]
+                req.error = error
+                req.done = True
+                offset += n
+            self._in_flight -= len(batch)
+            self._cond.notify_all()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        req = _EmbedRequest(list(texts))
+        with self._cond:
+            self._pending.append(req)
+            self._cond.notify_all()
+            while not req.done:
+                if req.taken:
+                    self._cond.wait()
+                    continue
+                reason = self._flush_reason(time.monotonic())
+                if reason is None:
+                    remaining = self._pending[0].created + self.max_wait - time.monotonic()
+                    self._cond.wait(timeout=max(remaining, 0.001))
+                    continue
+                batch = self._take_batch()
+                self._in_flight += len(batch)
+                self._cond.release()
+                try:
+                    self._run_batch(batch, reason)
+                finally:
+                    self._cond.acquire()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+
+embedding_batcher = EmbeddingBatcher()
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embed through the shared batcher (default) or directly when ``EMBED_BATCHING`` is off."""
+    if os.getenv("EMBED_BATCHING", "true").lower() in ("0", "false", "no"):
+        return embed_text_batch(texts)
+    return embedding_batcher.embed(texts)
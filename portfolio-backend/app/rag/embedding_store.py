@@ -0,0 +1,78 @@
+"""
+Content-addressed embedding store keyed by (model, checksum).
+
+Chunk checksums are sha256 of the sanitized chunk text, so identical text across
+record versions, languages or records maps to one stored vector and is only sent
+to the embedding provider once per model.
+"""
+from typing import Dict, List, Tuple
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+def lookup_embeddings(db: Session, model: str, checksums: List[str], expected_dim: int = 0) -> Dict[str, Tuple[int, str]]:
+    """Return ``{checksum: (dim, embedding_literal)}`` for stored vectors of ``model``.
+
+    Entries whose dim differs from ``expected_dim`` (when known) are ignored so a
+    provider switch under the same model name does not reuse stale vectors.
+    """
+    if not checksums:
+        return {}
+    savepoint = None
+    try:
+        savepoint = db.begin_nested()
+        rows = db.execute(text(
+            """
+            SELECT checksum, dim, embedding FROM rag_embedding_store
+            WHERE model = :m AND checksum = ANY(:cks)
+            """
+        ), {"m": model, "cks": list(set(checksums))}).mappings().all()
+        savepoint.commit()
+    except Exception as e:
+        # Store table may be missing (unit tests / pre-migration DBs); treat as all misses
+        if savepoint is not None:
+            try:
+                savepoint.rollback()
+            except Exception:
+                pass
+        logger.debug(f"embedding store lookup skipped: {e}")
+        return {}
+    return {
+        r["checksum"]: (int(r["dim"]), r["embedding"])
+        for r in rows
+        if not expected_dim or int(r["dim"] or 0) == expected_dim
+    }
+
+
+def store_embeddings(db: Session, model: str, items: List[Tuple[str, int, str]]) -> None:
+    """Best-effort upsert of ``(checksum, dim, embedding_literal)`` rows for ``model``."""
+    if not items:
+        return
+    params: Dict[str, object] = {"m": model}
+    values = []
+    for n, (cks, dim, literal) in enumerate(items):
+        values.append(f"(:m, :c{n}, :d{n}, :e{n})")
+        params.update({f"c{n}": cks, f"d{n}": dim, f"e{n}": literal})
+    savepoint = None
+    try:
+        savepoint = db.begin_nested()
+        db.execute(text(  # nosec B608 - VALUES holds only bind placeholders built from integer indices
+            f"""
+            INSERT INTO rag_embedding_store (model, checksum, dim, embedding)
+            VALUES {", ".join(values)}
+            ON CONFLICT (model, checksum)
+            DO UPDATE SET dim = EXCLUDED.dim, embedding = EXCLUDED.embedding
+            """
+        ), params)
+        savepoint.commit()
+    except Exception as e:
+        if savepoint is not None:
+            try:
+                savepoint.rollback()
+            except Exception:
+                pass
+        logger.debug(f"embedding store write skipped: {e}")
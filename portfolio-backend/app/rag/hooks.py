@@ -1,11 +1,52 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import event
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _resolve_cached_portfolios(session: Session, events) -> None:
+    # Resolved before commit on the session's own connection, in one query for all events;
+    # after_commit only bumps the generations
+    from app.rag.scope import portfolios_for_sources
+    # Marked first: releasing the savepoint below re-enters before_commit
+    session.info["rag_cache_portfolios"] = pids = []
+    try:
+        conn = session.connection()
+        with conn.begin_nested():
+            pids.extend(portfolios_for_sources(conn, [(ev.get("source_table"), ev.get("source_id")) for ev in events]))
+    except Exception as e:
+        # Mapping table may be missing (unit tests / pre-migration DBs); unscoped entries still go
+        logger.debug(f"cache scope lookup skipped: {e}")
+
+
+def _invalidate_cached_responses(pids) -> None:
+    # Bump cache generations right away; reindexing follows after the debounce window
+    from app.services.cache_service import cache_service
+    for pid in [None, *pids]:
+        cache_service.invalidate_portfolio(pid)
 
 
 def register_after_commit_hook(SessionClass):
+    @event.listens_for(SessionClass, "before_commit")
+    def _before_commit(session: Session):
+        events = session.info.get("rag_events")
+        if events and "rag_cache_portfolios" not in session.info:
+            _resolve_cached_portfolios(session, events)
+
+    @event.listens_for(SessionClass, "after_rollback")
+    def _after_rollback(session: Session):
+        session.info.pop("rag_cache_portfolios", None)
+
     @event.listens_for(SessionClass, "after_commit")
     def _after_commit(session: Session):
         events = session.info.pop("rag_events", [])
+        pids = session.info.pop("rag_cache_portfolios", [])
+        if events:
+            try:
+                _invalidate_cached_responses(pids)
+            except Exception:
+                pass
         for ev in events:
             # Import lazily to avoid cycles
             try:
@@ -17,5 +58,3 @@ def register_after_commit_hook(SessionClass):
                     schedule_event(ev, enqueue_delete_job)
             except Exception:
                 pass
-
-
@@ -5,10 +5,14 @@ from datetime import datetime
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 from hashlib import sha256 as _sha256
-from app.rag.chunking import chunk_text
-from app.rag.embedding import embed_text_batch
-from app.rag.storage import extract_text_from_uri
-from app.observability.metrics import rag_chunks_retired, rag_chunks_new, rag_chunks_updated, rag_chunks_skipped, rag_embeddings_upserted
+from app.rag.chunking import chunk_text, chunk_stream
+from app.rag.embedding import embed_texts, get_embedding_dim, is_stub_vector
+from app.rag.embedding_store import lookup_embeddings, store_embeddings
+from app.rag.storage import iter_text_from_uri
+from app.rag.scope import sync_source_scope, portfolios_for_source
+from app.rag.answer_cache import invalidate_portfolios
+from app.services.cache_service import cache_service
+from app.observability.metrics import rag_chunks_retired, rag_chunks_new, rag_chunks_updated, rag_chunks_skipped, rag_embeddings_upserted, rag_embedding_store_hits, rag_embedding_provider_texts
 import re
 try:
     import html2text as _html2text  # type: ignore
@@ -39,10 +43,28 @@ def _sanitize_text(value: str) -> str:
     return cleaned
 
 
+def _redact(value: str, redact_re: Optional[str]) -> str:
+    if redact_re:
+        try:
+            return re.sub(redact_re, "[REDACTED]", value)
+        except Exception:
+            pass
+    return value
+
+
 def _checksum_text(text: str) -> str:
     return _sha256(text.encode("utf-8")).hexdigest()
 
 
+def _invalidate_cached_answers(db: Session, source_table: str, source_id: str) -> None:
+    """Drop semantic and exact-match cached answers of every portfolio that contains the source."""
+    pids = portfolios_for_source(db, source_table, source_id)
+    invalidate_portfolios(db, pids)
+    db.commit()
+    for pid in [None, *pids]:
+        cache_service.invalidate_portfolio(pid)
+
+
 def retire_record(db: Session, source_table: str, source_id: str) -> int:
     res = db.execute(text(
         """
@@ -52,6 +74,9 @@ def retire_record(db: Session, source_table: str, source_id: str) -> int:
         """
     ), {"t": source_table, "i": source_id})
     db.commit()
+    # Invalidate before the scope map forgets which portfolios this source belonged to
+    _invalidate_cached_answers(db, source_table, source_id)
+    sync_source_scope(db, source_table, source_id)
     try:
         _set_status(db, source_table, source_id, error=None)
     except Exception:
@@ -59,21 +84,41 @@ def retire_record(db: Session, source_table: str, source_id: str) -> int:
     return res.rowcount or 0
 
 
-def retire_missing_chunks(db: Session, source_table: str, source_id: str, version: int, planned: List[Tuple[str,int]]) -> int:
-    # planned holds (field, part_index)
-    if not planned:
-        return 0
-    placeholders = ",".join(["(:f{} , :p{} )".format(i, i) for i in range(len(planned))])
-    params = {"t": source_table, "i": source_id, "v": version}
-    for idx, (f, p) in enumerate(planned):
-        params[f"f{idx}"] = f
-        params[f"p{idx}"] = p
-    res = db.execute(text(
-        f"""  # nosec B608 - placeholders contains only parameterized tokens (:f0, :p0)... built from integer indices, no user data interpolated
-        UPDATE rag_chunk c
+def retire_missing_chunks(db: Session, source_table: str, source_id: str, version: int, planned: List[Tuple[str,int]], language_code: Optional[str] = None) -> int:
+    # planned holds (field, part_index) of one language; counts only chunks that were live
+    params = {"t": source_table, "i": source_id, "v": version, "lang": language_code or ""}
+    keep = ""
+    if planned:
+        placeholders = ",".join(["(:f{} , :p{} )".format(i, i) for i in range(len(planned))])
+        keep = f"AND (source_field, part_index) NOT IN (VALUES {placeholders})"
+        for idx, (f, p) in enumerate(planned):
+            params[f"f{idx}"] = f
+            params[f"p{idx}"] = p
+    res = db.execute(text(  # nosec B608 - placeholders contains only parameterized tokens (:f0, :p0)... built from integer indices, no user data interpolated
+        f"""
+        UPDATE rag_chunk
         SET is_deleted = TRUE
-        WHERE c.source_table = :t AND c.source_id = :i AND c.version = :v
-          AND (c.source_field, c.part_index) NOT IN (VALUES {placeholders})
+        WHERE source_table = :t AND source_id = :i AND version = :v AND is_deleted = FALSE
+          AND COALESCE(lang, '') = :lang
+          {keep}
+        """
+    ), params)
+    db.commit()
+    return res.rowcount or 0
+
+
+def retire_other_languages(db: Session, source_table: str, source_id: str, language_codes: List[Optional[str]]) -> int:
+    """Retire live chunks of languages the record no longer has (or that predate its languages)."""
+    params: Dict[str, any] = {"t": source_table, "i": source_id}
+    for idx, code in enumerate(language_codes):
+        params[f"l{idx}"] = code or ""
+    placeholders = ", ".join(f":l{idx}" for idx in range(len(language_codes)))
+    res = db.execute(text(  # nosec B608 - placeholders holds only bind names built from integer indices
+        f"""
+        UPDATE rag_chunk
+        SET is_deleted = TRUE
+        WHERE source_table = :t AND source_id = :i AND is_deleted = FALSE
+          AND COALESCE(lang, '') NOT IN ({placeholders})
         """
     ), params)
     db.commit()
@@ -176,35 +221,41 @@ def _build_canonical_fields(record: Dict[str, any], source_table: str, language_
                 body_parts.append(val)
         fields["body"] = "\n\n".join(body_parts)
     elif source_table in {"project_attachments", "portfolio_attachments"}:
-        text_val = record.get("text") or ""
-        fields["doc"] = text_val
+        if record.get("text_segments"):
+            # Stream page/paragraph segments instead of materializing the whole document
+            fields["doc"] = (_normalize_markup(seg) for seg in record["text_segments"]())
+        else:
+            fields["doc"] = record.get("text") or ""
     else:
         fields["body"] = " ".join([str(v) for v in record.values() if isinstance(v, str)])
 
     # Normalize HTML/Markdown content to plain text while preserving semantics
     for k, v in list(fields.items()):
-        if not isinstance(v, str) or not v:
-            continue
-        if "<p" in v or "</" in v:
-            # likely HTML
-            if _html2text:
-                try:
-                    conv = _html2text.HTML2Text()
-                    conv.ignore_images = True
-                    conv.ignore_links = True
-                    fields[k] = conv.handle(v)
-                    continue
-                except Exception:
-                    pass
-        if ("#" in v or "*" in v or "- " in v) and MarkdownIt:
+        if isinstance(v, str) and v:
+            fields[k] = _normalize_markup(v)
+    return fields
+
+
+def _normalize_markup(v: str) -> str:
+    if "<p" in v or "</" in v:
+        # likely HTML
+        if _html2text:
             try:
-                md = MarkdownIt()
-                # convert to tokens then text; fallback to plain
-                txt = md.render(v)
-                fields[k] = re.sub(r"<[^>]+>", " ", txt)
+                conv = _html2text.HTML2Text()
+                conv.ignore_images = True
+                conv.ignore_links = True
+                return conv.handle(v)
             except Exception:
                 pass
-    return fields
+    if ("#" in v or "*" in v or "- " in v) and MarkdownIt:
+        try:
+            md = MarkdownIt()
+            # convert to tokens then text; fallback to plain
+            txt = md.render(v)
+            return re.sub(r"<[^>]+>", " ", txt)
+        except Exception:
+            pass
+    return v
 
 
 def _load_current_state(db: Session, source_table: str, source_id: str) -> Dict[str, any]:
@@ -385,19 +436,97 @@ def _load_current_state(db: Session, source_table: str, source_id: str) -> Dict[
         rec = db.execute(text("SELECT id, file_path, file_name FROM project_attachments WHERE id=:i"), {"i": source_id}).mappings().first()
         if not rec:
             return {}
-        # Resolve full path via storage util in storage.py using uploads dir
-        return {"id": rec["id"], "name": rec.get("file_name"), "text": extract_text_from_uri(rec.get("file_path") or "")}
+        # Resolve full path via storage util in storage.py using uploads dir; text is streamed lazily
+        uri = rec.get("file_path") or ""
+        return {"id": rec["id"], "name": rec.get("file_name"), "text_segments": lambda: iter_text_from_uri(uri)}
     if source_table == "portfolio_attachments":
         rec = db.execute(text("SELECT id, file_path, file_name FROM portfolio_attachments WHERE id=:i"), {"i": source_id}).mappings().first()
         if not rec:
             return {}
-        return {"id": rec["id"], "name": rec.get("file_name"), "text": extract_text_from_uri(rec.get("file_path") or "")}
+        uri = rec.get("file_path") or ""
+        return {"id": rec["id"], "name": rec.get("file_name"), "text_segments": lambda: iter_text_from_uri(uri)}
 
     # Fallback: empty dict means treat as deleted
     return {}
 
 
-def index_record(db: Session, source_table: str, source_id: str) -> None:
+# Rows per multi-row INSERT; keeps statements well under driver parameter limits
+_UPSERT_BATCH = int(os.getenv("RAG_UPSERT_BATCH", "500"))
+
+
+def _load_existing_chunks(db: Session, source_table: str, source_id: str, version: int, model: str, language_code: Optional[str] = None) -> Dict[Tuple[str, int], Dict[str, any]]:
+    """Existing chunks of a record version and language keyed by (field, part_index), with the current model's embedding dim."""
+    rows = db.execute(text(
+        """
+        SELECT c.id, c.source_field, c.part_index, c.checksum, c.lang, c.is_deleted, e.dim
+        FROM rag_chunk c
+        LEFT JOIN rag_embedding e ON e.chunk_id = c.id AND e.model = :m AND e.modality = 'text'
+        WHERE c.source_table = :t AND c.source_id = :i AND c.version = :v AND COALESCE(c.lang, '') = :lang
+        """
+    ), {"t": source_table, "i": source_id, "v": version, "m": model, "lang": language_code or ""}).mappings().all()
+    return {(r["source_field"], int(r["part_index"])): dict(r) for r in rows}
+
+
+def _bulk_upsert_chunks(db: Session, source_table: str, source_id: str, version: int, language_code: Optional[str], rows: List[Dict[str, any]]) -> Dict[Tuple[str, int], int]:
+    """Upsert chunk rows with multi-row VALUES; returns chunk ids keyed by (field, part_index)."""
+    ids: Dict[Tuple[str, int], int] = {}
+    for start in range(0, len(rows), _UPSERT_BATCH):
+        batch = rows[start:start + _UPSERT_BATCH]
+        params = {
+            "t": source_table, "i": source_id, "v": version, "lang": language_code,
+            "tenant": os.getenv("DEFAULT_TENANT_ID", "default"),
+            "vis": os.getenv("DEFAULT_VISIBILITY", "public"),
+        }
+        values = []
+        for n, r in enumerate(batch):
+            values.append(f"(:t, :i, :f{n}, :p{n}, :v, 'text', :tx{n}, :ck{n}, :lang, :tenant, :vis)")
+            params.update({f"f{n}": r["f"], f"p{n}": r["p"], f"tx{n}": r["tx"], f"ck{n}": r["ck"]})
+        res = db.execute(text(  # nosec B608 - VALUES holds only bind placeholders built from integer indices
+            f"""
+            INSERT INTO rag_chunk (source_table, source_id, source_field, part_index, version, modality, text, checksum, lang, tenant_id, visibility)
+            VALUES {", ".join(values)}
+            ON CONFLICT (source_table, source_id, source_field, part_index, version, (COALESCE(lang, '')))
+            DO UPDATE SET text = EXCLUDED.text, checksum = EXCLUDED.checksum, is_deleted = FALSE, updated_at = CURRENT_TIMESTAMP, tenant_id = EXCLUDED.tenant_id, visibility = EXCLUDED.visibility
+            RETURNING id, source_field, part_index
+            """
+        ), params).mappings().all()
+        for r in res:
+            ids[(r["source_field"], int(r["part_index"]))] = r["id"]
+    return ids
+
+
+def _vec_literal(vec: List[float]) -> str:
+    return f"[{', '.join(str(x) for x in vec)}]"
+
+
+def _bulk_upsert_embeddings(db: Session, model: str, items: List[Tuple[int, int, str]]) -> int:
+    """Upsert (chunk_id, dim, vector literal) rows with multi-row VALUES, storing both text and vector forms."""
+    total = 0
+    for start in range(0, len(items), _UPSERT_BATCH):
+        batch = items[start:start + _UPSERT_BATCH]
+        params: Dict[str, any] = {"m": model}
+        values = []
+        for n, (chunk_id, dim, literal) in enumerate(batch):
+            values.append(f"(:c{n}, :m, 'text', :d{n}, :e{n}, CAST(:e{n} AS vector))")
+            params.update({f"c{n}": chunk_id, f"d{n}": dim, f"e{n}": literal})
+        db.execute(text(  # nosec B608 - VALUES holds only bind placeholders built from integer indices
+            f"""
+            INSERT INTO rag_embedding (chunk_id, model, modality, dim, embedding, embedding_vec)
+            VALUES {", ".join(values)}
+            ON CONFLICT (chunk_id, model, modality)
+            DO UPDATE SET embedding = EXCLUDED.embedding, embedding_vec = EXCLUDED.embedding_vec, dim = EXCLUDED.dim
+            """
+        ), params)
+        total += len(batch)
+    return total
+
+
+def index_record(db: Session, source_table: str, source_id: str, raise_errors: bool = False) -> None:
+    """Index (or retire) one source record.
+
+    Failures are recorded in ``rag_index_status``; with ``raise_errors`` they are also
+    re-raised, so callers that checkpoint progress (bulk reindex) do not skip the record.
+    """
     try:
         # Load
         record = _load_current_state(db, source_table, source_id)
@@ -418,15 +547,27 @@ def index_record(db: Session, source_table: str, source_id: str) -> None:
         if not language_codes:
             language_codes = [None]
         
-        # Create chunks for each language separately
+        # Create chunks for each language separately; each language keeps its own rows, so a
+        # pass reports a change only when that language's retrievable chunks changed
+        changed = False
         for lang_code in language_codes:
-            _index_record_for_language(db, source_table, source_id, record, lang_code)
-            
+            changed |= bool(_index_record_for_language(db, source_table, source_id, record, lang_code))
+        changed |= bool(retire_other_languages(db, source_table, source_id, language_codes))
+
+        # Keep the retrieval scope map in step with membership changes
+        sync_source_scope(db, source_table, source_id)
+        # Cached answers only go stale when retrievable chunks changed; a portfolio event may
+        # also change which sources the portfolio covers, so it always invalidates
+        if changed or source_table == "portfolios":
+            _invalidate_cached_answers(db, source_table, source_id)
     except Exception as e:
         _set_status(db, source_table, source_id, f"indexing failed: {str(e)[:200]}")
+        if raise_errors:
+            raise
 
 
-def _index_record_for_language(db: Session, source_table: str, source_id: str, record: Dict[str, any], language_code: Optional[str]) -> None:
+def _index_record_for_language(db: Session, source_table: str, source_id: str, record: Dict[str, any], language_code: Optional[str]) -> bool:
+    """Index one language of a record; returns whether any retrievable chunk was written or retired."""
     try:
         # Build canonical fields filtered by language
         fields = _build_canonical_fields(record, source_table, language_code)
@@ -440,13 +581,12 @@ def _index_record_for_language(db: Session, source_table: str, source_id: str, r
             if allow_fields and field not in allow_fields:
                 fields.pop(field)
                 continue
-            if redact_re:
-                try:
-                    text_value = re.sub(redact_re, "[REDACTED]", text_value)
-                except Exception:
-                    pass
-            safe_text = _sanitize_text(text_value)
-            for i, chunk in enumerate(chunk_text(safe_text)):
+            if isinstance(text_value, str):
+                chunks = chunk_text(_sanitize_text(_redact(text_value, redact_re)))
+            else:
+                # Segment stream (attachments): sanitize per segment and chunk incrementally
+                chunks = chunk_stream(_sanitize_text(_redact(seg, redact_re)) for seg in text_value)
+            for i, chunk in enumerate(chunks):
                 safe_chunk = _sanitize_text(chunk)
                 plan.append((field, i, safe_chunk, _checksum_text(safe_chunk)))
 
@@ -456,97 +596,72 @@ def _index_record_for_language(db: Session, source_table: str, source_id: str, r
         if isinstance(upd, datetime):
             version = int(upd.timestamp() // 60)
 
-        # Upsert chunks and collect to-embed
-        to_embed: List[Tuple[int, str]] = []
-        planned_keys: List[Tuple[str, int]] = []
-        default_tenant = os.getenv("DEFAULT_TENANT_ID", "default")
-        default_visibility = os.getenv("DEFAULT_VISIBILITY", "public")
+        # Diff the plan against existing rows for this version in one query
+        model = os.getenv("EMBED_MODEL", "text-embedding-3-small")
+        existing = _load_existing_chunks(db, source_table, source_id, version, model, language_code)
         new_count = 0
         upd_count = 0
         skip_count = 0
-        # Determine expected embedding dimension for current provider/model (probe once)
-        try:
-            _probe_vec = embed_text_batch(["__dim_probe__"]) or [[]]
-            expected_dim = len(_probe_vec[0]) if _probe_vec and _probe_vec[0] else 0
-        except Exception:
-            expected_dim = 0
+        # Expected embedding dimension for current provider/model (resolved once per process)
+        expected_dim = get_embedding_dim(db, model)
 
+        to_upsert: List[Dict[str, any]] = []
+        needs_embed_keys = set()
         for field, i, chunk, cks in plan:
-            planned_keys.append((field, i))
-            # Check existing row to decide if embedding needed
-            existing = db.execute(text(
-                """
-                SELECT id, checksum FROM rag_chunk
-                WHERE source_table=:t AND source_id=:i AND source_field=:f AND part_index=:p AND version=:v
-                """
-            ), {"t": source_table, "i": source_id, "f": field, "p": i, "v": version}).mappings().first()
-
-            needs_embed = False
-            existing_id = None
-            if not existing:
-                needs_embed = True
+            prev = existing.get((field, i))
+            if not prev:
                 new_count += 1
+                needs_embed_keys.add((field, i))
+            elif prev.get("checksum") != cks:
+                upd_count += 1
+                needs_embed_keys.add((field, i))
             else:
-                existing_id = existing["id"]
-                if existing.get("checksum") != cks:
-                    needs_embed = True
-                    upd_count += 1
-                else:
-                    skip_count += 1
-
-            row = db.execute(text(
-                """
-                INSERT INTO rag_chunk (source_table, source_id, source_field, part_index, version, modality, text, checksum, lang, tenant_id, visibility)
-                VALUES (:t, :i, :f, :p, :v, 'text', :tx, :ck, :lang, :tenant, :vis)
-                ON CONFLICT (source_table, source_id, source_field, part_index, version)
-                DO UPDATE SET text = EXCLUDED.text, checksum = EXCLUDED.checksum, lang = EXCLUDED.lang, is_deleted = FALSE, updated_at = CURRENT_TIMESTAMP, tenant_id = EXCLUDED.tenant_id, visibility = EXCLUDED.visibility
-                RETURNING id
-                """
-            ), {"t": source_table, "i": source_id, "f": field, "p": i, "v": version, "tx": chunk, "ck": cks, "lang": language_code, "tenant": default_tenant, "vis": default_visibility}).mappings().first()
-
-            chunk_id = row["id"]
-            # If checksum unchanged, ensure an embedding exists for current model with correct dimension; else mark for re-embed
-            if not needs_embed and expected_dim:
-                try:
-                    emb_row = db.execute(text(
-                        """
-                        SELECT dim FROM rag_embedding
-                        WHERE chunk_id = :cid AND model = :m AND modality = 'text'
-                        """
-                    ), {"cid": chunk_id, "m": os.getenv("EMBED_MODEL", "text-embedding-3-small")}).mappings().first()
-                    if (not emb_row) or (int(emb_row.get("dim") or 0) != expected_dim):
-                        needs_embed = True
-                except Exception:
-                    needs_embed = True
-
-            if needs_embed:
-                to_embed.append((chunk_id, chunk))
-
-        # Embed and upsert vectors
+                skip_count += 1
+                # Unchanged text: re-embed only when the current model has no vector of the expected dimension
+                if expected_dim and int(prev.get("dim") or 0) != expected_dim:
+                    needs_embed_keys.add((field, i))
+                # Nothing to write for live rows already carrying this text
+                if not prev.get("is_deleted"):
+                    continue
+            to_upsert.append({"f": field, "p": i, "tx": chunk, "ck": cks})
+
+        chunk_ids = {key: row["id"] for key, row in existing.items()}
+        chunk_ids.update(_bulk_upsert_chunks(db, source_table, source_id, version, language_code, to_upsert))
+        to_embed: List[Tuple[int, str, str]] = [
+            (chunk_ids[(field, i)], chunk, cks) for field, i, chunk, cks in plan if (field, i) in needs_embed_keys
+        ]
+
+        # Reuse stored vectors for identical content; send each distinct missing text to the provider once
         embedded_count = 0
+        provider_texts = 0
         if to_embed:
-            vectors = embed_text_batch([t for _, t in to_embed])
-            if vectors:
-                dim = len(vectors[0])
-                for (chunk_id, _), vec in zip(to_embed, vectors):
-                    # Store embedding both as text (for compatibility) and as vector (for HNSW index)
-                    db.execute(text(
-                        """
-                        INSERT INTO rag_embedding (chunk_id, model, modality, dim, embedding, embedding_vec)
-                        VALUES (:cid, :m, 'text', :d, :e, CAST(:e AS vector))
-                        ON CONFLICT (chunk_id, model, modality)
-                        DO UPDATE SET embedding = EXCLUDED.embedding, embedding_vec = EXCLUDED.embedding_vec, dim = EXCLUDED.dim
-                        """
-                    ), {"cid": chunk_id, "m": os.getenv("EMBED_MODEL", "text-embedding-3-small"), "d": dim, "e": f"[{', '.join(str(x) for x in vec)}]"})
-                    embedded_count += 1
-                    if rag_embeddings_upserted:
-                        try:
-                            rag_embeddings_upserted.inc()
-                        except Exception:
-                            pass
+            stored = lookup_embeddings(db, model, [cks for _, _, cks in to_embed], expected_dim)
+            missing: Dict[str, str] = {}
+            for _, chunk, cks in to_embed:
+                if cks not in stored:
+                    missing.setdefault(cks, chunk)
+            if missing:
+                vectors = embed_texts(list(missing.values())) or []
+                embedded = [(cks, vec) for cks, vec in zip(missing.keys(), vectors) if vec]
+                fresh = [(cks, len(vec), _vec_literal(vec)) for cks, vec in embedded]
+                # Placeholder vectors still fill rag_embedding, but are never stored for reuse
+                # under the model name, so the next reindex asks the provider again
+                store_embeddings(db, model, [item for item, (_, vec) in zip(fresh, embedded) if not is_stub_vector(vec)])
+                stored.update({cks: (dim, literal) for cks, dim, literal in fresh})
+                provider_texts = len(missing)
+            embedded_count = _bulk_upsert_embeddings(db, model, [(cid, *stored[cks]) for cid, _, cks in to_embed if cks in stored])
+            try:
+                if rag_embeddings_upserted and embedded_count:
+                    rag_embeddings_upserted.inc(embedded_count)
+                if rag_embedding_store_hits and len(to_embed) > provider_texts:
+                    rag_embedding_store_hits.inc(len(to_embed) - provider_texts)
+                if rag_embedding_provider_texts and provider_texts:
+                    rag_embedding_provider_texts.inc(provider_texts)
+            except Exception:
+                pass
 
         # Retire missing
-        retired = retire_missing_chunks(db, source_table, source_id, version, [(f, p) for f, p, _, _ in plan])
+        retired = retire_missing_chunks(db, source_table, source_id, version, [(f, p) for f, p, _, _ in plan], language_code)
         if rag_chunks_retired and retired:
             try:
                 rag_chunks_retired.inc(retired)
@@ -562,25 +677,30 @@ def _index_record_for_language(db: Session, source_table: str, source_id: str, r
                 rag_chunks_skipped.inc(skip_count)
         except Exception:
             pass
-        # Retire all chunks from other versions
+        # Retire this language's chunks from other versions
+        other_retired = 0
         try:
-            db.execute(text(
+            res = db.execute(text(
                 """
                 UPDATE rag_chunk SET is_deleted=TRUE
                 WHERE source_table=:t AND source_id=:i AND version<>:v AND is_deleted=FALSE
+                  AND COALESCE(lang, '')=:lang
                 """
-            ), {"t": source_table, "i": source_id, "v": version})
+            ), {"t": source_table, "i": source_id, "v": version, "lang": language_code or ""})
+            other_retired = res.rowcount or 0
             db.commit()
         except Exception:
             pass
         try:
-            logger.info(f"indexed={len(plan)} to_embed={len(to_embed)} embedded={embedded_count} retired={retired} table={source_table} id={source_id}")
+            logger.info(f"indexed={len(plan)} to_embed={len(to_embed)} provider_texts={provider_texts} embedded={embedded_count} retired={retired} table={source_table} id={source_id}")
         except Exception:
             pass
         try:
             _set_status(db, source_table, source_id, error=None)
         except Exception:
             pass
+        # to_upsert covers new, updated and revived rows
+        return bool(to_upsert or retired or other_retired)
     except Exception as e:
         try:
             _set_status(db, source_table, source_id, error=str(e))
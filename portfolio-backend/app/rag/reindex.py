@@ -0,0 +1,271 @@
+"""
+Parallel, resumable bulk reindex.
+
+Each table is split into keyset ranges ``(lo, hi]`` on its primary key. Ranges run on
+Celery workers when a broker and result backend are configured, otherwise on a local
+process pool (or a thread pool when a custom session factory is supplied, e.g. tests).
+
+The coordinator is the only writer of progress state in ``system_settings``:
+
+- ``rag.reindex.cursor.<table>``: last key of the contiguous prefix of finished ranges;
+  a new run resumes after it unless ``resume=False``.
+- ``rag.reindex.total`` / ``rag.reindex.processed`` / ``rag.reindex.run_started_at``:
+  feed throughput and ETA in :func:`reindex_progress`.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+import logging
+import multiprocessing
+import os
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.rag.embedding import embedding_batcher
+from app.rag.indexer import index_record
+from app.observability.metrics import rag_index_jobs
+
+logger = logging.getLogger(__name__)
+
+
+SUPPORTED_TABLES = [
+    "categories",
+    "projects",
+    "portfolios",
+    "sections",
+    "experiences",
+    "category_types",
+    "languages",
+    "translations",
+    "skills",
+    "skill_types",
+    "project_attachments",
+    "portfolio_attachments",
+]
+
+# Tables whose primary key is not the integer ``id``
+_TEXT_PK = {"skill_types": "code", "category_types": "code"}
+
+RANGE_SIZE = int(os.getenv("RAG_REINDEX_RANGE_SIZE", "500"))
+WORKERS = int(os.getenv("RAG_REINDEX_WORKERS", "4"))
+# Threads per range; they share the process-wide embedding batcher
+RANGE_THREADS = int(os.getenv("RAG_REINDEX_RANGE_THREADS", "4"))
+
+_CURSOR_PREFIX = "rag.reindex.cursor."
+
+Key = Optional[Any]
+
+
+def _pk(table: str) -> str:
+    if table not in SUPPORTED_TABLES:
+        raise ValueError(f"unsupported table: {table}")
+    return _TEXT_PK.get(table, "id")
+
+
+def _decode_key(table: str, raw: Optional[str]) -> Key:
+    if raw is None or raw == "":
+        return None
+    return raw if table in _TEXT_PK else int(raw)
+
+
+def _range_where(pk: str, lo: Key, hi: Key) -> Tuple[str, Dict[str, Any]]:
+    clauses, params = [], {}
+    if lo is not None:
+        clauses.append(f"{pk} > :lo")
+        params["lo"] = lo
+    if hi is not None:
+        clauses.append(f"{pk} <= :hi")
+        params["hi"] = hi
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def plan_ranges(db: Session, table: str, after: Key, size: Optional[int] = None) -> List[Tuple[Key, Key]]:
+    """Keyset ranges ``(lo, hi]`` covering rows with key > ``after``; the last range is open-ended."""
+    pk = _pk(table)
+    size = size or RANGE_SIZE
+    ranges: List[Tuple[Key, Key]] = []
+    lo = after
+    while True:
+        where, params = _range_where(pk, lo, None)
+        hi = db.execute(text(  # nosec B608 - table/pk come from the SUPPORTED_TABLES whitelist
+            f"SELECT {pk} FROM {table}{where} ORDER BY {pk} LIMIT 1 OFFSET :n"
+        ), {**params, "n": max(size - 1, 0)}).scalar()
+        if hi is None:
+            ranges.append((lo, None))
+            return ranges
+        ranges.append((lo, hi))
+        lo = hi
+
+
+def count_rows(db: Session, table: str, after: Key) -> int:
+    pk = _pk(table)
+    where, params = _range_where(pk, after, None)
+    return int(db.execute(text(f"SELECT COUNT(*) FROM {table}{where}"), params).scalar() or 0)  # nosec B608 - whitelisted table
+
+
+def index_range(table: str, lo: Key, hi: Key, session_factory: Optional[Callable[[], Session]] = None) -> int:
+    """Index every row of ``table`` with key in ``(lo, hi]``. Runs inside pool/Celery workers."""
+    session_factory = session_factory or SessionLocal
+    pk = _pk(table)
+    where, params = _range_where(pk, lo, hi)
+    with session_factory() as db:
+        ids = [str(r[0]) for r in db.execute(text(f"SELECT {pk} FROM {table}{where} ORDER BY {pk}"), params)]  # nosec B608 - whitelisted table
+
+    def _one(rid: str) -> None:
+        with session_factory() as worker_db, embedding_batcher.producer():
+            # Raise, so a failed record fails its range and the cursor stays before it
+            index_record(worker_db, table, rid, raise_errors=True)
+
+    threads = max(1, min(RANGE_THREADS, len(ids)))
+    if threads == 1:
+        for rid in ids:
+            _one(rid)
+    else:
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="rag-range") as pool:
+            list(pool.map(_one, ids))
+    try:
+        if rag_index_jobs and ids:
+            rag_index_jobs.inc(len(ids))
+    except Exception:
+        pass
+    return len(ids)
+
+
+def _write_settings(db: Session, values: Dict[str, str]) -> None:
+    for k, v in values.items():
+        db.execute(text(
+            """
+            INSERT INTO system_settings(key, value)
+            VALUES (:k, :v)
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP
+            """
+        ), {"k": k, "v": v})
+    db.commit()
+
+
+def _read_settings(db: Session, prefix: str) -> Dict[str, str]:
+    rows = db.execute(text("SELECT key, value FROM system_settings WHERE key LIKE :p"), {"p": prefix + "%"}).fetchall()
+    return {k: v for k, v in rows}
+
+
+def _celery_ready() -> bool:
+    # Checkpointing needs range results back, so Celery is only used with a result backend
+    try:
+        from app.queue.celery_app import is_enabled
+        return is_enabled() and bool(os.getenv("CELERY_RESULT_BACKEND") or os.getenv("RESULT_BACKEND"))
+    except Exception:
+        return False
+
+
+def _index_range_on_celery(table: str, lo: Key, hi: Key) -> int:
+    from app.queue.celery_app import get_celery
+    res = get_celery().send_task("app.queue.celery_app.task_reindex_range", args=[table, lo, hi])
+    return int(res.get(timeout=float(os.getenv("RAG_REINDEX_RANGE_TIMEOUT", "1800"))) or 0)
+
+
+def _make_executor(session_factory: Optional[Callable[[], Session]]):
+    """Return (mode, executor, submit) for the configured backend.
+
+    ``RAG_REINDEX_EXECUTOR`` = auto | celery | process | thread. A custom session factory
+    cannot cross process boundaries, so it always runs on threads.
+    """
+    mode = os.getenv("RAG_REINDEX_EXECUTOR", "auto").lower()
+    workers = max(1, WORKERS)
+    if session_factory is SessionLocal:
+        session_factory = None
+    if session_factory is None and mode in ("auto", "celery") and _celery_ready():
+        # Threads here only wait on remote results; allow more ranges in flight
+        pool = ThreadPoolExecutor(max_workers=workers * 4, thread_name_prefix="rag-reindex-celery")
+        return "celery", pool, lambda t, lo, hi: pool.submit(_index_range_on_celery, t, lo, hi)
+    if session_factory is None and mode in ("auto", "process"):
+        try:
+            # Spawn, not fork: the API process runs background threads (debounce scheduler,
+            # embedding batcher, Redis subscribers) whose locks a forked child would inherit
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            return "process", pool, lambda t, lo, hi: pool.submit(index_range, t, lo, hi)
+        except Exception as e:
+            logger.warning(f"process pool unavailable, reindexing on threads: {e}")
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-reindex")
+    return "thread", pool, lambda t, lo, hi: pool.submit(index_range, t, lo, hi, session_factory)
+
+
+def run_reindex(tables: List[str], *, resume: bool = True, session_factory: Optional[Callable[[], Session]] = None) -> int:
+    """Reindex ``tables`` range by range, checkpointing cursors; returns rows processed this run."""
+    factory = session_factory or SessionLocal
+    for t in tables:
+        _pk(t)
+    with factory() as db:
+        saved = _read_settings(db, _CURSOR_PREFIX) if resume else {}
+        starts = {t: _decode_key(t, saved.get(_CURSOR_PREFIX + t)) for t in tables}
+        plans = {t: plan_ranges(db, t, starts[t]) for t in tables}
+        total = sum(count_rows(db, t, starts[t]) for t in tables)
+        mode, pool, submit = _make_executor(session_factory)
+        _write_settings(db, {
+            **{_CURSOR_PREFIX + t: ("" if starts[t] is None else str(starts[t])) for t in tables},
+            "rag.reindex.total": str(total),
+            "rag.reindex.processed": "0",
+            "rag.reindex.run_started_at": datetime.now(timezone.utc).isoformat(),
+            "rag.reindex.executor": mode,
+        })
+        logger.info(f"reindex: {total} rows in {sum(len(r) for r in plans.values())} ranges via {mode} (resume={resume})")
+
+        processed = 0
+        finished: Dict[str, set] = {t: set() for t in tables}
+        next_idx: Dict[str, int] = {t: 0 for t in tables}
+        with pool:
+            futures = {}
+            for t in tables:
+                for idx, (lo, hi) in enumerate(plans[t]):
+                    futures[submit(t, lo, hi)] = (t, idx)
+            for fut in as_completed(futures):
+                t, idx = futures[fut]
+                try:
+                    processed += int(fut.result() or 0)
+                except Exception:
+                    # Leave the cursor before this range so a resumed run retries it
+                    logger.exception(f"reindex range failed: {t} {plans[t][idx]}")
+                    continue
+                finished[t].add(idx)
+                updates = {"rag.reindex.processed": str(processed)}
+                if next_idx[t] in finished[t]:
+                    while next_idx[t] in finished[t]:
+                        next_idx[t] += 1
+                    hi = plans[t][next_idx[t] - 1][1]
+                    # An open-ended last range means the table is complete; clear its cursor
+                    updates[_CURSOR_PREFIX + t] = "" if hi is None else str(hi)
+                try:
+                    _write_settings(db, updates)
+                except Exception:
+                    db.rollback()
+        return processed
+
+
+def reindex_progress(db: Session) -> Dict[str, Any]:
+    """Progress of the current/last bulk run with throughput (rows/s) and ETA (seconds)."""
+    vals = _read_settings(db, "rag.reindex")
+    out: Dict[str, Any] = {
+        "active": str(vals.get("rag.reindex_active", "false")).lower() == "true",
+        "executor": vals.get("rag.reindex.executor"),
+        "started_at": vals.get("rag.reindex.run_started_at"),
+        "cursors": {k[len(_CURSOR_PREFIX):]: v for k, v in vals.items() if k.startswith(_CURSOR_PREFIX) and v},
+    }
+    try:
+        total = int(vals.get("rag.reindex.total") or 0)
+        processed = int(vals.get("rag.reindex.processed") or 0)
+    except ValueError:
+        total = processed = 0
+    out.update({"total": total, "processed": processed, "throughput_per_sec": None, "eta_seconds": None})
+    started = out["started_at"]
+    if started and processed:
+        try:
+            elapsed = (datetime.now(timezone.utc) - datetime.fromisoformat(started)).total_seconds()
+            if elapsed > 0:
+                rate = processed / elapsed
+                out["throughput_per_sec"] = round(rate, 2)
+                if out["active"] and rate > 0:
+                    out["eta_seconds"] = round(max(total - processed, 0) / rate, 1)
+        except Exception:
+            pass
+    return out
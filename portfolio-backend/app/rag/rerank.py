@@ -0,0 +1,154 @@
+"""
+Rerank stage between retrieval and context assembly.
+
+Agents opt in with ``Agent.rerank_provider``:
+
+- ``bm25``: CPU-only lexical reranker. BM25 is computed over the candidate pool and
+  blended with the retrieval score (``RAG_RERANK_LEXICAL_WEIGHT``, default 0.5) so exact
+  terms lift passages without discarding semantic similarity.
+- ``cross-encoder``: a small local cross-encoder (``Agent.rerank_model``, default
+  ``cross-encoder/ms-marco-MiniLM-L-6-v2``) via the optional ``sentence-transformers``
+  package, scored in batches of ``RAG_RERANK_BATCH_SIZE``. Falls back to bm25 when the
+  package or model is unavailable; a model that failed to load is not retried for
+  ``RAG_RERANK_RETRY_SECONDS`` (default 300).
+
+Retrieval fetches ``Agent.rerank_candidates`` (default ``RAG_RERANK_CANDIDATES`` = 30)
+candidates and the stage keeps the best ``top_k``.
+"""
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter as TermCounter
+from time import perf_counter
+
+from app.observability.metrics import rag_rerank_seconds
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "30"))
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+
+def candidate_pool(top_k: int, rerank_provider: Optional[str], rerank_candidates: Optional[int]) -> int:
+    """How many candidates to retrieve for an agent; ``top_k`` when reranking is off."""
+    if not _normalize_provider(rerank_provider):
+        return top_k
+    return max(top_k, int(rerank_candidates or DEFAULT_CANDIDATES))
+
+
+def _normalize_provider(provider: Optional[str]) -> Optional[str]:
+    p = (provider or "").strip().lower().replace("_", "-")
+    if not p or p == "none":
+        return None
+    if p in ("bm25", "lexical"):
+        return "bm25"
+    if p in ("cross-encoder", "crossencoder", "local"):
+        return "cross-encoder"
+    logger.warning(f"unknown rerank provider {provider!r}; skipping rerank")
+    return None
+
+
+def _terms(text: str) -> List[str]:
+    return [t.casefold() for t in _TOKEN_RE.findall(text or "")]
+
+
+def bm25_scores(query: str, docs: List[str]) -> List[float]:
+    """BM25 of ``query`` against each doc, with IDF taken from the candidate pool itself."""
+    q_terms = set(_terms(query))
+    if not q_terms or not docs:
+        return [0.0] * len(docs)
+    doc_terms = [TermCounter(_terms(d)) for d in docs]
+    n = len(docs)
+    avg_len = (sum(sum(tc.values()) for tc in doc_terms) / n) or 1.0
+    idf = {}
+    for t in q_terms:
+        df = sum(1 for tc in doc_terms if t in tc)
+        idf[t] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    out = []
+    for tc in doc_terms:
+        length = sum(tc.values())
+        score = 0.0
+        for t in q_terms:
+            f = tc.get(t, 0)
+            if f:
+                score += idf[t] * f * (_BM25_K1 + 1) / (f + _BM25_K1 * (1 - _BM25_B + _BM25_B * length / avg_len))
+        out.append(score)
+    return out
+
+
+def _lexical_scores(query: str, items: List[Dict[str, Any]]) -> List[float]:
+    weight = float(os.getenv("RAG_RERANK_LEXICAL_WEIGHT", "0.5"))
+    lexical = bm25_scores(query, [it.get("text") or "" for it in items])
+    top = max(lexical) or 1.0
+    return [weight * (lx / top) + (1 - weight) * float(it.get("score") or 0.0) for lx, it in zip(lexical, items)]
+
+
+_model_lock = threading.Lock()
+_MODEL_RETRY_SECONDS = float(os.getenv("RAG_RERANK_RETRY_SECONDS", "300"))
+# model name -> monotonic time until which loading it is not attempted again
+_unavailable_models: Dict[str, float] = {}
+
+
+@lru_cache(maxsize=2)
+def _cross_encoder(model_name: str):
+    from sentence_transformers import CrossEncoder  # type: ignore
+    return CrossEncoder(model_name, device="cpu")
+
+
+def _cross_encoder_scores(query: str, items: List[Dict[str, Any]], model_name: str) -> List[float]:
+    # lru_cache does not keep failures: without this every chat would retry the import/download
+    if _unavailable_models.get(model_name, 0.0) > time.monotonic():
+        raise RuntimeError(f"cross-encoder {model_name} unavailable (recent load failure)")
+    with _model_lock:
+        if _unavailable_models.get(model_name, 0.0) > time.monotonic():
+            raise RuntimeError(f"cross-encoder {model_name} unavailable (recent load failure)")
+        try:
+            model = _cross_encoder(model_name)
+        except Exception:
+            _unavailable_models[model_name] = time.monotonic() + _MODEL_RETRY_SECONDS
+            raise
+        _unavailable_models.pop(model_name, None)
+    pairs = [(query, it.get("text") or "") for it in items]
+    batch_size = int(os.getenv("RAG_RERANK_BATCH_SIZE", "16"))
+    return [float(s) for s in model.predict(pairs, batch_size=batch_size, show_progress_bar=False)]
+
+
+def rerank(query: str, items: List[Dict[str, Any]], *, provider: Optional[str], model: Optional[str] = None, top_k: int) -> List[Dict[str, Any]]:
+    """Reorder ``items`` by relevance to ``query`` and keep ``top_k``.
+
+    The retrieval score stays in ``score`` (citations show it); the rerank score is
+    added as ``rerank_score``. Without a provider the input order is kept.
+    """
+    kind = _normalize_provider(provider)
+    if not kind or len(items) <= 1:
+        return items[:top_k]
+    t0 = perf_counter()
+    scores: Optional[List[float]] = None
+    if kind == "cross-encoder":
+        try:
+            scores = _cross_encoder_scores(query, items, model or DEFAULT_CROSS_ENCODER)
+        except Exception as e:
+            logger.warning(f"cross-encoder rerank unavailable, using bm25: {e}")
+            kind = "bm25"
+    if scores is None:
+        scores = _lexical_scores(query, items)
+    ranked = sorted(
+        ({**it, "rerank_score": sc} for it, sc in zip(items, scores)),
+        key=lambda it: it["rerank_score"],
+        reverse=True,
+    )
+    try:
+        if rag_rerank_seconds:
+            rag_rerank_seconds.labels(provider=kind).observe(perf_counter() - t0)
+    except Exception:
+        pass
+    return ranked[:top_k]
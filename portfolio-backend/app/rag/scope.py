@@ -0,0 +1,138 @@
+"""
+Precomputed source -> portfolio mapping used to scope retrieval.
+
+``rag_source_portfolio`` holds one row per (portfolio_id, source_table, source_id)
+so vector/hybrid search can restrict chunks with a single indexed semi-join
+instead of six correlated membership subqueries per query.
+
+Membership is defined on the portfolio side (portfolio_projects, portfolio_sections, ...)
+and every membership change stages a ``portfolios`` update event, so re-syncing on
+``portfolios`` and attachment events keeps the mapping current.
+"""
+from typing import List, Optional, Tuple
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+# One SELECT per scoped source table; each yields (portfolio_id, source_table, source_id).
+# The ``{where_*}`` placeholders take an optional portfolio restriction (hardcoded SQL only).
+_SCOPE_SELECTS = [
+    "SELECT p.id, 'portfolios', CAST(p.id AS TEXT) FROM portfolios p WHERE TRUE {where_p}",
+    "SELECT pe.portfolio_id, 'experiences', CAST(pe.experience_id AS TEXT) FROM portfolio_experiences pe WHERE TRUE {where_pe}",
+    "SELECT pp.portfolio_id, 'projects', CAST(pp.project_id AS TEXT) FROM portfolio_projects pp WHERE TRUE {where_pp}",
+    "SELECT ps.portfolio_id, 'sections', CAST(ps.section_id AS TEXT) FROM portfolio_sections ps WHERE TRUE {where_ps}",
+    "SELECT pa.portfolio_id, 'portfolio_attachments', CAST(pa.id AS TEXT) FROM portfolio_attachments pa WHERE TRUE {where_pa}",
+    (
+        "SELECT pp.portfolio_id, 'project_attachments', CAST(pa.id AS TEXT) "
+        "FROM project_attachments pa JOIN portfolio_projects pp ON pp.project_id = pa.project_id WHERE TRUE {where_pp}"
+    ),
+]
+
+
+def _scope_union(portfolio_filter: bool) -> str:
+    where = {
+        "where_p": "AND p.id = :pid" if portfolio_filter else "",
+        "where_pe": "AND pe.portfolio_id = :pid" if portfolio_filter else "",
+        "where_pp": "AND pp.portfolio_id = :pid" if portfolio_filter else "",
+        "where_ps": "AND ps.portfolio_id = :pid" if portfolio_filter else "",
+        "where_pa": "AND pa.portfolio_id = :pid" if portfolio_filter else "",
+    }
+    return "\nUNION\n".join(s.format(**where) for s in _SCOPE_SELECTS)
+
+
+def rebuild_source_scope(db: Session, portfolio_id: Optional[int] = None) -> None:
+    """Recompute the mapping for one portfolio, or for all portfolios when ``portfolio_id`` is None."""
+    params = {}
+    if portfolio_id is None:
+        db.execute(text("DELETE FROM rag_source_portfolio"))
+    else:
+        params["pid"] = int(portfolio_id)
+        db.execute(text("DELETE FROM rag_source_portfolio WHERE portfolio_id = :pid"), params)
+    db.execute(text(  # nosec B608 - interpolated fragment is hardcoded SQL
+        f"""
+        INSERT INTO rag_source_portfolio (portfolio_id, source_table, source_id)
+        {_scope_union(portfolio_id is not None)}
+        ON CONFLICT DO NOTHING
+        """
+    ), params)
+    db.commit()
+
+
+def sync_source_scope(db: Session, source_table: str, source_id: str) -> None:
+    """Best-effort refresh of the mapping rows affected by an index/retire event."""
+    try:
+        if source_table == "portfolios":
+            rebuild_source_scope(db, int(source_id))
+        elif source_table in ("portfolio_attachments", "project_attachments"):
+            db.execute(text(
+                "DELETE FROM rag_source_portfolio WHERE source_table = :t AND source_id = :i"
+            ), {"t": source_table, "i": str(source_id)})
+            if source_table == "portfolio_attachments":
+                sql = "SELECT pa.portfolio_id, 'portfolio_attachments', CAST(pa.id AS TEXT) FROM portfolio_attachments pa WHERE pa.id = :aid"
+            else:
+                sql = (
+                    "SELECT pp.portfolio_id, 'project_attachments', CAST(pa.id AS TEXT) "
+                    "FROM project_attachments pa JOIN portfolio_projects pp ON pp.project_id = pa.project_id WHERE pa.id = :aid"
+                )
+            db.execute(text(
+                f"INSERT INTO rag_source_portfolio (portfolio_id, source_table, source_id) {sql} ON CONFLICT DO NOTHING"  # nosec B608 - hardcoded SQL
+            ), {"aid": int(source_id)})
+            db.commit()
+    except Exception as e:
+        # Mapping table may be missing (unit tests / pre-migration DBs); never fail indexing for it
+        try:
+            db.rollback()
+        except Exception:
+            pass
+        logger.debug(f"scope sync skipped for {source_table}:{source_id}: {e}")
+
+
+def portfolios_for_source(db, source_table: str, source_id: str) -> List[int]:
+    """Portfolio ids a source currently belongs to (``db`` may be a Session or Connection)."""
+    if source_table == "portfolios":
+        try:
+            return [int(source_id)]
+        except (TypeError, ValueError):
+            return []
+    try:
+        rows = db.execute(text(
+            "SELECT portfolio_id FROM rag_source_portfolio WHERE source_table = :t AND source_id = :i"
+        ), {"t": source_table, "i": str(source_id)}).fetchall()
+    except Exception as e:
+        try:
+            db.rollback()
+        except Exception:
+            pass
+        logger.debug(f"scope lookup skipped for {source_table}:{source_id}: {e}")
+        return []
+    return [int(r[0]) for r in rows]
+
+
+def portfolios_for_sources(db, sources: List[Tuple[str, str]]) -> List[int]:
+    """Portfolio ids any of ``sources`` currently belongs to, in one query; errors propagate."""
+    pids = set()
+    params = {}
+    values = []
+    for source_table, source_id in dict.fromkeys(sources):
+        if source_table == "portfolios":
+            try:
+                pids.add(int(source_id))
+            except (TypeError, ValueError):
+                pass
+            continue
+        n = len(values)
+        values.append(f"(:t{n}, :i{n})")
+        params.update({f"t{n}": source_table, f"i{n}": str(source_id)})
+    if values:
+        rows = db.execute(text(  # nosec B608 - VALUES holds only bind placeholders built from integer indices
+            f"""
+            SELECT DISTINCT portfolio_id FROM rag_source_portfolio
+            WHERE (source_table, source_id) IN (VALUES {", ".join(values)})
+            """
+        ), params).fetchall()
+        pids.update(int(r[0]) for r in rows)
+    return sorted(pids)
@@ -1,7 +1,10 @@
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Iterator, Optional
+import hashlib
 import logging
 import os
+import tempfile
+import time
 
 from app.core.config import settings
 
@@ -36,20 +39,25 @@ def read_text_best_effort(path: Path) -> str:
     return ""
 
 
-def extract_text_from_pdf(path: Path) -> str:
+def iter_pdf_pages(path: Path) -> Iterator[str]:
+    """Yield page texts one at a time; only the current page's text is held in memory."""
     try:
         import pypdf  # type: ignore
-        text_parts = []
         with open(path, "rb") as f:
             reader = pypdf.PdfReader(f)
             for page in reader.pages:
                 try:
-                    text_parts.append(page.extract_text() or "")
+                    text = page.extract_text() or ""
                 except Exception:
                     continue
-        return "\n\n".join([t for t in text_parts if t])
+                if text:
+                    yield text
     except Exception:
-        return ""
+        return
+
+
+def extract_text_from_pdf(path: Path) -> str:
+    return "\n\n".join(iter_pdf_pages(path))
 
 
 def extract_text_from_docx(path: Path) -> str:
@@ -78,12 +86,185 @@ def extract_text_from_html(path: Path) -> str:
         return ""
 
 
+# Extracted text cache, keyed by file content hash. Bump _CACHE_VERSION when extraction changes.
+_CACHE_VERSION = "1"
+_SEGMENT_SEP = "\f"
+# Size bound of the cache directory; least recently used entries are pruned past it
+_CACHE_MAX_BYTES = int(float(os.getenv("RAG_TEXT_CACHE_MAX_MB", "512")) * 1024 * 1024)
+# Temp files older than this are leftovers of crashed writers
+_STALE_TMP_SECONDS = 3600
+
+
+def _cache_dir() -> Path:
+    return Path(os.getenv("RAG_TEXT_CACHE_DIR") or (Path(settings.BASE_DIR) / "var" / "rag_text_cache"))
+
+
+def _file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _prune_cache(cache_dir: Path, max_bytes: Optional[int] = None) -> None:
+    """Delete least recently used entries (by mtime, refreshed on hits) until the cache fits.
+
+    Entries of retired or replaced attachments are never read again, so they age out here.
+    """
+    max_bytes = _CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    now = time.time()
+    entries = []
+    total = 0
+    try:
+        for f in cache_dir.iterdir():
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            if f.suffix == ".tmp":
+                if now - st.st_mtime > _STALE_TMP_SECONDS:
+                    f.unlink(missing_ok=True)
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+            total += st.st_size
+    except OSError as e:
+        logger.debug(f"text cache prune skipped: {e}")
+        return
+    for _, size, f in sorted(entries, key=lambda e: e[0]):
+        if total <= max_bytes:
+            break
+        try:
+            f.unlink(missing_ok=True)
+            total -= size
+        except OSError:
+            pass
+
+
+def _iter_cached_segments(cache_file: Path) -> Iterator[str]:
+    # Segments are separated by form feeds; read in blocks so large caches stream too
+    buf = ""
+    with open(cache_file, "r", encoding="utf-8") as f:
+        for block in iter(lambda: f.read(1 << 16), ""):
+            buf += block
+            *done, buf = buf.split(_SEGMENT_SEP)
+            for seg in done:
+                if seg:
+                    yield seg
+    if buf:
+        yield buf
+
+
+def _iter_and_cache(segments: Iterable[str], cache_file: Path) -> Iterator[str]:
+    """Pass segments through while writing them to a temp file; publish it only when complete."""
+    tmp = None
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=str(cache_file.parent), suffix=".tmp")
+        tmp = os.fdopen(fd, "w", encoding="utf-8")
+    except Exception as e:
+        logger.debug(f"text cache disabled: {e}")
+        tmp = None
+    completed = False
+    try:
+        for seg in segments:
+            seg = seg.replace(_SEGMENT_SEP, " ")
+            if tmp is not None:
+                tmp.write(seg + _SEGMENT_SEP)
+            yield seg
+        completed = True
+    finally:
+        if tmp is not None:
+            tmp.close()
+            try:
+                if completed:
+                    os.replace(tmp_name, cache_file)
+                else:
+                    os.unlink(tmp_name)
+            except Exception:
+                pass
+            if completed:
+                _prune_cache(cache_file.parent)
+
+
+def _iter_segments_uncached(path: Path) -> Iterator[str]:
+    suffix = path.suffix.lower()
+    if suffix == ".pdf":
+        found = False
+        for page in iter_pdf_pages(path):
+            found = True
+            yield page
+        if not found:
+            # fallback
+            text = read_text_best_effort(path)
+            if text:
+                yield text
+        return
+    if suffix == ".docx":
+        try:
+            import docx  # python-docx
+            doc = docx.Document(str(path))
+            paras = (p.text for p in doc.paragraphs if p.text)
+            first = next(paras, None)
+            if first is not None:
+                yield first
+                yield from paras
+                return
+        except Exception:
+            pass
+        text = read_text_best_effort(path)
+        if text:
+            yield text
+        return
+    text = extract_text_from_html(path) if suffix in {".html", ".htm"} else ""
+    text = text or read_text_best_effort(path)
+    if text:
+        yield text
+
+
+def iter_text_from_uri(uri: str) -> Iterator[str]:
+    """
+    Stream extracted text as segments (PDF pages, DOCX paragraphs, or one segment for
+    plain files). Results for PDF/DOCX are cached on disk by file hash, so re-indexing an
+    unchanged attachment skips parsing entirely.
+    """
+    path = _resolve_path(uri)
+    if not path or not path.exists() or not path.is_file():
+        logger.debug(f"Path not found for extraction: {uri}")
+        return
+    if path.suffix.lower() not in {".pdf", ".docx"} or os.getenv("RAG_TEXT_CACHE", "true").lower() in ("0", "false", "no"):
+        yield from _iter_segments_uncached(path)
+        return
+    try:
+        cache_file = _cache_dir() / f"{_file_digest(path)}.v{_CACHE_VERSION}.txt"
+    except Exception:
+        yield from _iter_segments_uncached(path)
+        return
+    if cache_file.exists():
+        try:
+            # Mark as recently used for _prune_cache
+            os.utime(cache_file)
+        except OSError:
+            pass
+        emitted = 0
+        try:
+            for seg in _iter_cached_segments(cache_file):
+                emitted += 1
+                yield seg
+            return
+        except Exception as e:
+            logger.debug(f"text cache read failed for {cache_file}: {e}")
+            if emitted:
+                return
+    yield from _iter_and_cache(_iter_segments_uncached(path), cache_file)
+
+
 def extract_text_from_uri(uri: str, mime_hint: Optional[str] = None) -> str:
     """
     Minimal extractor:
     - If .txt/.md/.csv/.json/.xml: read as text
-    - If .pdf: attempt PyPDF2
-    - If .docx: python-docx
+    - If .pdf: pypdf, page by page (cached by file hash)
+    - If .docx: python-docx (cached by file hash)
     - If .html/.htm: BeautifulSoup strip
     - Else: best-effort text read
     """
@@ -96,16 +277,10 @@ def extract_text_from_uri(uri: str, mime_hint: Optional[str] = None) -> str:
     if suffix in {".txt", ".md", ".csv", ".json", ".xml"}:
         return read_text_best_effort(path)
     if suffix == ".pdf":
-        text = extract_text_from_pdf(path)
-        if text:
-            return text
-        # fallback
-        return read_text_best_effort(path)
+        # Includes the plain-read fallback; served from the extraction cache when warm
+        return "\n\n".join(iter_text_from_uri(uri))
     if suffix == ".docx":
-        text = extract_text_from_docx(path)
-        if text:
-            return text
-        return read_text_best_effort(path)
+        return "\n".join(iter_text_from_uri(uri))
     if suffix in {".html", ".htm"}:
         text = extract_text_from_html(path)
         if text:
@@ -0,0 +1,58 @@
+"""
+Local token counting for prompt budgeting.
+
+Uses a cached tiktoken encoding (``RAG_TOKENIZER_ENCODING``, default ``cl100k_base``)
+when available and falls back to the ~4 characters per token estimate otherwise, so
+budgeting keeps working without the optional dependency or its BPE files.
+"""
+from functools import lru_cache
+import logging
+import os
+
+try:
+    import tiktoken  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    tiktoken = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+_CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=4)
+def _encoding(name: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f"tokenizer {name} unavailable, estimating tokens from length: {e}")
+        return None
+
+
+def get_encoding():
+    return _encoding(os.getenv("RAG_TOKENIZER_ENCODING", "cl100k_base"))
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """Token count of ``text``; retrieved chunks repeat across chats, so counts are memoized."""
+    if not text:
+        return 0
+    enc = get_encoding()
+    if enc is None:
+        return -(-len(text) // _CHARS_PER_TOKEN)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of ``text`` that fits in ``max_tokens``."""
+    if max_tokens <= 0 or not text:
+        return ""
+    enc = get_encoding()
+    if enc is None:
+        return text[: max_tokens * _CHARS_PER_TOKEN]
+    ids = enc.encode(text, disallowed_special=())
+    if len(ids) <= max_tokens:
+        return text
+    return enc.decode(ids[:max_tokens])
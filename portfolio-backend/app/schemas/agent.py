@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional, List, Any, Dict
+from typing import Optional, List, Any, Dict, Literal
 from pydantic import BaseModel, ConfigDict, Field
 
 
@@ -71,8 +71,10 @@ class AgentBase(BaseModel):
     top_k: int = 8
     score_threshold: Optional[float] = None
     max_context_tokens: int = 4000
-    rerank_provider: Optional[str] = None
+    retrieval_mode: Literal["vector", "hybrid"] = "vector"
+    rerank_provider: Optional[str] = None  # bm25 | cross-encoder
     rerank_model: Optional[str] = None
+    rerank_candidates: Optional[int] = Field(default=None, ge=1, le=200)
     chat_model: Optional[str] = None
     is_active: bool = True
     usage_limit: Optional[int] = None
@@ -91,8 +93,10 @@ class AgentUpdate(BaseModel):
     top_k: Optional[int] = None
     score_threshold: Optional[float] = None
     max_context_tokens: Optional[int] = None
-    rerank_provider: Optional[str] = None
+    retrieval_mode: Optional[Literal["vector", "hybrid"]] = None
+    rerank_provider: Optional[str] = None  # bm25 | cross-encoder
     rerank_model: Optional[str] = None
+    rerank_candidates: Optional[int] = Field(default=None, ge=1, le=200)
     chat_model: Optional[str] = None
     is_active: Optional[bool] = None
     usage_limit: Optional[int] = None
@@ -0,0 +1,146 @@
+"""
+In-process TTL cache for the chat hot path.
+
+Holds the resolved agent/credential/template bundle, decrypted API keys and language
+lookups so repeated chats skip the setup queries and the ``pgp_sym_decrypt`` round-trip.
+
+Cached ORM objects are transient snapshots (column values copied, no session), so they
+are safe to share across requests and threads. Entries expire after
+``AGENT_CACHE_TTL_SECONDS`` (default 300; 0 disables the cache).
+
+Agent, credential and template writes call :func:`invalidate_agent_cache`, which clears
+the local cache and publishes on the ``agent_cache:invalidate`` Redis channel; every
+worker subscribes lazily on first use so all processes stay coherent.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import inspect as sa_inspect
+
+logger = logging.getLogger(__name__)
+
+_CHANNEL = "agent_cache:invalidate"
+
+_lock = threading.Lock()
+_entries: Dict[Tuple[Any, ...], Tuple[float, Any]] = {}
+# Bumped on every clear so a load racing an invalidation is not stored
+_generation = 0
+# None = not started, False = no Redis (local invalidation only)
+_subscriber: Any = None
+_redis = None
+
+
+def _ttl() -> float:
+    try:
+        return float(os.getenv("AGENT_CACHE_TTL_SECONDS", "300"))
+    except ValueError:
+        return 300.0
+
+
+def snapshot(obj: Any) -> Any:
+    """Detached copy of a mapped instance carrying only its column values."""
+    if obj is None:
+        return None
+    mapper = sa_inspect(obj).mapper
+    values = {attr.key: getattr(obj, attr.key) for attr in mapper.column_attrs}
+    return mapper.class_(**values)
+
+
+def get_or_load(key: Tuple[Any, ...], loader: Callable[[], Any]) -> Any:
+    """Return the cached value for ``key`` or call ``loader`` and cache its result.
+
+    Exceptions from ``loader`` propagate and are never cached.
+    """
+    ttl = _ttl()
+    if ttl <= 0:
+        return loader()
+    _ensure_subscriber()
+    now = time.monotonic()
+    with _lock:
+        hit = _entries.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+        gen = _generation
+    value = loader()
+    with _lock:
+        if gen == _generation:
+            _entries[key] = (now + ttl, value)
+    return value
+
+
+def key_fingerprint(encrypted: Optional[str]) -> str:
+    # Keyed on the ciphertext so a rotated key never serves the old plaintext
+    return hashlib.sha256((encrypted or "").encode("utf-8")).hexdigest()
+
+
+def clear_local() -> None:
+    global _generation
+    with _lock:
+        _entries.clear()
+        _generation += 1
+
+
+def invalidate_agent_cache() -> None:
+    """Drop cached bundles/keys here and in every other worker."""
+    clear_local()
+    client = _redis_client()
+    if client:
+        try:
+            client.publish(_CHANNEL, "all")
+        except Exception as e:
+            logger.debug(f"agent cache invalidation publish failed: {e}")
+
+
+def _redis_client():
+    global _redis
+    if _redis is not None:
+        return _redis
+    if not os.getenv("REDIS_URL"):
+        _redis = False
+        return _redis
+    try:
+        from redis import Redis
+        client = Redis.from_url(os.environ["REDIS_URL"], decode_responses=True, socket_timeout=5)
+        client.ping()
+        _redis = client
+    except Exception as e:
+        logger.warning(f"agent cache redis unavailable, invalidation stays local: {e}")
+        _redis = False
+    return _redis
+
+
+def _listen(client) -> None:
+    while True:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(_CHANNEL)
+            # Anything cached before (re)subscribing may have missed a message
+            clear_local()
+            for _ in pubsub.listen():
+                clear_local()
+        except Exception as e:
+            logger.debug(f"agent cache subscriber reconnecting: {e}")
+            clear_local()
+            time.sleep(1.0)
+
+
+def _ensure_subscriber() -> None:
+    global _subscriber
+    if _subscriber is not None:
+        return
+    with _lock:
+        if _subscriber is not None:
+            return
+        client = _redis_client()
+        if not client:
+            _subscriber = False
+            return
+        from redis import Redis
+        # Blocking listener needs its own connection without a read timeout
+        listener = Redis.from_url(os.environ["REDIS_URL"], decode_responses=True)
+        _subscriber = threading.Thread(target=_listen, args=(listener,), name="agent-cache-invalidate", daemon=True)
+        _subscriber.start()
@@ -6,7 +6,8 @@ Provides caching layer to reduce redundant LLM calls and improve response times.
 import hashlib
 import json
 import os
-from typing import Optional, Dict, Any, List
+from array import array
+from typing import Optional, Dict, Any, List, Tuple, Iterable
 from redis import Redis
 from redis.connection import ConnectionPool
 import logging
@@ -26,6 +27,13 @@ class CacheService:
             socket_timeout=5,
             decode_responses=True
         )
+        # Binary values (packed float32 vectors) need a client that does not decode responses
+        self.binary_pool = ConnectionPool.from_url(
+            redis_url,
+            max_connections=20,
+            socket_connect_timeout=5,
+            socket_timeout=5,
+        )
         self._enabled = os.getenv("CACHE_ENABLED", "true").lower() == "true"
         logger.info(f"Cache service initialized (enabled: {self._enabled})")
     
@@ -40,27 +48,68 @@ class CacheService:
         payload = f"{prefix}:" + ":".join(f"{k}={v}" for k, v in sorted_items)
         hash_digest = hashlib.sha256(payload.encode()).hexdigest()[:16]
         return f"{prefix}:{hash_digest}"
+
+    @staticmethod
+    def _gen_key(scope: str, scope_id: Any) -> str:
+        # Unscoped entries (no portfolio) share the "all" generation
+        return f"cache_gen:{scope}:{scope_id if scope_id not in (None, '') else 'all'}"
+
+    def _generations(self, client: Redis, agent_id: Optional[int], portfolio_id: Optional[int]) -> Dict[str, str]:
+        """Current agent/portfolio generations, fetched in one round-trip and baked into keys."""
+        agent_gen, portfolio_gen = client.mget(
+            self._gen_key("agent", agent_id),
+            self._gen_key("portfolio", portfolio_id),
+        )
+        return {"agent_gen": agent_gen or "0", "portfolio_gen": portfolio_gen or "0"}
+
+    def cache_generations(self, agent_id: Optional[int], portfolio_id: Optional[int]) -> Optional[Dict[str, str]]:
+        """Generations to read an answer under and to cache the fresh answer under afterwards.
+
+        Read once before the lookup, so an invalidation during the LLM call leaves the answer under
+        the superseded generation. ``None`` when Redis is unreachable.
+        """
+        if not self._enabled:
+            return {"agent_gen": "0", "portfolio_gen": "0"}
+        try:
+            return self._generations(self._get_client(), agent_id, portfolio_id)
+        except Exception as e:
+            logger.warning(f"Cache generation read error: {e}")
+            return None
+
+    def _bump(self, scope: str, scope_id: Any) -> int:
+        """Move a scope to a new generation; keys built on the old one become unreachable and expire by TTL."""
+        if not self._enabled:
+            return 0
+        try:
+            gen = int(self._get_client().incr(self._gen_key(scope, scope_id)))
+            logger.debug(f"Cache generation for {scope} {scope_id} is now {gen}")
+            return gen
+        except Exception as e:
+            logger.warning(f"Cache invalidation error: {e}")
+            return 0
     
     def get_agent_response(
         self,
         agent_id: int,
         user_message: str,
         portfolio_id: Optional[int] = None,
-        language_id: Optional[int] = None
+        language_id: Optional[int] = None,
+        generations: Optional[Dict[str, str]] = None
     ) -> Optional[Dict[str, Any]]:
-        """Get cached agent response."""
+        """Get cached agent response (under ``generations`` from ``cache_generations``, else the current ones)."""
         if not self._enabled:
             return None
         
         try:
+            client = self._get_client()
             key = self._generate_key(
                 "agent_chat",
                 agent_id=agent_id,
                 message=user_message.lower().strip(),
                 portfolio=portfolio_id or "",
-                lang=language_id or ""
+                lang=language_id or "",
+                **(generations or self._generations(client, agent_id, portfolio_id))
             )
-            client = self._get_client()
             cached = client.get(key)
             
             if cached:
@@ -80,21 +129,23 @@ class CacheService:
         response: Dict[str, Any],
         portfolio_id: Optional[int] = None,
         language_id: Optional[int] = None,
-        ttl_seconds: int = 3600
+        ttl_seconds: int = 3600,
+        generations: Optional[Dict[str, str]] = None
     ) -> bool:
-        """Cache agent response with TTL."""
+        """Cache agent response with TTL (under ``generations`` read before the lookup, else the current ones)."""
         if not self._enabled:
             return False
         
         try:
+            client = self._get_client()
             key = self._generate_key(
                 "agent_chat",
                 agent_id=agent_id,
                 message=user_message.lower().strip(),
                 portfolio=portfolio_id or "",
-                lang=language_id or ""
+                lang=language_id or "",
+                **(generations or self._generations(client, agent_id, portfolio_id))
             )
-            client = self._get_client()
             client.setex(key, ttl_seconds, json.dumps(response))
             logger.debug(f"Cached response for agent {agent_id} (TTL: {ttl_seconds}s)")
             return True
@@ -102,44 +153,17 @@ class CacheService:
             logger.warning(f"Cache set error: {e}")
             return False
     
-    def invalidate_portfolio(self, portfolio_id: int) -> int:
-        """Invalidate all cached responses for a portfolio."""
-        if not self._enabled:
-            return 0
-        
-        try:
-            client = self._get_client()
-            pattern = f"agent_chat:*portfolio={portfolio_id}*"
-            keys = client.keys(pattern)
-            
-            if keys:
-                deleted = client.delete(*keys)
-                logger.info(f"Invalidated {deleted} cached responses for portfolio {portfolio_id}")
-                return deleted
-            return 0
-        except Exception as e:
-            logger.warning(f"Cache invalidation error: {e}")
-            return 0
-    
+    def invalidate_portfolio(self, portfolio_id: Optional[int]) -> int:
+        """Invalidate all cached responses and RAG results for a portfolio (a single INCR).
+
+        ``None`` invalidates entries cached without a portfolio scope. Returns the new generation.
+        """
+        return self._bump("portfolio", portfolio_id)
+
     def invalidate_agent(self, agent_id: int) -> int:
-        """Invalidate all cached responses for an agent."""
-        if not self._enabled:
-            return 0
-        
-        try:
-            client = self._get_client()
-            pattern = f"agent_chat:*agent_id={agent_id}*"
-            keys = client.keys(pattern)
-            
-            if keys:
-                deleted = client.delete(*keys)
-                logger.info(f"Invalidated {deleted} cached responses for agent {agent_id}")
-                return deleted
-            return 0
-        except Exception as e:
-            logger.warning(f"Cache invalidation error: {e}")
-            return 0
-    
+        """Invalidate all cached responses for an agent (a single INCR). Returns the new generation."""
+        return self._bump("agent", agent_id)
+
     def get_rag_chunks(
         self,
         query: str,
@@ -151,13 +175,14 @@ class CacheService:
             return None
         
         try:
+            client = self._get_client()
             key = self._generate_key(
                 "rag_chunks",
                 query=query.lower().strip(),
                 portfolio=portfolio_id or "",
-                k=top_k
+                k=top_k,
+                portfolio_gen=self._generations(client, None, portfolio_id)["portfolio_gen"]
             )
-            client = self._get_client()
             cached = client.get(key)
             
             if cached:
@@ -181,13 +206,14 @@ class CacheService:
             return False
         
         try:
+            client = self._get_client()
             key = self._generate_key(
                 "rag_chunks",
                 query=query.lower().strip(),
                 portfolio=portfolio_id or "",
-                k=top_k
+                k=top_k,
+                portfolio_gen=self._generations(client, None, portfolio_id)["portfolio_gen"]
             )
-            client = self._get_client()
             client.setex(key, ttl_seconds, json.dumps(chunks))
             logger.debug(f"Cached RAG chunks (TTL: {ttl_seconds}s)")
             return True
@@ -195,6 +221,86 @@ class CacheService:
             logger.warning(f"RAG cache set error: {e}")
             return False
     
+    def get_query_embedding(self, model: str, query: str) -> Optional[List[float]]:
+        """Get a cached query embedding stored as packed float32."""
+        if not self._enabled:
+            return None
+
+        try:
+            key = self._generate_key("query_embed", model=model, query=query)
+            raw = Redis(connection_pool=self.binary_pool).get(key)
+            if not raw:
+                return None
+            vec = array("f")
+            vec.frombytes(raw)
+            return vec.tolist()
+        except Exception as e:
+            logger.warning(f"Query embedding cache get error: {e}")
+            return None
+
+    def set_query_embedding(
+        self,
+        model: str,
+        query: str,
+        vector: List[float],
+        ttl_seconds: int = 86400
+    ) -> bool:
+        """Cache a query embedding as packed float32 (4 bytes per dimension)."""
+        if not self._enabled:
+            return False
+
+        try:
+            key = self._generate_key("query_embed", model=model, query=query)
+            Redis(connection_pool=self.binary_pool).setex(key, ttl_seconds, array("f", vector).tobytes())
+            return True
+        except Exception as e:
+            logger.warning(f"Query embedding cache set error: {e}")
+            return False
+
+    def get_user_permissions(self, user_id: int) -> Tuple[Optional[str], Optional[List[str]]]:
+        """Current permissions generation and the user's effective permissions, in one round-trip.
+
+        Returns ``(None, None)`` when the cache is disabled or unreachable; the permissions are
+        ``None`` unless they were cached under the current generation.
+        """
+        if not self._enabled:
+            return None, None
+
+        try:
+            gen, raw = self._get_client().mget(self._gen_key("permissions", None), f"authz:user:{user_id}")
+            gen = gen or "0"
+            if raw:
+                entry = json.loads(raw)
+                if entry.get("gen") == gen:
+                    return gen, entry.get("permissions", [])
+            return gen, None
+        except Exception as e:
+            logger.warning(f"Permission cache get error: {e}")
+            return None, None
+
+    def set_user_permissions(
+        self,
+        user_id: int,
+        generation: str,
+        permissions: Iterable[str],
+        ttl_seconds: int = 60
+    ) -> bool:
+        """Cache a user's effective permissions under the generation they were computed for."""
+        if not self._enabled:
+            return False
+
+        try:
+            entry = {"gen": generation, "permissions": sorted(permissions)}
+            self._get_client().setex(f"authz:user:{user_id}", ttl_seconds, json.dumps(entry))
+            return True
+        except Exception as e:
+            logger.warning(f"Permission cache set error: {e}")
+            return False
+
+    def invalidate_permissions(self) -> int:
+        """Invalidate every cached permission set (a single INCR). Returns the new generation."""
+        return self._bump("permissions", None)
+
     def health_check(self) -> bool:
         """Check if Redis connection is healthy."""
         try:
@@ -1,15 +1,24 @@
 from __future__ import annotations
 from typing import Dict, Any, List, Tuple, Optional
+from dataclasses import dataclass, field
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from app.models.agent import Agent, AgentCredential, AgentTemplate, AgentSession, AgentMessage, AgentTestRun
 from app.models.language import Language
-from app.services.llm.providers import build_provider
-from app.services.rag_service import embed_query, vector_search, assemble_context
+from app.services.llm.providers import get_provider
+from app.services.rag_service import embed_query, retrieve_chunks, assemble_context
 from app.services.prompt_builder import build_rag_prompt, build_fallback_prompt, extract_conversational_history
-from app.services.citation_service import enrich_citations, deduplicate_citations
+from app.services.citation_service import enrich_citations, deduplicate_citations, peek_cached_metadata
 from app.services.cache_service import cache_service
+from app.services import agent_cache
+from app.rag.answer_cache import lookup_answer, store_answer
 from app.services.query_complexity import analyze_query_complexity
+from app.observability.timing import StageTimer
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from sqlalchemy.orm import Session as _StageSession
+from contextlib import nullcontext
+from time import perf_counter
+import logging
 import os
 import re
 
@@ -607,6 +616,11 @@ def _build_structured_portfolio_context(
 
 
 def _get_agent_bundle(db: Session, agent_id: int, template_id: Optional[int] = None) -> Tuple[Agent, AgentCredential, AgentTemplate]:
+    """Cached (agent, credential, template); entries are detached snapshots."""
+    return agent_cache.get_or_load(("bundle", agent_id, template_id), lambda: _load_agent_bundle(db, agent_id, template_id))
+
+
+def _load_agent_bundle(db: Session, agent_id: int, template_id: Optional[int] = None) -> Tuple[Agent, AgentCredential, AgentTemplate]:
     agent = db.query(Agent).filter(Agent.id == agent_id, Agent.is_active == True).first()
     if not agent:
         raise ValueError("Agent not found or inactive")
@@ -624,7 +638,8 @@ def _get_agent_bundle(db: Session, agent_id: int, template_id: Optional[int] = N
     if not tpl:
         # Provide a default one-off template when not configured
         tpl = AgentTemplate(agent_id=agent.id, system_prompt="You are a helpful assistant that answers strictly from the provided context. If the context does not contain the answer, say you don't know.")
-    return agent, cred, tpl
+        return agent_cache.snapshot(agent), agent_cache.snapshot(cred), tpl
+    return agent_cache.snapshot(agent), agent_cache.snapshot(cred), agent_cache.snapshot(tpl)
 
 
 def _build_context_only_answer(user_message: str, context_text: str, citations: List[Dict[str, Any]], language_code: str = "en") -> str:
@@ -667,6 +682,24 @@ def _decrypt_api_key(db: Session, encrypted: str) -> str:
     return CredentialService.decrypt_api_key(db, encrypted)
 
 
+def _cached_api_key(db: Session, cred: AgentCredential) -> str:
+    """Decrypted key for ``cred``, cached per ciphertext; failures fall through uncached."""
+    if not cred.api_key_encrypted:
+        return ""
+    key = ("api_key", cred.id, agent_cache.key_fingerprint(cred.api_key_encrypted))
+    return agent_cache.get_or_load(key, lambda: _decrypt_api_key(db, cred.api_key_encrypted))
+
+
+def _lookup_language(db: Session, language_id: int) -> Optional[Tuple[Optional[str], str]]:
+    """(name, code) for a language id, cached; None when it does not exist."""
+    def _load() -> Optional[Tuple[Optional[str], str]]:
+        language = db.query(Language).filter(Language.id == language_id).first()
+        if not language:
+            return None
+        return language.name, (language.code if hasattr(language, 'code') and language.code else "en")
+    return agent_cache.get_or_load(("language", language_id), _load)
+
+
 def _resolve_portfolio_id(db: Session, provided_id: Optional[int], portfolio_query: Optional[str]) -> Optional[int]:
     if provided_id is not None:
         return provided_id
@@ -690,6 +723,148 @@ def _resolve_portfolio_id(db: Session, provided_id: Optional[int], portfolio_que
     return None
 
 
+logger = logging.getLogger(__name__)
+
+# The query embedding runs here while the request thread loads the history, resolves the
+# portfolio and checks the exact-match cache on the request session. The embed stage's session is
+# lazy: it checks out a connection only when a query-embedding cache miss falls back to a
+# credential lookup. Citation enrichment runs here during the LLM call on the async paths, after
+# the request connection was released (ChatPlan.start_enrichment). A chat therefore holds one
+# connection at a time in the common case; DB_POOL_SIZE + DB_MAX_OVERFLOW should cover
+# concurrent chats plus CHAT_STAGE_WORKERS.
+_stage_pool = ThreadPoolExecutor(max_workers=int(os.getenv("CHAT_STAGE_WORKERS", "16")), thread_name_prefix="chat-stage")
+
+
+def _stage_timeout(stage: str, default: float) -> float:
+    return float(os.getenv(f"CHAT_STAGE_TIMEOUT_{stage.upper()}", str(default)))
+
+
+def _submit_stage(db: Session, timer: StageTimer, stage: str, fn, *args) -> Future:
+    bind = db.get_bind()
+
+    def _run():
+        with timer.stage(stage), _StageSession(bind=bind) as stage_db:
+            return fn(stage_db, *args)
+
+    return _stage_pool.submit(_run)
+
+
+def _stage_result(future: Optional[Future], stage: str, timeout: float, default: Any, *, propagate: bool = False) -> Any:
+    """Wait for a stage; on timeout (or error unless ``propagate``) degrade to ``default``."""
+    if future is None:
+        return default
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        logger.warning(f"chat stage {stage} timed out after {timeout}s")
+        future.cancel()
+        return default
+    except Exception:
+        if propagate:
+            raise
+        logger.exception(f"chat stage {stage} failed")
+        return default
+
+
+def _embed_stage(stage_db: Session, provider, embedding_model: str, query: str) -> List[float]:
+    return embed_query(stage_db, provider=provider, embedding_model=embedding_model, query=query)
+
+
+def _semantic_generation(generations: Optional[Dict[str, str]]) -> str:
+    # Semantic cache rows are only served while both generations they were answered under are current
+    return f"{generations['agent_gen']}:{generations['portfolio_gen']}" if generations else ""
+
+
+def _enrich_stage(stage_db: Session, citations: List[Dict[str, Any]], language_id: Optional[int]) -> List[Dict[str, Any]]:
+    # Deduplicate to avoid showing same source multiple times
+    return deduplicate_citations(enrich_citations(stage_db, citations, language_id=language_id))
+
+
+def _load_history(db: Session, session_id: int) -> List[Dict[str, str]]:
+    recent_msgs = db.query(AgentMessage)\
+        .filter(AgentMessage.session_id == session_id)\
+        .order_by(AgentMessage.id.desc())\
+        .limit(6)\
+        .all()
+    return extract_conversational_history(list(reversed(recent_msgs)), max_turns=3)
+
+
+@dataclass
+class ChatPlan:
+    """Outcome of the pre-LLM chat stages.
+
+    Either ``response`` is set (answered without the LLM: blocked, cached, conversational or
+    no context; already persisted), or the plan carries the prompt for the LLM call.
+    """
+    agent_id: int
+    session_id: Optional[int]
+    user_message: str
+    language_code: str
+    response: Optional[Dict[str, Any]] = None
+    agent: Optional[Agent] = None
+    provider: Any = None
+    chat_model: str = ""
+    system_prompt: Optional[str] = None
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    context: str = ""
+    citations: List[Dict[str, Any]] = field(default_factory=list)
+    portfolio_id: Optional[int] = None
+    language_id: Optional[int] = None
+    qvec: Optional[List[float]] = None
+    # Only a conversation's opening question may reuse (or seed) a semantically cached answer
+    semantic_cacheable: bool = False
+    # Cache generations read before the lookups; the answer is cached under these, not current ones
+    cache_generations: Optional[Dict[str, str]] = None
+    enrich_future: Optional[Future] = None
+
+    def start_enrichment(self, db: Session, timer: StageTimer) -> None:
+        """Load display metadata on the stage pool while the LLM answers.
+
+        Only for callers that released the request connection for the LLM call.
+        """
+        if self.citations and self.enrich_future is None:
+            self.enrich_future = _submit_stage(db, timer, "enrich", _enrich_stage, self.citations, self.language_id)
+
+    def enriched_citations(self, db: Session, timer: Optional[StageTimer] = None) -> List[Dict[str, Any]]:
+        """Citations with display metadata: the overlapped stage's result, else loaded on ``db``."""
+        if not self.citations:
+            return []
+        overlapped = _stage_result(self.enrich_future, "enrich", _stage_timeout("enrich", 3.0), None)
+        if overlapped is not None:
+            return overlapped
+        try:
+            with (timer.stage("enrich") if timer else nullcontext()), db.begin_nested():
+                return _enrich_stage(db, self.citations, self.language_id)
+        except Exception:
+            # Use basic citations if enrichment fails
+            logger.exception("citation enrichment failed")
+            return self.citations
+
+
+def _persist_exchange(
+    db: Session,
+    *,
+    agent_id: int,
+    session_id: Optional[int],
+    user_message: str,
+    answer: str,
+    citations: List[Dict[str, Any]],
+    tokens: Optional[int] = 0,
+    latency_ms: Optional[int] = 0,
+) -> int:
+    """Store the user/assistant pair (creating the session if needed) and commit."""
+    sess_id = session_id
+    if not sess_id:
+        s = AgentSession(agent_id=agent_id)
+        db.add(s)
+        db.flush()
+        sess_id = s.id
+    db.add(AgentMessage(session_id=sess_id, role="user", content=user_message))
+    db.add(AgentMessage(session_id=sess_id, role="assistant", content=answer, citations=citations, tokens=tokens, latency_ms=latency_ms))
+    db.commit()
+    return sess_id
+
+
 def run_agent_chat(
     db: Session,
     *,
@@ -701,7 +876,61 @@ def run_agent_chat(
     portfolio_query: Optional[str] = None,
     language_id: Optional[int] = None,
     raise_on_provider_error: bool = False,
+    timer: Optional[StageTimer] = None,
 ) -> Dict[str, Any]:
+    """Answer ``user_message`` with the agent; stage latencies go to ``timer`` (and Prometheus)."""
+    timer = timer or StageTimer(agent_id=agent_id)
+    try:
+        plan = prepare_chat(
+            db,
+            agent_id=agent_id,
+            user_message=user_message,
+            session_id=session_id,
+            template_id=template_id,
+            portfolio_id=portfolio_id,
+            portfolio_query=portfolio_query,
+            language_id=language_id,
+            timer=timer,
+        )
+        if plan.response is not None:
+            return plan.response
+        try:
+            with timer.stage("llm"):
+                result = plan.provider.chat(model=plan.chat_model, system_prompt=plan.system_prompt, messages=plan.messages)
+        except Exception as e:
+            if raise_on_provider_error:
+                # Ensure we don't continue in an aborted transaction state
+                try:
+                    db.rollback()
+                except Exception:
+                    pass
+                raise RuntimeError(f"Provider chat call failed for agent {agent_id}: {e}") from e
+            return provider_failure_response(db, plan)
+        return finish_chat(
+            db,
+            plan,
+            answer=result.get("text") or "",
+            usage=result.get("usage") or {},
+            latency_ms=result.get("latency_ms") or 0,
+            timer=timer,
+        )
+    finally:
+        timer.observe()
+
+
+def prepare_chat(
+    db: Session,
+    *,
+    agent_id: int,
+    user_message: str,
+    session_id: int | None,
+    template_id: Optional[int],
+    portfolio_id: Optional[int],
+    portfolio_query: Optional[str],
+    language_id: Optional[int],
+    timer: StageTimer,
+) -> ChatPlan:
+    """Run every chat stage before the LLM call (shared by the blocking and streaming paths)."""
     # Always ensure we begin in a clean transaction state
     try:
         db.rollback()
@@ -713,7 +942,7 @@ def run_agent_chat(
     # If direct current_setting use is not configured, fall back to env var
     api_key: str
     try:
-        api_key = _decrypt_api_key(db, cred.api_key_encrypted) if cred.api_key_encrypted else ""
+        api_key = _cached_api_key(db, cred)
     except Exception:
         api_key = ""
     # Fallback to env if decryption failed or produced empty key
@@ -725,17 +954,16 @@ def run_agent_chat(
             "No API key configured for provider. Either create a credential (requires AGENT_KMS_KEY) or set OPENAI_API_KEY/AGENT_PROVIDER_KEY."
         )
 
-    provider = build_provider(cred.provider, api_key=api_key, base_url=cred.base_url or (cred.extra or {}).get("base_url"), extra=cred.extra or {})
+    provider = get_provider(cred.provider, api_key=api_key, base_url=cred.base_url or (cred.extra or {}).get("base_url"), extra=cred.extra or {}, credential_id=cred.id)
 
     # Fetch language information early so we can use it in all responses
     language_name = None
     language_code = "en"  # Default to English
     if language_id:
         try:
-            language = db.query(Language).filter(Language.id == language_id).first()
+            language = _lookup_language(db, language_id)
             if language:
-                language_name = language.name
-                language_code = language.code if hasattr(language, 'code') and language.code else "en"
+                language_name, language_code = language
         except Exception:
             # If language fetch fails, continue with defaults
             try:
@@ -745,32 +973,53 @@ def run_agent_chat(
     else:
         language_code = _infer_language_code(user_message, default="en")
         language_name = "Spanish" if language_code == "es" else "English"
+    timer.label(agent_id=agent_id, provider=cred.provider)
+    timer.since_start("setup")
+
+    def _answered(answer: str, citations: List[Dict[str, Any]], *, latency_ms: int = 0, cached: bool = False) -> ChatPlan:
+        sess_id = _persist_exchange(
+            db, agent_id=agent.id, session_id=session_id, user_message=user_message,
+            answer=answer, citations=citations, latency_ms=latency_ms,
+        )
+        response = {
+            "answer": answer,
+            "citations": citations,
+            "token_usage": {},
+            "latency_ms": latency_ms,
+            "session_id": sess_id,
+        }
+        if cached:
+            response["cached"] = True
+        return ChatPlan(agent_id=agent_id, session_id=sess_id, user_message=user_message, language_code=language_code, response=response)
 
     # Defensive prompt-injection handling:
     # - If the message is malicious and has no valid portfolio intent, reject safely.
     # - If it mixes malicious + valid intent, keep only the safe portfolio query.
     safe_user_message = _extract_safe_user_query(user_message)
     if safe_user_message is None:
-        blocked_answer = _get_translation("prompt_injection_blocked", language_code)
-        sess_id = session_id
-        if not sess_id:
-            s = AgentSession(agent_id=agent.id)
-            db.add(s)
-            db.flush()
-            sess_id = s.id
-        db.add(AgentMessage(session_id=sess_id, role="user", content=user_message))
-        db.add(AgentMessage(session_id=sess_id, role="assistant", content=blocked_answer, citations=[], tokens=0, latency_ms=0))
-        db.commit()
-        return {
-            "answer": blocked_answer,
-            "citations": [],
-            "token_usage": {},
-            "latency_ms": 0,
-            "session_id": sess_id,
-        }
+        return _answered(_get_translation("prompt_injection_blocked", language_code), [])
 
     user_message = safe_user_message
 
+    # Conversational queries are handled deterministically and safely.
+    # This avoids non-grounded LLM answers for greetings/meta questions.
+    is_conversational = _is_conversational_query(user_message)
+    asks_for_content = _contains_portfolio_intent(user_message)
+    needs_retrieval = not (is_conversational and not asks_for_content)
+
+    # Start the independent stages now; portfolio resolution and the cache check below overlap them
+    embed_future = _submit_stage(db, timer, "embed", _embed_stage, provider, agent.embedding_model, user_message) if needs_retrieval else None
+
+    def _cancel_stages() -> None:
+        if embed_future is not None:
+            embed_future.cancel()
+
+    # Conversation history for context, on the request session while the embedding runs
+    conversation_history: List[Dict[str, str]] = []
+    if session_id and needs_retrieval:
+        with timer.stage("history"):
+            conversation_history = _load_history(db, session_id)
+
     # Resolve portfolio id from free-text if provided
     effective_portfolio_id = _resolve_portfolio_id(db, portfolio_id, portfolio_query)
 
@@ -779,36 +1028,20 @@ def run_agent_chat(
     
     # Check cache first for ALL queries (including trivial greetings)
     # Caching greetings provides instant responses (<5ms) on repeat
-    cached_response = cache_service.get_agent_response(
-        agent_id=agent_id,
-        user_message=user_message,
-        portfolio_id=effective_portfolio_id,
-        language_id=language_id
-    )
+    with timer.stage("cache"):
+        cache_generations = cache_service.cache_generations(agent_id, effective_portfolio_id)
+        cached_response = cache_service.get_agent_response(
+            agent_id=agent_id,
+            user_message=user_message,
+            portfolio_id=effective_portfolio_id,
+            language_id=language_id,
+            generations=cache_generations,
+        ) if cache_generations else None
     if cached_response:
-        # Return cached response immediately
+        _cancel_stages()
+        # Return cached response immediately (a cache hit is ~5ms)
         answer = _sanitize_agent_answer(cached_response.get("answer", ""), language_code)
-        citations = cached_response.get("citations", [])
-
-        # Save to database session
-        sess_id = session_id
-        if not sess_id:
-            s = AgentSession(agent_id=agent.id)
-            db.add(s)
-            db.flush()
-            sess_id = s.id
-        db.add(AgentMessage(session_id=sess_id, role="user", content=user_message))
-        db.add(AgentMessage(session_id=sess_id, role="assistant", content=answer, citations=citations, tokens=0, latency_ms=5))
-        db.commit()
-
-        return {
-            "answer": answer,
-            "citations": citations,
-            "token_usage": {},
-            "latency_ms": 5,  # Cache hit is ~5ms
-            "session_id": sess_id,
-            "cached": True
-        }
+        return _answered(answer, cached_response.get("citations", []), latency_ms=5, cached=True)
 
     # Note: We intentionally do NOT filter RAG retrieval by language_code here.
     # The agent should be able to access content in ANY language, regardless of which 
@@ -817,22 +1050,9 @@ def run_agent_chat(
     # This ensures the agent can work effectively even when content exists primarily 
     # in one language but the user requests a response in another language.
 
-    # Conversational queries are handled deterministically and safely.
-    # This avoids non-grounded LLM answers for greetings/meta questions.
-    is_conversational = _is_conversational_query(user_message)
-    asks_for_content = _contains_portfolio_intent(user_message)
-    if is_conversational and not asks_for_content:
+    if not needs_retrieval:
         scope_answer = _get_translation("assistant_scope", language_code)
-        sess_id = session_id
-        if not sess_id:
-            s = AgentSession(agent_id=agent.id)
-            db.add(s)
-            db.flush()
-            sess_id = s.id
-        db.add(AgentMessage(session_id=sess_id, role="user", content=user_message))
-        db.add(AgentMessage(session_id=sess_id, role="assistant", content=scope_answer, citations=[], tokens=0, latency_ms=0))
-        db.commit()
-
+        plan = _answered(scope_answer, [])
         cache_service.set_agent_response(
             agent_id=agent_id,
             user_message=user_message,
@@ -840,18 +1060,35 @@ def run_agent_chat(
             portfolio_id=effective_portfolio_id,
             language_id=language_id,
             ttl_seconds=3600,
+            generations=cache_generations,
         )
+        return plan
 
-        return {
-            "answer": scope_answer,
-            "citations": [],
-            "token_usage": {},
-            "latency_ms": 0,
-            "session_id": sess_id,
-        }
-
-    # Embed query and retrieve chunks with dynamic context sizing
-    qvec = embed_query(db, provider=provider, embedding_model=agent.embedding_model, query=user_message)
+    # Embed query (started above) and retrieve chunks with dynamic context sizing.
+    # Provider errors propagate as before; a timeout degrades to the non-vector fallbacks.
+    try:
+        qvec = _stage_result(embed_future, "embed", _stage_timeout("embed", 20.0), None, propagate=True)
+    except Exception:
+        _cancel_stages()
+        raise
+
+    # Paraphrases of an already answered question reuse that answer. Follow-ups are answered in the
+    # light of the conversation ("and the second one?"), so only opening questions qualify.
+    semantic_cacheable = qvec is not None and not conversation_history and cache_generations is not None
+    with timer.stage("cache"):
+        semantic_hit = None if not semantic_cacheable else lookup_answer(
+            db,
+            agent_id=agent_id,
+            portfolio_id=effective_portfolio_id,
+            language_id=language_id,
+            model=agent.embedding_model,
+            qvec=qvec,
+            generation=_semantic_generation(cache_generations),
+        )
+    if semantic_hit:
+        _cancel_stages()
+        answer = _sanitize_agent_answer(semantic_hit["answer"], language_code)
+        return _answered(answer, semantic_hit["citations"], cached=True)
 
     # If the user asks about projects, keep the signal for deterministic fallback retrieval.
     lower_q = (user_message or "").lower()
@@ -863,33 +1100,50 @@ def run_agent_chat(
     
     # Retrieve across all indexed portfolio tables/attachments.
     # Do NOT pass language_code: retrieve source facts in any language and answer in target output language.
-    chunks = vector_search(
-        db,
-        qvec=qvec,
-        model=agent.embedding_model,
-        k=effective_top_k,
-        score_threshold=agent.score_threshold,
-        portfolio_id=effective_portfolio_id,
-        tables_filter=None,
-        language_code=None,
-    )
-    context, citations = assemble_context(chunks, max_tokens=effective_max_tokens)
-    if not context.strip():
-        # Retry vector search with a relaxed threshold before giving up.
-        # This improves recall for portfolio attachments and sparse chunks.
-        retry_k = max(12, effective_top_k)
-        retry_chunks = vector_search(
+    # Hybrid agents fuse full-text and vector hits so exact keywords ("Kubernetes") are not missed.
+    retrieval_mode = getattr(agent, "retrieval_mode", None) or "vector"
+    with timer.stage("search"):
+        chunks = [] if qvec is None else retrieve_chunks(
             db,
+            mode=retrieval_mode,
             qvec=qvec,
+            query_text=user_message,
             model=agent.embedding_model,
-            k=retry_k,
-            score_threshold=None,
+            k=effective_top_k,
+            score_threshold=agent.score_threshold,
             portfolio_id=effective_portfolio_id,
             tables_filter=None,
             language_code=None,
+            rerank_provider=getattr(agent, "rerank_provider", None),
+            rerank_model=getattr(agent, "rerank_model", None),
+            rerank_candidates=getattr(agent, "rerank_candidates", None),
         )
-        context, citations = assemble_context(retry_chunks, max_tokens=effective_max_tokens)
+        context, citations = assemble_context(chunks, max_tokens=effective_max_tokens)
+    retry_k = max(12, effective_top_k)
+    # The retry only differs from the first search if it relaxes the threshold or widens k
+    if not context.strip() and qvec is not None and (agent.score_threshold is not None or retry_k > effective_top_k):
+        # Retry vector search with a relaxed threshold before giving up.
+        # This improves recall for portfolio attachments and sparse chunks.
+        with timer.stage("retry_search"):
+            retry_chunks = retrieve_chunks(
+                db,
+                mode=retrieval_mode,
+                qvec=qvec,
+                query_text=user_message,
+                model=agent.embedding_model,
+                k=retry_k,
+                score_threshold=None,
+                portfolio_id=effective_portfolio_id,
+                tables_filter=None,
+                language_code=None,
+                rerank_provider=getattr(agent, "rerank_provider", None),
+                rerank_model=getattr(agent, "rerank_model", None),
+                rerank_candidates=getattr(agent, "rerank_candidates", None),
+            )
+            context, citations = assemble_context(retry_chunks, max_tokens=effective_max_tokens)
 
+    needs_fallback = not context.strip() and effective_portfolio_id is not None
+    fallback_t0 = perf_counter()
     if not context.strip() and effective_portfolio_id is not None and is_project_query:
         # Deterministic fallback for project-oriented questions when semantic retrieval is empty.
         try:
@@ -943,71 +1197,23 @@ def run_agent_chat(
                 db.rollback()
             except Exception:
                 pass
+    if needs_fallback:
+        timer.record("fallback", perf_counter() - fallback_t0)
 
     if not context.strip():
+        _cancel_stages()
         # Persist session messages even on no-context for traceability
-        sess_id = session_id
-        if not sess_id:
+        if not session_id:
             try:
                 db.rollback()
             except Exception:
                 pass
-            s = AgentSession(agent_id=agent.id)
-            db.add(s)
-            db.flush()
-            sess_id = s.id
-        db.add(AgentMessage(session_id=sess_id, role="user", content=user_message))
-        fallback = build_fallback_prompt(user_message, language_code=language_code)
-        db.add(AgentMessage(session_id=sess_id, role="assistant", content=fallback, citations=[], tokens=0, latency_ms=0))
-        db.commit()
-        return {
-            "answer": fallback,
-            "citations": [],
-            "token_usage": {},
-            "latency_ms": 0,
-            "session_id": sess_id,
-        }
+        return _answered(build_fallback_prompt(user_message, language_code=language_code), [])
+
+    # The prompt labels sources with whatever metadata is already cached (or table #id), in
+    # context order; full enrichment for display happens after the LLM call (finish_chat).
+    prompt_citations = peek_cached_metadata(citations, language_id=language_id)
 
-    # Enrich citations with metadata for user-friendly display
-    # Use a savepoint (nested transaction) to isolate enrichment queries
-    # This prevents metadata query failures from aborting the main transaction
-    enriched_citations = citations  # Default to basic citations
-    savepoint = None
-    try:
-        # Create a savepoint (nested transaction)
-        savepoint = db.begin_nested()
-        enriched_citations = enrich_citations(db, citations, language_id=language_id)
-        # Deduplicate to avoid showing same source multiple times
-        enriched_citations = deduplicate_citations(enriched_citations)
-        # Commit the savepoint if enrichment succeeded
-        savepoint.commit()
-    except Exception as e:
-        # If enrichment fails, rollback ONLY the savepoint (not the main transaction)
-        if savepoint:
-            try:
-                savepoint.rollback()
-            except Exception:
-                pass
-        # Use basic citations without enrichment
-        enriched_citations = citations
-    
-    # Load conversation history for context (if session exists)
-    conversation_history = []
-    if session_id:
-        try:
-            recent_msgs = db.query(AgentMessage)\
-                .filter(AgentMessage.session_id == session_id)\
-                .order_by(AgentMessage.id.desc())\
-                .limit(6)\
-                .all()
-            conversation_history = extract_conversational_history(list(reversed(recent_msgs)), max_turns=3)
-        except Exception:
-            # If history fetch fails, continue without it
-            try:
-                db.rollback()
-            except Exception:
-                pass
-            conversation_history = []
     
     # Build optimized RAG prompt using prompt_builder service
     # (Note: language_name and language_code are already fetched earlier in the function)
@@ -1020,103 +1226,126 @@ def run_agent_chat(
     messages = build_rag_prompt(
         user_message=user_text,
         context=context,
-        citations=enriched_citations,
+        citations=prompt_citations,
         template_style=template_style,
         conversation_history=conversation_history,
         language_name=language_name,
         custom_system_prompt=tpl.system_prompt if hasattr(tpl, 'system_prompt') and tpl.system_prompt else None
     )
 
-    # Choose low-cost default OpenAI chat model per your guidance
-    chat_model = agent.chat_model or "gpt-4o-mini"  # default low-cost model; adjust as needed
-    try:
-        # Extract system prompt from messages if present
-        system_prompt = None
-        chat_messages = messages
-        if messages and messages[0].get('role') == 'system':
-            system_prompt = messages[0]['content']
-            chat_messages = messages[1:]
-        
-        result = provider.chat(model=chat_model, system_prompt=system_prompt, messages=chat_messages)
-    except Exception as e:
-        # Ensure we don't continue in an aborted transaction state
-        try:
-            db.rollback()
-        except Exception:
-            pass
-        if raise_on_provider_error:
-            raise RuntimeError(f"Provider chat call failed for agent {agent_id}: {e}") from e
-        # If we have context, synthesize a deterministic, grounded fallback answer
-        if context.strip():
-            synthesized = _sanitize_agent_answer(
-                _build_context_only_answer(user_message, context, citations, language_code),
-                language_code,
-            )
-            sess_id = session_id
-            if not sess_id:
-                s = AgentSession(agent_id=agent.id)
-                db.add(s)
-                db.flush()
-                sess_id = s.id
-            db.add(AgentMessage(session_id=sess_id, role="user", content=user_message))
-            db.add(AgentMessage(session_id=sess_id, role="assistant", content=synthesized, citations=enriched_citations, tokens=0, latency_ms=0))
-            db.commit()
-            return {
-                "answer": synthesized,
-                "citations": enriched_citations,
-                "token_usage": {},
-                "latency_ms": 0,
-                "session_id": sess_id,
-            }
-        # Otherwise, return a graceful error that fits the API envelope to avoid frontend timeouts
-        fail_text = _get_translation("provider_error", language_code)
-        sess_id = session_id
-        if not sess_id:
-            s = AgentSession(agent_id=agent.id)
-            db.add(s)
-            db.flush()
-            sess_id = s.id
-        db.add(AgentMessage(session_id=sess_id, role="user", content=user_message))
-        db.add(AgentMessage(session_id=sess_id, role="assistant", content=fail_text, citations=[], tokens=0, latency_ms=0))
-        db.commit()
-        return {
-            "answer": fail_text,
-            "citations": [],
-            "token_usage": {},
-            "latency_ms": 0,
-            "session_id": sess_id,
-        }
+    # Extract system prompt from messages if present
+    system_prompt = None
+    chat_messages = messages
+    if messages and messages[0].get('role') == 'system':
+        system_prompt = messages[0]['content']
+        chat_messages = messages[1:]
 
-    # Persist minimal session/message if requested
-    sess_id = session_id
-    if not sess_id:
-        s = AgentSession(agent_id=agent.id)
-        db.add(s)
-        db.flush()
-        sess_id = s.id
-    m_user = AgentMessage(session_id=sess_id, role="user", content=user_message)
-    db.add(m_user)
-    assistant_text = _sanitize_agent_answer(result.get("text") or "", language_code)
-    m_assist = AgentMessage(session_id=sess_id, role="assistant", content=assistant_text, citations=enriched_citations, tokens=(result.get("usage") or {}).get("total_tokens"), latency_ms=result.get("latency_ms"))
-    db.add(m_assist)
-    db.commit()
-
-    # Cache the response for future queries (cache ALL responses including greetings)
-    # This ensures second "Hello" takes <5ms instead of 4+ seconds
-    cache_service.set_agent_response(
+    return ChatPlan(
         agent_id=agent_id,
+        session_id=session_id,
         user_message=user_message,
-        response={"answer": assistant_text, "citations": enriched_citations},
+        language_code=language_code,
+        agent=agent,
+        provider=provider,
+        # Choose low-cost default OpenAI chat model per your guidance
+        chat_model=agent.chat_model or "gpt-4o-mini",
+        system_prompt=system_prompt,
+        messages=chat_messages,
+        context=context,
+        citations=citations,
         portfolio_id=effective_portfolio_id,
         language_id=language_id,
-        ttl_seconds=3600  # 1 hour
+        qvec=qvec,
+        semantic_cacheable=semantic_cacheable,
+        cache_generations=cache_generations,
     )
 
+
+def provider_failure_response(db: Session, plan: ChatPlan) -> Dict[str, Any]:
+    """Answer when the LLM call failed: a grounded summary of the context, or a polite error."""
+    # Ensure we don't continue in an aborted transaction state
+    try:
+        db.rollback()
+    except Exception:
+        pass
+    enriched_citations = plan.enriched_citations(db)
+    # If we have context, synthesize a deterministic, grounded fallback answer
+    if plan.context.strip():
+        answer = _sanitize_agent_answer(
+            _build_context_only_answer(plan.user_message, plan.context, plan.citations, plan.language_code),
+            plan.language_code,
+        )
+        citations = enriched_citations
+    else:
+        # Otherwise, return a graceful error that fits the API envelope to avoid frontend timeouts
+        answer = _get_translation("provider_error", plan.language_code)
+        citations = []
+    sess_id = _persist_exchange(
+        db, agent_id=plan.agent_id, session_id=plan.session_id, user_message=plan.user_message,
+        answer=answer, citations=citations,
+    )
+    return {
+        "answer": answer,
+        "citations": citations,
+        "token_usage": {},
+        "latency_ms": 0,
+        "session_id": sess_id,
+    }
+
+
+def finish_chat(
+    db: Session,
+    plan: ChatPlan,
+    *,
+    answer: str,
+    usage: Dict[str, Any],
+    latency_ms: int,
+    timer: StageTimer,
+) -> Dict[str, Any]:
+    """Persist the LLM answer and populate the exact and semantic answer caches."""
+    enriched_citations = plan.enriched_citations(db, timer)
+
+    persist_t0 = perf_counter()
+    assistant_text = _sanitize_agent_answer(answer, plan.language_code)
+    # Written in the exchange's transaction; published by its commit
+    if plan.semantic_cacheable:
+        store_answer(
+            db,
+            agent_id=plan.agent_id,
+            portfolio_id=plan.portfolio_id,
+            language_id=plan.language_id,
+            model=plan.agent.embedding_model,
+            qvec=plan.qvec,
+            query=plan.user_message,
+            answer=assistant_text,
+            citations=enriched_citations,
+            generation=_semantic_generation(plan.cache_generations),
+        )
+    sess_id = _persist_exchange(
+        db, agent_id=plan.agent_id, session_id=plan.session_id, user_message=plan.user_message,
+        answer=assistant_text, citations=enriched_citations,
+        tokens=usage.get("total_tokens"), latency_ms=latency_ms,
+    )
+
+    # Cache the response for future queries (cache ALL responses including greetings)
+    # This ensures second "Hello" takes <5ms instead of 4+ seconds
+    if plan.cache_generations:
+        cache_service.set_agent_response(
+            agent_id=plan.agent_id,
+            user_message=plan.user_message,
+            response={"answer": assistant_text, "citations": enriched_citations},
+            portfolio_id=plan.portfolio_id,
+            language_id=plan.language_id,
+            ttl_seconds=3600,  # 1 hour
+            generations=plan.cache_generations,
+        )
+    timer.record("persist", perf_counter() - persist_t0)
+
     return {
         "answer": assistant_text,
         "citations": enriched_citations,
-        "token_usage": result.get("usage") or {},
-        "latency_ms": result.get("latency_ms") or 0,
+        "token_usage": usage,
+        "latency_ms": latency_ms,
         "session_id": sess_id,
     }
 
@@ -1,32 +1,112 @@
 """
-Async version of chat service with streaming, caching, and dynamic context sizing.
-
-Performance improvements:
-- Streaming responses for fast time-to-first-token (<500ms)
-- Redis caching for instant repeated queries (<5ms)
-- Dynamic context sizing based on query complexity
-- Parallel embedding + search operations
-- Query complexity analysis to skip RAG when not needed
+Async (streaming and non-streaming) variants of the agent chat.
+
+The pre-LLM stages (agent/credential lookup, exact and semantic answer caches, retrieval,
+fallbacks, prompt building) are shared with ``chat_service.run_agent_chat`` through
+``prepare_chat``; only the LLM call differs. ``run_agent_chat_async`` awaits the provider's
+``achat`` instead of holding a worker thread for the whole generation. The streaming path
+forwards tokens as they arrive, so the time-to-first-token is the retrieval time plus the
+provider's first token instead of the full generation.
+
+Events are dicts (``stream_chat_events``) rendered as SSE by ``sse_stream``, which coalesces
+tokens that pile up while a slow client is still receiving earlier ones.
+
+The pipeline's database work is synchronous SQLAlchemy; it runs on a bounded thread pool
+(``CHAT_STREAM_DB_WORKERS``) so one slow query never stalls the other streams on the loop.
+The pre-LLM transaction is read-only and is ended before the LLM call, so a chat does not
+hold a pooled connection while the provider generates; ``finish_chat`` checks one out again.
 """
 from __future__ import annotations
-from typing import Dict, Any, List, AsyncIterator, Optional
+from typing import Dict, Any, AsyncIterator, Optional
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from app.models.agent import Agent, AgentCredential, AgentMessage, AgentSession
-from app.models.language import Language
-from app.services.llm.providers import build_provider
-from app.services.rag_service import embed_query, vector_search, assemble_context
-from app.services.prompt_builder import build_rag_prompt, build_fallback_prompt, extract_conversational_history, CONVERSATIONAL_SYSTEM_PROMPT
-from app.services.citation_service import enrich_citations, deduplicate_citations
-from app.services.cache_service import cache_service
-from app.services.query_complexity import analyze_query_complexity, should_skip_rag, QueryComplexity
+from app.core.database import SessionLocal
+from app.services.chat_service import ChatPlan, prepare_chat, finish_chat, provider_failure_response
+from app.observability.timing import StageTimer
+from time import perf_counter
 import asyncio
+import functools
 import json
-import hashlib
 import os
 
 
-async def run_agent_chat_stream(
+# Answers that need no LLM call (cached, deterministic) are replayed in pieces of this size
+_REPLAY_CHUNK_CHARS = 20
+# Events buffered between the pipeline and a slow client before the pipeline waits
+_SSE_MAX_PENDING = int(os.getenv("SSE_MAX_PENDING_EVENTS", "256"))
+# Upper bound of characters merged into one token event
+_SSE_MAX_COALESCE_CHARS = int(os.getenv("SSE_MAX_COALESCE_CHARS", "2048"))
+_END = object()
+
+_db_pool = ThreadPoolExecutor(max_workers=int(os.getenv("CHAT_STREAM_DB_WORKERS", "16")), thread_name_prefix="chat-stream-db")
+
+
+async def _run_db(fn, *args, **kwargs):
+    """Run a blocking (database) call on the stream DB pool."""
+    fut = asyncio.get_running_loop().run_in_executor(_db_pool, functools.partial(fn, *args, **kwargs))
+    try:
+        return await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        # The worker cannot be interrupted; let it release the session before anyone else uses it
+        await asyncio.wait({fut})
+        raise
+
+
+@asynccontextmanager
+async def stream_session() -> AsyncIterator[Session]:
+    """Session owned by a stream; the request-scoped one is closed before the body is sent."""
+    db = await _run_db(SessionLocal)
+    try:
+        yield db
+    finally:
+        await _run_db(db.close)
+
+
+async def _rollback(db: Session) -> None:
+    try:
+        await _run_db(db.rollback)
+    except Exception:
+        pass
+
+
+def _release_connection(db: Session) -> None:
+    """Return the session's connection to the pool for the LLM call (plan objects are detached)."""
+    try:
+        db.rollback()
+    except Exception:
+        pass
+
+
+def _prepare_and_release(db: Session, *, timer: StageTimer, **kwargs) -> ChatPlan:
+    # Released in the same worker call: a separate release call would queue behind other
+    # streams' prepare_chat calls, which may be waiting for this very connection
+    plan = prepare_chat(db, timer=timer, **kwargs)
+    if plan.response is None:
+        _release_connection(db)
+        # Citation metadata loads on its own connection while the LLM answers
+        plan.start_enrichment(db, timer)
+    return plan
+
+
+def sse_event(event: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(event, default=str)}\n\n"
+
+
+def _done_event(response: Dict[str, Any], timer: StageTimer) -> Dict[str, Any]:
+    event = {
+        "type": "done",
+        "citations": response.get("citations", []),
+        "session_id": response.get("session_id"),
+        "latency_ms": response.get("latency_ms", 0),
+        "server_timing": timer.server_timing(),
+    }
+    if response.get("cached"):
+        event["cached"] = True
+    return event
+
+
+async def run_agent_chat_async(
     db: Session,
     *,
     agent_id: int,
@@ -35,246 +115,231 @@ async def run_agent_chat_stream(
     template_id: Optional[int] = None,
     portfolio_id: Optional[int] = None,
     portfolio_query: Optional[str] = None,
-    language_id: Optional[int] = None
-) -> AsyncIterator[str]:
-    """
-    Stream agent chat response with Server-Sent Events format.
-    
-    Yields SSE formatted strings:
-    - data: {"type": "token", "content": "text chunk"}
-    - data: {"type": "done", "citations": [...], "latency_ms": 123}
-    - data: {"type": "error", "message": "error details"}
-    """
-    # Fetch agent and credentials
-    agent = db.query(Agent).filter(Agent.id == agent_id).first()
-    if not agent:
-        yield f'data: {json.dumps({"type": "error", "message": "Agent not found"})}\n\n'
-        return
-    
-    cred = db.query(AgentCredential).filter(AgentCredential.agent_id == agent_id).first()
-    if not cred:
-        yield f'data: {json.dumps({"type": "error", "message": "No credentials configured"})}\n\n'
-        return
-    
-    # Get API key from credential or environment
-    api_key = None
-    if cred.encrypted_api_key:
-        from app.core.security import decrypt_agent_api_key
-        try:
-            api_key = decrypt_agent_api_key(cred.encrypted_api_key)
-        except Exception:
-            pass
-    
-    if not api_key:
-        openai_key = os.getenv("OPENAI_API_KEY", "")
-        generic_key = os.getenv("AGENT_PROVIDER_KEY", "")
-        api_key = openai_key if cred.provider.lower() == "openai" else generic_key
-    
-    if not api_key:
-        yield f'data: {json.dumps({"type": "error", "message": "No API key configured"})}\n\n'
-        return
-    
-    provider = build_provider(cred.provider, api_key=api_key, base_url=cred.base_url or (cred.extra or {}).get("base_url"), extra=cred.extra or {})
-    
-    # Get language info
-    language_code = "en"
-    language_name = None
-    if language_id:
-        try:
-            language = db.query(Language).filter(Language.id == language_id).first()
-            if language:
-                language_name = language.name
-                language_code = language.code if hasattr(language, 'code') and language.code else "en"
-        except Exception:
-            try:
-                db.rollback()
-            except Exception:
-                pass
-    
-    # Analyze query complexity for dynamic context sizing
-    complexity, top_k, max_context_tokens = analyze_query_complexity(user_message)
-    
-    # Check cache first (if not trivial query)
-    cache_key = None
-    if complexity != QueryComplexity.TRIVIAL and portfolio_id:
-        cache_response = cache_service.get_agent_response(
+    language_id: Optional[int] = None,
+    raise_on_provider_error: bool = False,
+    timer: Optional[StageTimer] = None,
+) -> Dict[str, Any]:
+    """``chat_service.run_agent_chat`` for async endpoints: same stages, awaited LLM call."""
+    timer = timer or StageTimer(agent_id=agent_id)
+    try:
+        plan = await _run_db(
+            _prepare_and_release,
+            db,
             agent_id=agent_id,
-            query=user_message,
+            user_message=user_message,
+            session_id=session_id,
+            template_id=template_id,
             portfolio_id=portfolio_id,
-            language_code=language_code,
-            top_k=top_k
+            portfolio_query=portfolio_query,
+            language_id=language_id,
+            timer=timer,
         )
-        if cache_response:
-            # Stream cached response quickly
-            answer = cache_response.get("answer", "")
-            # Break into chunks to simulate streaming
-            chunk_size = 20
-            for i in range(0, len(answer), chunk_size):
-                chunk = answer[i:i+chunk_size]
-                yield f'data: {json.dumps({"type": "token", "content": chunk})}\n\n'
-                await asyncio.sleep(0.01)  # Small delay for natural feel
-            
-            # Send done event with citations
-            yield f'data: {json.dumps({"type": "done", "citations": cache_response.get("citations", []), "cached": True})}\n\n'
-            return
-    
-    # For trivial queries (greetings), skip RAG and use conversational prompt
-    if should_skip_rag(user_message):
-        messages = [{"role": "system", "content": CONVERSATIONAL_SYSTEM_PROMPT}]
-        
-        # Load conversation history
-        conversation_history = []
-        if session_id:
-            try:
-                recent_msgs = db.query(AgentMessage)\
-                    .filter(AgentMessage.session_id == session_id)\
-                    .order_by(AgentMessage.id.desc())\
-                    .limit(6)\
-                    .all()
-                conversation_history = extract_conversational_history(list(reversed(recent_msgs)), max_turns=3)
-                messages.extend(conversation_history)
-            except Exception:
-                try:
-                    db.rollback()
-                except Exception:
-                    pass
-        
-        messages.append({"role": "user", "content": user_message})
-        
-        # Stream response
-        chat_model = agent.chat_model or "gpt-4o-mini"
-        system_prompt = messages[0]['content']
-        chat_messages = messages[1:]
-        
-        full_response = []
+        if plan.response is not None:
+            return plan.response
         try:
-            async for chunk in provider.chat_stream(model=chat_model, system_prompt=system_prompt, messages=chat_messages):
-                full_response.append(chunk)
-                yield f'data: {json.dumps({"type": "token", "content": chunk})}\n\n'
-            
-            # Save to database
-            answer = "".join(full_response)
-            sess_id = session_id
-            if not sess_id:
-                s = AgentSession(agent_id=agent.id)
-                db.add(s)
-                db.flush()
-                sess_id = s.id
-            db.add(AgentMessage(session_id=sess_id, role="user", content=user_message))
-            db.add(AgentMessage(session_id=sess_id, role="assistant", content=answer, citations=[]))
-            db.commit()
-            
-            yield f'data: {json.dumps({"type": "done", "citations": []})}\n\n'
+            with timer.stage("llm"):
+                result = await plan.provider.achat(model=plan.chat_model, system_prompt=plan.system_prompt, messages=plan.messages)
         except Exception as e:
-            yield f'data: {json.dumps({"type": "error", "message": str(e)})}\n\n'
+            if raise_on_provider_error:
+                await _rollback(db)
+                raise RuntimeError(f"Provider chat call failed for agent {agent_id}: {e}") from e
+            return await _run_db(provider_failure_response, db, plan)
+        return await _run_db(
+            finish_chat,
+            db,
+            plan,
+            answer=result.get("text") or "",
+            usage=result.get("usage") or {},
+            latency_ms=result.get("latency_ms") or 0,
+            timer=timer,
+        )
+    finally:
+        timer.observe()
+
+
+async def stream_chat_events(
+    db: Session,
+    *,
+    agent_id: int,
+    user_message: str,
+    session_id: int | None,
+    template_id: Optional[int] = None,
+    portfolio_id: Optional[int] = None,
+    portfolio_query: Optional[str] = None,
+    language_id: Optional[int] = None,
+    timer: StageTimer,
+    raise_before_first_token: bool = False,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield ``token`` events followed by one ``done`` (or ``error``) event.
+
+    With ``raise_before_first_token`` a failure that happens before any token was emitted
+    is raised instead of answered, so the caller can retry with another agent.
+    """
+    try:
+        plan = await _run_db(
+            _prepare_and_release,
+            db,
+            agent_id=agent_id,
+            user_message=user_message,
+            session_id=session_id,
+            template_id=template_id,
+            portfolio_id=portfolio_id,
+            portfolio_query=portfolio_query,
+            language_id=language_id,
+            timer=timer,
+        )
+    except Exception as e:
+        if raise_before_first_token:
+            raise
+        yield {"type": "error", "message": str(e)}
         return
-    
-    # RAG pipeline with dynamic context sizing
-    citations = []
-    context_text = ""
-    
-    if portfolio_id:
-        try:
-            # Check cache for RAG chunks
-            cached_chunks = cache_service.get_rag_chunks(
-                portfolio_id=portfolio_id,
-                query=user_message,
-                top_k=top_k
-            )
-            
-            if cached_chunks:
-                # Use cached results
-                citations = cached_chunks
-                context_text = assemble_context(citations, max_tokens=max_context_tokens)
-            else:
-                # Embed query (async in future)
-                embed_model = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
-                embedding = embed_query(user_message, model=embed_model)
-                
-                # Vector search with dynamic top_k
-                results = vector_search(
-                    db=db,
-                    embedding=embedding,
-                    portfolio_id=portfolio_id,
-                    top_k=top_k
-                )
-                
-                # Enrich and deduplicate
-                citations = enrich_citations(db, results)
-                citations = deduplicate_citations(citations, portfolio_id=portfolio_id)
-                context_text = assemble_context(citations, max_tokens=max_context_tokens)
-                
-                # Cache the chunks
-                cache_service.set_rag_chunks(
-                    portfolio_id=portfolio_id,
-                    query=user_message,
-                    chunks=citations,
-                    top_k=top_k,
-                    ttl=1800  # 30 minutes
-                )
-        except Exception:
-            try:
-                db.rollback()
-            except Exception:
-                pass
-    
-    # Build prompt
-    conversation_history = []
-    if session_id:
-        try:
-            recent_msgs = db.query(AgentMessage)\
-                .filter(AgentMessage.session_id == session_id)\
-                .order_by(AgentMessage.id.desc())\
-                .limit(6)\
-                .all()
-            conversation_history = extract_conversational_history(list(reversed(recent_msgs)), max_turns=3)
-        except Exception:
-            try:
-                db.rollback()
-            except Exception:
-                pass
-    
-    system_prompt, messages = build_rag_prompt(
-        user_message=user_message,
-        context=context_text,
-        conversation_history=conversation_history,
-        language_name=language_name,
-        agent_instructions=agent.instructions
-    )
-    
-    # Stream LLM response
-    chat_model = agent.chat_model or "gpt-4o-mini"
+
+    if plan.response is not None:
+        answer = plan.response.get("answer", "")
+        for i in range(0, len(answer), _REPLAY_CHUNK_CHARS):
+            yield {"type": "token", "content": answer[i:i + _REPLAY_CHUNK_CHARS]}
+        yield _done_event(plan.response, timer)
+        return
+
     full_response = []
-    
+    llm_t0 = perf_counter()
     try:
-        async for chunk in provider.chat_stream(model=chat_model, system_prompt=system_prompt, messages=messages):
+        async for chunk in plan.provider.chat_stream(model=plan.chat_model, system_prompt=plan.system_prompt, messages=plan.messages):
+            if not full_response:
+                timer.since_start("llm_ttft")
             full_response.append(chunk)
-            yield f'data: {json.dumps({"type": "token", "content": chunk})}\n\n'
-        
-        # Save to database
-        answer = "".join(full_response)
-        sess_id = session_id
-        if not sess_id:
-            s = AgentSession(agent_id=agent.id)
-            db.add(s)
-            db.flush()
-            sess_id = s.id
-        db.add(AgentMessage(session_id=sess_id, role="user", content=user_message))
-        db.add(AgentMessage(session_id=sess_id, role="assistant", content=answer, citations=citations))
-        db.commit()
-        
-        # Cache the response
-        if portfolio_id and complexity != QueryComplexity.TRIVIAL:
-            cache_service.set_agent_response(
+            yield {"type": "token", "content": chunk}
+    except Exception as e:
+        await _rollback(db)
+        if full_response:
+            # Part of the answer is already on screen; it cannot be replaced anymore
+            yield {"type": "error", "message": str(e)}
+            return
+        if raise_before_first_token:
+            raise RuntimeError(f"Provider chat stream failed for agent {agent_id}: {e}") from e
+        response = await _run_db(provider_failure_response, db, plan)
+        yield {"type": "token", "content": response["answer"]}
+        yield _done_event(response, timer)
+        return
+    timer.record("llm", perf_counter() - llm_t0)
+
+    response = await _run_db(
+        finish_chat,
+        db,
+        plan,
+        answer="".join(full_response),
+        usage={},
+        latency_ms=int((perf_counter() - llm_t0) * 1000),
+        timer=timer,
+    )
+    yield _done_event(response, timer)
+
+
+async def sse_stream(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """
+    Render events as SSE with backpressure-aware flushing.
+
+    The pipeline runs ahead of the client in a bounded queue. Each write sends every token
+    that arrived while the previous write was in flight as one event, so a fast client gets
+    tokens one by one and a slow one gets fewer, larger writes; once the queue is full the
+    pipeline (and the provider stream) waits for the client.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=_SSE_MAX_PENDING)
+
+    async def _produce() -> None:
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(e)
+        await queue.put(_END)
+
+    producer = asyncio.create_task(_produce())
+    pending: Any = None
+    try:
+        while True:
+            item = pending if pending is not None else await queue.get()
+            pending = None
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            if item.get("type") == "token":
+                parts = [item.get("content", "")]
+                size = len(parts[0])
+                while size < _SSE_MAX_COALESCE_CHARS and not queue.empty():
+                    nxt = queue.get_nowait()
+                    if isinstance(nxt, dict) and nxt.get("type") == "token":
+                        parts.append(nxt.get("content", ""))
+                        size += len(parts[-1])
+                    else:
+                        pending = nxt
+                        break
+                item = {"type": "token", "content": "".join(parts)}
+            yield sse_event(item)
+    finally:
+        # Client gone (or done): stop the pipeline, which also cancels the provider stream
+        producer.cancel()
+        try:
+            await producer
+        except BaseException:
+            pass
+
+
+async def run_agent_chat_stream(
+    db: Optional[Session],
+    *,
+    agent_id: int,
+    user_message: str,
+    session_id: int | None,
+    template_id: Optional[int] = None,
+    portfolio_id: Optional[int] = None,
+    portfolio_query: Optional[str] = None,
+    language_id: Optional[int] = None,
+    timer: Optional[StageTimer] = None
+) -> AsyncIterator[str]:
+    """
+    Stream agent chat response with Server-Sent Events format.
+
+    Yields SSE formatted strings:
+    - data: {"type": "token", "content": "text chunk"}
+    - data: {"type": "done", "citations": [...], "latency_ms": 123, "server_timing": "..."}
+    - data: {"type": "error", "message": "error details"}
+
+    Headers are sent before any stage runs, so stage latencies travel in the ``done`` event
+    (Server-Timing syntax) and are exported to Prometheus when the stream ends.
+
+    With ``db=None`` the stream opens (and closes) its own session.
+    """
+    if db is None:
+        async with stream_session() as own_db:
+            async for chunk in run_agent_chat_stream(
+                own_db,
                 agent_id=agent_id,
-                query=user_message,
-                response={"answer": answer, "citations": citations},
+                user_message=user_message,
+                session_id=session_id,
+                template_id=template_id,
                 portfolio_id=portfolio_id,
-                language_code=language_code,
-                top_k=top_k,
-                ttl=3600  # 1 hour
-            )
-        
-        yield f'data: {json.dumps({"type": "done", "citations": citations})}\n\n'
-    except Exception as e:
-        yield f'data: {json.dumps({"type": "error", "message": str(e)})}\n\n'
+                portfolio_query=portfolio_query,
+                language_id=language_id,
+                timer=timer,
+            ):
+                yield chunk
+        return
+    timer = timer or StageTimer(agent_id=agent_id)
+    try:
+        async for chunk in sse_stream(stream_chat_events(
+            db,
+            agent_id=agent_id,
+            user_message=user_message,
+            session_id=session_id,
+            template_id=template_id,
+            portfolio_id=portfolio_id,
+            portfolio_query=portfolio_query,
+            language_id=language_id,
+            timer=timer,
+        )):
+            yield chunk
+    finally:
+        timer.observe()
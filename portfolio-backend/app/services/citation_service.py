@@ -5,10 +5,24 @@ Transforms raw citations (source_table + source_id + chunk_id) into user-friendl
 metadata with titles, previews, URLs, and types for display in the chat UI.
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+import logging
+import os
+import threading
+import time
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
+logger = logging.getLogger(__name__)
+
+SourceKey = Tuple[str, str]
+
+# Short-lived metadata cache: the same projects are cited over and over
+_CACHE_TTL = float(os.getenv("CITATION_CACHE_TTL_SECONDS", "120"))
+_CACHE_MAX = int(os.getenv("CITATION_CACHE_MAX_ENTRIES", "2048"))
+_cache: Dict[Tuple[str, str, Optional[int]], Tuple[float, Dict[str, Any]]] = {}
+_cache_lock = threading.Lock()
+
 
 def enrich_citations(
     db: Session, 
@@ -36,26 +50,17 @@ def enrich_citations(
             - metadata: Additional source-specific data
             - All original fields preserved
     """
+    # Skip malformed citations
+    valid = [c for c in citations if c.get("source_table") and c.get("source_id")]
+    metadata_by_source = get_sources_metadata(
+        db, [(c["source_table"], str(c["source_id"])) for c in valid], language_id=language_id
+    )
+
     enriched = []
-    
-    for cite in citations:
-        source_table = cite.get("source_table", "")
-        source_id = cite.get("source_id", "")
-        
-        if not source_table or not source_id:
-            # Skip malformed citations
-            continue
-        
-        # Fetch metadata for this source (wrapped in try/catch for safety)
-        try:
-            metadata = _get_source_metadata(db, source_table, source_id, language_id=language_id)
-        except Exception as e:
-            # If metadata fetch fails, use defaults and continue
-            metadata = {
-                "title": f"{source_table} #{source_id}",
-                "type": source_table.replace("_", " ").title(),
-                "preview": ""
-            }
+    for cite in valid:
+        source_table = cite["source_table"]
+        source_id = cite["source_id"]
+        metadata = metadata_by_source.get((source_table, str(source_id))) or _fallback_metadata(source_table, source_id)
         
         # Build enriched citation
         enriched.append({
@@ -76,6 +81,80 @@ def enrich_citations(
     return enriched
 
 
+def get_sources_metadata(
+    db: Session,
+    sources: List[SourceKey],
+    language_id: Optional[int] = None
+) -> Dict[SourceKey, Dict[str, Any]]:
+    """
+    Fetch metadata for many sources at once.
+
+    Cached entries are served from memory; the rest are grouped by source table and
+    loaded with one ``id = ANY(:ids)`` query per table, each in its own savepoint so a
+    failing table never poisons the caller's transaction. Always returns an entry for
+    every requested source (falling back to a generic title).
+    """
+    out: Dict[SourceKey, Dict[str, Any]] = {}
+    # table -> {numeric id: source id as cited}
+    missing: Dict[str, Dict[int, str]] = {}
+    now = time.monotonic()
+    with _cache_lock:
+        for table, sid in dict.fromkeys(sources):
+            hit = _cache.get((table, sid, language_id))
+            if hit and hit[0] > now:
+                out[(table, sid)] = hit[1]
+                continue
+            if table in _BATCH_LOADERS:
+                try:
+                    missing.setdefault(table, {})[int(sid)] = sid
+                    continue
+                except (TypeError, ValueError):
+                    pass
+            out[(table, sid)] = _fallback_metadata(table, sid)
+
+    for table, ids in missing.items():
+        loaded = _load_table_metadata(db, table, list(ids), language_id)
+        if loaded is None:
+            # Query failed: do not cache, just fall back for this request
+            for sid in ids.values():
+                out[(table, sid)] = _fallback_metadata(table, sid)
+            continue
+        expires = time.monotonic() + _CACHE_TTL
+        with _cache_lock:
+            if len(_cache) + len(ids) > _CACHE_MAX:
+                _cache.clear()
+            for num, sid in ids.items():
+                meta = loaded.get(num) or _fallback_metadata(table, sid)
+                out[(table, sid)] = meta
+                if _CACHE_TTL > 0:
+                    _cache[(table, sid, language_id)] = (expires, meta)
+    return out
+
+
+def peek_cached_metadata(
+    citations: List[Dict[str, Any]],
+    language_id: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Citations in their original order with titles from the metadata cache, without any query.
+
+    Used for prompt source labels while the full enrichment is still running.
+    """
+    now = time.monotonic()
+    out = []
+    with _cache_lock:
+        for cite in citations:
+            hit = _cache.get((cite.get("source_table"), str(cite.get("source_id")), language_id))
+            if hit and hit[0] > now:
+                cite = {**cite, "title": hit[1].get("title"), "type": hit[1].get("type")}
+            out.append(cite)
+    return out
+
+
+def clear_metadata_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
 def _get_source_metadata(
     db: Session, 
     source_table: str, 
@@ -83,297 +162,16 @@ def _get_source_metadata(
     language_id: Optional[int] = None
 ) -> Dict[str, Any]:
     """
-    Fetch human-readable metadata for a source.
-    
-    Args:
-        db: Database session
-        source_table: Name of the source table
-        source_id: ID of the source record
-        language_id: Optional language ID to filter multi-language content
-    
+    Fetch human-readable metadata for a single source.
+
     Returns a dict with: title, type, preview, url, and any other relevant fields.
     Always returns a valid dict, never raises exceptions.
-    
-    Each query uses its own savepoint to prevent transaction poisoning.
     """
-    
-    # Projects
-    if source_table == "projects":
-        savepoint = None
-        try:
-            # Create a savepoint to isolate this query
-            savepoint = db.begin_nested()
-            
-            # Build language filter
-            lang_filter = "AND pt.language_id = :lang_id" if language_id else ""
-            params = {"id": source_id}
-            if language_id:
-                params["lang_id"] = language_id
-            
-            # Use correct column names: name and description (not title/short_description)
-            result = db.execute(text(f"""  # nosec B608 - lang_filter is a hardcoded parameterized SQL fragment or empty string, no user data
-                SELECT
-                    p.id,
-                    p.website_url as url,
-                    pt.name as title,
-                    pt.description
-                FROM projects p
-                LEFT JOIN project_texts pt ON pt.project_id = p.id {lang_filter}
-                WHERE p.id = :id
-                LIMIT 1
-            """), params).mappings().first()
-            
-            if result:
-                savepoint.commit()
-                return {
-                    "title": result["title"] or f"Project {source_id}",
-                    "preview": (result["description"] or "")[:200],
-                    "url": result["url"],
-                    "type": "Project",
-                    "project_id": result["id"]
-                }
-            else:
-                savepoint.commit()
-        except Exception as e:
-            # Rollback the savepoint to clear the failed transaction state
-            if savepoint:
-                try:
-                    savepoint.rollback()
-                except Exception:
-                    pass
-            # Log error but continue with fallback
-    
-    # Experiences
-    elif source_table == "experiences":
-        savepoint = None
-        try:
-            savepoint = db.begin_nested()
-            
-            # Build language filter
-            lang_filter = "AND et.language_id = :lang_id" if language_id else ""
-            params = {"id": source_id}
-            if language_id:
-                params["lang_id"] = language_id
-            
-            # Use correct columns: code and years from experiences, name and description from experience_texts
-            result = db.execute(text(f"""  # nosec B608 - lang_filter is a hardcoded parameterized SQL fragment or empty string, no user data
-                SELECT
-                    e.id,
-                    e.code,
-                    e.years,
-                    et.name,
-                    et.description
-                FROM experiences e
-                LEFT JOIN experience_texts et ON et.experience_id = e.id {lang_filter}
-                WHERE e.id = :id
-                LIMIT 1
-            """), params).mappings().first()
-            
-            if result:
-                savepoint.commit()
-                years_text = f"{result['years']} years" if result.get('years') else ""
-                return {
-                    "title": result.get('name') or result.get('code') or f"Experience {source_id}",
-                    "preview": f"{years_text}. {(result.get('description') or '')[:150]}".strip(),
-                    "type": "Experience",
-                    "code": result.get("code"),
-                    "years": result.get("years")
-                }
-            else:
-                savepoint.commit()
-        except Exception as e:
-            if savepoint:
-                try:
-                    savepoint.rollback()
-                except Exception:
-                    pass
-    
-    # Portfolios
-    elif source_table == "portfolios":
-        savepoint = None
-        try:
-            savepoint = db.begin_nested()
-            result = db.execute(text("""
-                SELECT 
-                    id, 
-                    name,
-                    description
-                FROM portfolios
-                WHERE id = :id
-            """), {"id": source_id}).mappings().first()
-            
-            if result:
-                savepoint.commit()
-                return {
-                    "title": result["name"] or f"Portfolio {source_id}",
-                    "preview": (result.get("description") or "")[:200],
-                    "type": "Portfolio"
-                }
-            else:
-                savepoint.commit()
-        except Exception as e:
-            if savepoint:
-                try:
-                    savepoint.rollback()
-                except Exception:
-                    pass
-    
-    # Sections
-    elif source_table == "sections":
-        savepoint = None
-        try:
-            savepoint = db.begin_nested()
-            
-            # Build language filter
-            lang_filter = "AND st.language_id = :lang_id" if language_id else ""
-            params = {"id": source_id}
-            if language_id:
-                params["lang_id"] = language_id
-            
-            # Use correct column names: code from sections, text from section_texts
-            result = db.execute(text(f"""  # nosec B608 - lang_filter is a hardcoded parameterized SQL fragment or empty string, no user data
-                SELECT
-                    s.id,
-                    s.code,
-                    st.text
-                FROM sections s
-                LEFT JOIN section_texts st ON st.section_id = s.id {lang_filter}
-                WHERE s.id = :id
-                LIMIT 1
-            """), params).mappings().first()
-            
-            if result:
-                savepoint.commit()
-                return {
-                    "title": result["code"] or f"Section {source_id}",
-                    "preview": (result.get("text") or "")[:200],
-                    "type": "Section"
-                }
-            else:
-                savepoint.commit()
-        except Exception as e:
-            if savepoint:
-                try:
-                    savepoint.rollback()
-                except Exception:
-                    pass
-    
-    # Portfolio Attachments
-    elif source_table == "portfolio_attachments":
-        savepoint = None
-        try:
-            savepoint = db.begin_nested()
-            result = db.execute(text("""
-                SELECT 
-                    id, 
-                    file_name, 
-                    file_path
-                FROM portfolio_attachments
-                WHERE id = :id
-            """), {"id": source_id}).mappings().first()
-            
-            if result:
-                savepoint.commit()
-                return {
-                    "title": result["file_name"] or f"Document {source_id}",
-                    "preview": "Attached document",
-                    "type": "Document",
-                    "file_name": result["file_name"],
-                    "file_path": result["file_path"]
-                }
-            else:
-                savepoint.commit()
-        except Exception as e:
-            if savepoint:
-                try:
-                    savepoint.rollback()
-                except Exception:
-                    pass
-    
-    # Project Attachments
-    elif source_table == "project_attachments":
-        savepoint = None
-        try:
-            savepoint = db.begin_nested()
-            
-            # Use provided language_id or default to 1
-            lang_id = language_id or 1
-            
-            result = db.execute(text("""
-                SELECT 
-                    pa.id, 
-                    pa.file_name, 
-                    pa.file_path,
-                    p.id as project_id,
-                    COALESCE(pt.name, p.id::text) as project_title
-                FROM project_attachments pa
-                LEFT JOIN projects p ON pa.project_id = p.id
-                LEFT JOIN project_texts pt ON pt.project_id = p.id AND pt.language_id = :lang_id
-                WHERE pa.id = :id
-            """), {"id": source_id, "lang_id": lang_id}).mappings().first()
-            
-            if result:
-                savepoint.commit()
-                return {
-                    "title": result["file_name"] or f"Document {source_id}",
-                    "preview": f"From project: {result.get('project_title', 'Unknown')}",
-                    "type": "Project Document",
-                    "file_name": result["file_name"],
-                    "file_path": result["file_path"],
-                    "project_id": result.get("project_id")
-                }
-            else:
-                savepoint.commit()
-        except Exception as e:
-            if savepoint:
-                try:
-                    savepoint.rollback()
-                except Exception:
-                    pass
-    
-    # Skills
-    elif source_table == "skills":
-        savepoint = None
-        try:
-            savepoint = db.begin_nested()
-            
-            # Build language filter
-            lang_filter = "AND st.language_id = :lang_id" if language_id else ""
-            params = {"id": source_id}
-            if language_id:
-                params["lang_id"] = language_id
-            
-            # Simplified query
-            result = db.execute(text(f"""  # nosec B608 - lang_filter is a hardcoded parameterized SQL fragment or empty string, no user data
-                SELECT
-                    s.id,
-                    st.name,
-                    st.description,
-                    s.proficiency_level
-                FROM skills s
-                LEFT JOIN skill_texts st ON st.skill_id = s.id {lang_filter}
-                WHERE s.id = :id
-                LIMIT 1
-            """), params).mappings().first()
-            
-            if result:
-                savepoint.commit()
-                level = result.get("proficiency_level") or "Unknown level"
-                return {
-                    "title": result["name"] or f"Skill {source_id}",
-                    "preview": f"Proficiency: {level}. {(result.get('description') or '')[:100]}",
-                    "type": "Skill"
-                }
-            else:
-                savepoint.commit()
-        except Exception as e:
-            if savepoint:
-                try:
-                    savepoint.rollback()
-                except Exception:
-                    pass
-    
-    # Fallback for unknown or unsupported source types
+    return get_sources_metadata(db, [(source_table, str(source_id))], language_id=language_id)[(source_table, str(source_id))]
+
+
+def _fallback_metadata(source_table: str, source_id: Any) -> Dict[str, Any]:
+    # Fallback for unknown or unsupported source types and missing rows
     return {
         "title": f"{source_table.replace('_', ' ').title()} #{source_id}",
         "preview": "",
@@ -381,6 +179,228 @@ def _get_source_metadata(
     }
 
 
+def _load_table_metadata(
+    db: Session,
+    source_table: str,
+    ids: List[int],
+    language_id: Optional[int]
+) -> Optional[Dict[int, Dict[str, Any]]]:
+    """Run the batch query for one table; returns ``{id: metadata}`` or None if it failed."""
+    build_sql, to_metadata = _BATCH_LOADERS[source_table]
+    sql, params = build_sql(language_id)
+    params["ids"] = ids
+    savepoint = None
+    try:
+        savepoint = db.begin_nested()
+        rows = db.execute(sql, params).mappings().all()
+        savepoint.commit()
+    except Exception as e:
+        # Rollback the savepoint to clear the failed transaction state
+        if savepoint:
+            try:
+                savepoint.rollback()
+            except Exception:
+                pass
+        logger.debug(f"citation metadata query failed for {source_table}: {e}")
+        return None
+    return {int(r["id"]): to_metadata(r) for r in rows}
+
+
+def _lang_filter(alias: str, language_id: Optional[int]) -> Tuple[str, Dict[str, Any]]:
+    # Hardcoded parameterized SQL fragment or empty string, no user data
+    if language_id:
+        return f"AND {alias}.language_id = :lang_id", {"lang_id": language_id}
+    return "", {}
+
+
+def _projects_sql(language_id: Optional[int]):
+    lang_filter, params = _lang_filter("pt", language_id)
+    # Use correct column names: name and description (not title/short_description)
+    return text(  # nosec B608 - lang_filter is a hardcoded parameterized SQL fragment or empty string, no user data
+        f"""
+        SELECT DISTINCT ON (p.id)
+            p.id,
+            p.website_url as url,
+            pt.name as title,
+            pt.description
+        FROM projects p
+        LEFT JOIN project_texts pt ON pt.project_id = p.id {lang_filter}
+        WHERE p.id = ANY(:ids)
+        ORDER BY p.id, pt.id
+        """
+    ), params
+
+
+def _projects_metadata(r) -> Dict[str, Any]:
+    return {
+        "title": r["title"] or f"Project {r['id']}",
+        "preview": (r["description"] or "")[:200],
+        "url": r["url"],
+        "type": "Project",
+        "project_id": r["id"]
+    }
+
+
+def _experiences_sql(language_id: Optional[int]):
+    lang_filter, params = _lang_filter("et", language_id)
+    # Use correct columns: code and years from experiences, name and description from experience_texts
+    return text(  # nosec B608 - lang_filter is a hardcoded parameterized SQL fragment or empty string, no user data
+        f"""
+        SELECT DISTINCT ON (e.id)
+            e.id,
+            e.code,
+            e.years,
+            et.name,
+            et.description
+        FROM experiences e
+        LEFT JOIN experience_texts et ON et.experience_id = e.id {lang_filter}
+        WHERE e.id = ANY(:ids)
+        ORDER BY e.id, et.id
+        """
+    ), params
+
+
+def _experiences_metadata(r) -> Dict[str, Any]:
+    years_text = f"{r['years']} years" if r.get('years') else ""
+    return {
+        "title": r.get('name') or r.get('code') or f"Experience {r['id']}",
+        "preview": f"{years_text}. {(r.get('description') or '')[:150]}".strip(),
+        "type": "Experience",
+        "code": r.get("code"),
+        "years": r.get("years")
+    }
+
+
+def _portfolios_sql(language_id: Optional[int]):
+    return text(
+        """
+        SELECT id, name, description
+        FROM portfolios
+        WHERE id = ANY(:ids)
+        """
+    ), {}
+
+
+def _portfolios_metadata(r) -> Dict[str, Any]:
+    return {
+        "title": r["name"] or f"Portfolio {r['id']}",
+        "preview": (r.get("description") or "")[:200],
+        "type": "Portfolio"
+    }
+
+
+def _sections_sql(language_id: Optional[int]):
+    lang_filter, params = _lang_filter("st", language_id)
+    # Use correct column names: code from sections, text from section_texts
+    return text(  # nosec B608 - lang_filter is a hardcoded parameterized SQL fragment or empty string, no user data
+        f"""
+        SELECT DISTINCT ON (s.id)
+            s.id,
+            s.code,
+            st.text
+        FROM sections s
+        LEFT JOIN section_texts st ON st.section_id = s.id {lang_filter}
+        WHERE s.id = ANY(:ids)
+        ORDER BY s.id, st.id
+        """
+    ), params
+
+
+def _sections_metadata(r) -> Dict[str, Any]:
+    return {
+        "title": r["code"] or f"Section {r['id']}",
+        "preview": (r.get("text") or "")[:200],
+        "type": "Section"
+    }
+
+
+def _portfolio_attachments_sql(language_id: Optional[int]):
+    return text(
+        """
+        SELECT id, file_name, file_path
+        FROM portfolio_attachments
+        WHERE id = ANY(:ids)
+        """
+    ), {}
+
+
+def _portfolio_attachments_metadata(r) -> Dict[str, Any]:
+    return {
+        "title": r["file_name"] or f"Document {r['id']}",
+        "preview": "Attached document",
+        "type": "Document",
+        "file_name": r["file_name"],
+        "file_path": r["file_path"]
+    }
+
+
+def _project_attachments_sql(language_id: Optional[int]):
+    # Use provided language_id or default to 1
+    return text(
+        """
+        SELECT
+            pa.id,
+            pa.file_name,
+            pa.file_path,
+            p.id as project_id,
+            COALESCE(pt.name, p.id::text) as project_title
+        FROM project_attachments pa
+        LEFT JOIN projects p ON pa.project_id = p.id
+        LEFT JOIN project_texts pt ON pt.project_id = p.id AND pt.language_id = :lang_id
+        WHERE pa.id = ANY(:ids)
+        """
+    ), {"lang_id": language_id or 1}
+
+
+def _project_attachments_metadata(r) -> Dict[str, Any]:
+    return {
+        "title": r["file_name"] or f"Document {r['id']}",
+        "preview": f"From project: {r.get('project_title', 'Unknown')}",
+        "type": "Project Document",
+        "file_name": r["file_name"],
+        "file_path": r["file_path"],
+        "project_id": r.get("project_id")
+    }
+
+
+def _skills_sql(language_id: Optional[int]):
+    lang_filter, params = _lang_filter("st", language_id)
+    return text(  # nosec B608 - lang_filter is a hardcoded parameterized SQL fragment or empty string, no user data
+        f"""
+        SELECT DISTINCT ON (s.id)
+            s.id,
+            st.name,
+            st.description,
+            s.proficiency_level
+        FROM skills s
+        LEFT JOIN skill_texts st ON st.skill_id = s.id {lang_filter}
+        WHERE s.id = ANY(:ids)
+        ORDER BY s.id, st.id
+        """
+    ), params
+
+
+def _skills_metadata(r) -> Dict[str, Any]:
+    level = r.get("proficiency_level") or "Unknown level"
+    return {
+        "title": r["name"] or f"Skill {r['id']}",
+        "preview": f"Proficiency: {level}. {(r.get('description') or '')[:100]}",
+        "type": "Skill"
+    }
+
+
+# source_table -> (batch SQL builder, row -> metadata)
+_BATCH_LOADERS = {
+    "projects": (_projects_sql, _projects_metadata),
+    "experiences": (_experiences_sql, _experiences_metadata),
+    "portfolios": (_portfolios_sql, _portfolios_metadata),
+    "sections": (_sections_sql, _sections_metadata),
+    "portfolio_attachments": (_portfolio_attachments_sql, _portfolio_attachments_metadata),
+    "project_attachments": (_project_attachments_sql, _project_attachments_metadata),
+    "skills": (_skills_sql, _skills_metadata),
+}
+
+
 def _build_source_url(source_table: str, source_id: str) -> Optional[str]:
     """
     Generate an admin panel link to view the source (if applicable).
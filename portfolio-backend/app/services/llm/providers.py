@@ -1,8 +1,15 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Protocol, Dict, Any, List, Optional, AsyncIterator
+from typing import Protocol, Dict, Any, List, Optional, AsyncIterator, Tuple
+import asyncio
+import hashlib
+import logging
+import os
+import threading
 import time
 
+logger = logging.getLogger(__name__)
+
 
 class RateLimitError(RuntimeError):
     """Raised when a provider returns HTTP 429 (rate limit exceeded)."""
@@ -12,8 +19,15 @@ class ChatProvider(Protocol):
     def chat(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         ...
 
+    async def achat(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Non-blocking variant of ``chat`` for async code paths."""
+        ...
+
     def chat_stream(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
-        """Stream chat response chunks. Yields text deltas."""
+        """Stream chat response chunks. Yields text deltas.
+
+        Closing the iterator (client disconnect, task cancellation) closes the upstream stream.
+        """
         ...
 
     def embed(self, *, model: str, texts: List[str]) -> List[List[float]]:
@@ -28,25 +42,116 @@ class ProviderConfig:
     extra: Optional[Dict[str, Any]] = None
 
 
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class _PerLoop:
+    """Lazily built async client bound to the running event loop (they cannot cross loops)."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._loop = None
+        self._value = None
+
+    def get(self):
+        loop = _running_loop()
+        if self._value is None or self._loop is not loop:
+            self._value = self._factory()
+            self._loop = loop
+        return self._value
+
+    def reset(self):
+        value, self._value, self._loop = self._value, None, None
+        return value
+
+
+def _build_shared_async_http():
+    import httpx  # type: ignore
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "200")),
+        max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "40")),
+        keepalive_expiry=60.0,
+    )
+    # Per-request timeouts come from each provider's SDK client
+    return httpx.AsyncClient(timeout=httpx.Timeout(60.0), limits=limits, http2=_http2_available())
+
+
+# One async keep-alive pool shared by every provider's async SDK client. Provider clients
+# never close it; close_providers() does on shutdown.
+_shared_async_http = _PerLoop(_build_shared_async_http)
+
+
+def _timeout_seconds(cfg: ProviderConfig, default: float = 45.0) -> float:
+    try:
+        return float((cfg.extra or {}).get("timeout_seconds", default))
+    except Exception:
+        return default
+
+
+def _is_rate_limit(e: Exception) -> bool:
+    err_str = str(e).lower()
+    return "429" in str(e) or "rate_limit" in err_str or "rate limit" in err_str
+
+
 class OpenAIProvider:
     def __init__(self, cfg: ProviderConfig):
-        from openai import OpenAI, AsyncOpenAI  # type: ignore
+        from openai import OpenAI  # type: ignore
         import httpx  # type: ignore
         # Apply a reasonable default timeout for GPT-5-mini and other models
         # GPT-5-mini can take 7-15s for complex queries, so allow more time
-        default_timeout = 45.0
-        try:
-            timeout_cfg = float((cfg.extra or {}).get("timeout_seconds", default_timeout))
-        except Exception:
-            timeout_cfg = default_timeout
-        self._timeout_seconds = timeout_cfg
+        self._timeout_seconds = _timeout_seconds(cfg)
+        self._cfg = cfg
         # Enforce timeouts via a dedicated httpx client
         # Set connect/read/write timeouts explicitly; total ~ provider default
-        http_timeout = httpx.Timeout(self._timeout_seconds, connect=self._timeout_seconds, read=self._timeout_seconds, write=self._timeout_seconds)
-        http_client = httpx.Client(timeout=http_timeout)
-        async_http_client = httpx.AsyncClient(timeout=http_timeout)
-        self.client = OpenAI(api_key=cfg.api_key, base_url=cfg.base_url, http_client=http_client)
-        self.async_client = AsyncOpenAI(api_key=cfg.api_key, base_url=cfg.base_url, http_client=async_http_client)
+        self._http_timeout = httpx.Timeout(self._timeout_seconds, connect=self._timeout_seconds, read=self._timeout_seconds, write=self._timeout_seconds)
+        # Keep-alive pool shared by every request made through this (pooled) provider
+        self._http_limits = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0)
+        self._http_client = httpx.Client(timeout=self._http_timeout, limits=self._http_limits, http2=_http2_available())
+        self.client = OpenAI(api_key=cfg.api_key, base_url=cfg.base_url, http_client=self._http_client)
+        self._async = _PerLoop(self._build_async_client)
+
+    def _build_async_client(self):
+        from openai import AsyncOpenAI  # type: ignore
+        return AsyncOpenAI(api_key=self._cfg.api_key, base_url=self._cfg.base_url, timeout=self._http_timeout, http_client=_shared_async_http.get())
+
+    @property
+    def async_client(self):
+        """AsyncOpenAI on the shared async pool, bound to the running event loop."""
+        return self._async.get()
+
+    def close(self) -> None:
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+    async def aclose(self) -> None:
+        # The async client only borrows the shared pool; dropping it is enough
+        self.close()
+        self._async.reset()
+
+    @staticmethod
+    def _result(resp: Any, started: float) -> Dict[str, Any]:
+        content = resp.choices[0].message.content or ""
+        usage = getattr(resp, "usage", None)
+        return {
+            "text": content,
+            "usage": usage.model_dump() if hasattr(usage, "model_dump") else {},
+            "latency_ms": int((time.time() - started) * 1000),
+        }
+
+    @staticmethod
+    def _error(e: Exception, started: float) -> Exception:
+        latency_ms = int((time.time() - started) * 1000)
+        # Detect 429 rate-limit responses and raise a typed error so callers
+        # can fall back to an alternative provider automatically.
+        if _is_rate_limit(e):
+            return RateLimitError(f"Rate limit exceeded: {e}")
+        return RuntimeError(f"LLM chat request failed after {latency_ms}ms: {e}")
 
     def chat(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         started = time.time()
@@ -56,22 +161,18 @@ class OpenAIProvider:
             # Call OpenAI chat completions. Avoid passing max_tokens to support newer models that require
             # different parameter names (e.g., max_completion_tokens). Keep defaults conservative server-side.
             resp = self.client.chat.completions.create(model=model, messages=final_messages)
-            content = resp.choices[0].message.content or ""
-            usage = getattr(resp, "usage", None)
-            latency_ms = int((time.time() - started) * 1000)
-            return {
-                "text": content,
-                "usage": usage.model_dump() if hasattr(usage, "model_dump") else {},
-                "latency_ms": latency_ms,
-            }
         except Exception as e:
-            latency_ms = int((time.time() - started) * 1000)
-            # Detect 429 rate-limit responses and raise a typed error so callers
-            # can fall back to an alternative provider automatically.
-            err_str = str(e).lower()
-            if "429" in str(e) or "rate_limit" in err_str or "rate limit" in err_str:
-                raise RateLimitError(f"Rate limit exceeded: {e}")
-            raise RuntimeError(f"LLM chat request failed after {latency_ms}ms: {e}")
+            raise self._error(e, started)
+        return self._result(resp, started)
+
+    async def achat(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        started = time.time()
+        final_messages = [{"role": "system", "content": system_prompt}] + messages
+        try:
+            resp = await self.async_client.chat.completions.create(model=model, messages=final_messages)
+        except Exception as e:
+            raise self._error(e, started)
+        return self._result(resp, started)
 
     async def chat_stream(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
         """Stream chat response chunks from OpenAI."""
@@ -82,12 +183,20 @@ class OpenAIProvider:
                 messages=final_messages,
                 stream=True
             )
+        except Exception as e:
+            raise RuntimeError(f"LLM streaming request failed: {e}")
+        try:
             async for chunk in stream:
+                if not chunk.choices:
+                    continue
                 delta = chunk.choices[0].delta
                 if hasattr(delta, 'content') and delta.content:
                     yield delta.content
         except Exception as e:
             raise RuntimeError(f"LLM streaming request failed: {e}")
+        finally:
+            # Also runs on cancellation / early close: stop the upstream response
+            await stream.close()
 
     def embed(self, *, model: str, texts: List[str]) -> List[List[float]]:
         try:
@@ -100,7 +209,23 @@ class OpenAIProvider:
 class AnthropicProvider:
     def __init__(self, cfg: ProviderConfig):
         import anthropic  # type: ignore
+        self._cfg = cfg
         self.client = anthropic.Anthropic(api_key=cfg.api_key)
+        self._async = _PerLoop(self._build_async_client)
+
+    def _build_async_client(self):
+        import anthropic  # type: ignore
+        return anthropic.AsyncAnthropic(api_key=self._cfg.api_key, timeout=_timeout_seconds(self._cfg, 60.0), http_client=_shared_async_http.get())
+
+    def close(self) -> None:
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+    async def aclose(self) -> None:
+        self.close()
+        self._async.reset()
 
     def chat(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         started = time.time()
@@ -112,38 +237,111 @@ class AnthropicProvider:
                 messages=messages,
             )
         except Exception as e:
-            err_str = str(e).lower()
-            if "429" in str(e) or "rate_limit" in err_str or "rate limit" in err_str:
+            if _is_rate_limit(e):
                 raise RateLimitError(f"Rate limit exceeded: {e}")
             raise
         content = "".join([b.text for b in resp.content if getattr(b, "type", "") == "text"])  # type: ignore
         latency_ms = int((time.time() - started) * 1000)
         return {"text": content, "usage": {}, "latency_ms": latency_ms}
 
+    async def achat(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        started = time.time()
+        try:
+            resp = await self._async.get().messages.create(
+                model=model,
+                max_tokens=4096,
+                system=system_prompt,
+                messages=messages,
+            )
+        except Exception as e:
+            if _is_rate_limit(e):
+                raise RateLimitError(f"Rate limit exceeded: {e}")
+            raise
+        content = "".join([b.text for b in resp.content if getattr(b, "type", "") == "text"])  # type: ignore
+        latency_ms = int((time.time() - started) * 1000)
+        return {"text": content, "usage": {}, "latency_ms": latency_ms}
+
+    async def chat_stream(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Stream chat response chunks from Anthropic."""
+        try:
+            # The context manager closes the response on exit, including cancellation
+            async with self._async.get().messages.stream(
+                model=model,
+                max_tokens=4096,
+                system=system_prompt,
+                messages=messages,
+            ) as stream:
+                async for text in stream.text_stream:
+                    if text:
+                        yield text
+        except Exception as e:
+            if _is_rate_limit(e):
+                raise RateLimitError(f"Rate limit exceeded: {e}")
+            raise RuntimeError(f"Anthropic streaming request failed: {e}")
+
     def embed(self, *, model: str, texts: List[str]) -> List[List[float]]:
         # Anthropic does not provide embeddings currently; leave unimplemented
         raise NotImplementedError("Anthropic embeddings not supported.")
 
 
+def _google_client(api_key: str, *, use_async: bool = False):
+    from google.ai import generativelanguage as glm  # type: ignore
+    cls = glm.GenerativeServiceAsyncClient if use_async else glm.GenerativeServiceClient
+    return cls(client_options={"api_key": api_key})
+
+
 class GoogleProvider:
     def __init__(self, cfg: ProviderConfig):
         import google.generativeai as genai  # type: ignore
-        genai.configure(api_key=cfg.api_key)
+        # Per-instance clients: genai.configure() sets one process-wide key, which pooled
+        # providers of different credentials would silently share
         self.genai = genai
+        self._client = _google_client(cfg.api_key)
+        self._async = _PerLoop(lambda: _google_client(cfg.api_key, use_async=True))
+        self._request_options = {"timeout": _timeout_seconds(cfg, 60.0)}
+
+    def _model(self, model: str, system_prompt: str):
+        # system_instruction keeps the system prompt separate (Gemini 1.5+)
+        m = self.genai.GenerativeModel(model, system_instruction=system_prompt)
+        # GenerativeModel falls back to the global default clients only when these are unset
+        m._client = self._client
+        m._async_client = self._async.get()
+        return m
 
     def chat(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         started = time.time()
         content = "\n".join([m.get("content", "") for m in messages])
-        # system_instruction keeps the system prompt separate (Gemini 1.5+)
-        model_ref = self.genai.GenerativeModel(
-            model,
-            system_instruction=system_prompt,
-        )
-        resp = model_ref.generate_content(content)
+        resp = self._model(model, system_prompt).generate_content(content)
+        text = getattr(resp, "text", "")
+        latency_ms = int((time.time() - started) * 1000)
+        return {"text": text, "usage": {}, "latency_ms": latency_ms}
+
+    async def achat(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        started = time.time()
+        content = "\n".join([m.get("content", "") for m in messages])
+        resp = await self._model(model, system_prompt).generate_content_async(content, request_options=self._request_options)
         text = getattr(resp, "text", "")
         latency_ms = int((time.time() - started) * 1000)
         return {"text": text, "usage": {}, "latency_ms": latency_ms}
 
+    async def chat_stream(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Stream chat response chunks from Gemini (gRPC async transport, not the shared HTTP pool)."""
+        content = "\n".join([m.get("content", "") for m in messages])
+        try:
+            resp = await self._model(model, system_prompt).generate_content_async(content, stream=True, request_options=self._request_options)
+            async for chunk in resp:
+                # Chunks without text parts (e.g. safety metadata) raise on .text
+                try:
+                    text = chunk.text
+                except Exception:
+                    text = ""
+                if text:
+                    yield text
+        except Exception as e:
+            if _is_rate_limit(e):
+                raise RateLimitError(f"Rate limit exceeded: {e}")
+            raise RuntimeError(f"Google streaming request failed: {e}")
+
     def embed(self, *, model: str, texts: List[str]) -> List[List[float]]:
         # Use embeddings if available; else fallback not implemented
         raise NotImplementedError("Google embeddings not wired; use OpenAI for embeddings.")
@@ -152,7 +350,23 @@ class GoogleProvider:
 class MistralProvider:
     def __init__(self, cfg: ProviderConfig):
         from mistralai import Mistral  # type: ignore
+        self._cfg = cfg
         self.client = Mistral(api_key=cfg.api_key)
+        self._async = _PerLoop(self._build_async_client)
+
+    def _build_async_client(self):
+        from mistralai import Mistral  # type: ignore
+        return Mistral(api_key=self._cfg.api_key, async_client=_shared_async_http.get(), timeout_ms=int(_timeout_seconds(self._cfg, 60.0) * 1000))
+
+    def close(self) -> None:
+        try:
+            self.client.__exit__(None, None, None)
+        except Exception:
+            pass
+
+    async def aclose(self) -> None:
+        self.close()
+        self._async.reset()
 
     def chat(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         started = time.time()
@@ -163,15 +377,25 @@ class MistralProvider:
         latency_ms = int((time.time() - started) * 1000)
         return {"text": text, "usage": {}, "latency_ms": latency_ms}
 
+    async def achat(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        started = time.time()
+        final_messages = [{"role": "system", "content": system_prompt}] + messages
+        resp = await self._async.get().chat.complete_async(model=model, messages=final_messages)
+        text = resp.choices[0].message.content
+        latency_ms = int((time.time() - started) * 1000)
+        return {"text": text, "usage": {}, "latency_ms": latency_ms}
+
     async def chat_stream(self, *, model: str, system_prompt: str, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
-        """Stream chat response chunks from Mistral."""
+        """Stream chat response chunks from Mistral without blocking the event loop."""
         final_messages = [{"role": "system", "content": system_prompt}] + messages
         try:
-            stream = self.client.chat.stream(model=model, messages=final_messages)
-            for chunk in stream:
-                delta = chunk.data.choices[0].delta
-                if hasattr(delta, 'content') and delta.content:
-                    yield delta.content
+            stream = await self._async.get().chat.stream_async(model=model, messages=final_messages)
+            # The context manager closes the response on exit, including cancellation
+            async with stream as events:
+                async for chunk in events:
+                    delta = chunk.data.choices[0].delta
+                    if hasattr(delta, 'content') and delta.content:
+                        yield delta.content
         except Exception as e:
             raise RuntimeError(f"Mistral streaming request failed: {e}")
 
@@ -196,3 +420,95 @@ def build_provider(provider: str, *, api_key: str, base_url: Optional[str] = Non
     raise ValueError(f"Unsupported provider: {provider}")
 
 
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # type: ignore  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+
+# Long-lived providers keyed by (provider, credential id, base_url, timeout). Each entry keeps a
+# fingerprint of the API key so a rotated credential transparently gets fresh clients.
+_registry: Dict[Tuple[str, str, str, str], Tuple[str, ChatProvider]] = {}
+_registry_lock = threading.Lock()
+# Providers replaced by a rotation stay open this long for requests and streams still using them
+_RETIRE_GRACE_SECONDS = float(os.getenv("LLM_PROVIDER_RETIRE_GRACE_SECONDS", "900"))
+_retired: List[Tuple[float, ChatProvider]] = []
+
+
+def _key_fingerprint(api_key: str) -> str:
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+
+
+def _close_quietly(provider: Any) -> None:
+    close = getattr(provider, "close", None)
+    if close:
+        try:
+            close()
+        except Exception:
+            pass
+
+
+def _close_retired(now: float) -> None:
+    with _registry_lock:
+        if not _retired or _retired[0][0] > now:
+            return
+        expired = [prov for deadline, prov in _retired if deadline <= now]
+        _retired[:] = [(deadline, prov) for deadline, prov in _retired if deadline > now]
+    for prov in expired:
+        _close_quietly(prov)
+
+
+def get_provider(provider: str, *, api_key: str, base_url: Optional[str] = None, extra: Optional[Dict[str, Any]] = None, credential_id: Optional[int] = None) -> ChatProvider:
+    """Pooled variant of :func:`build_provider` for request paths.
+
+    Providers (and their HTTP keep-alive pools) are reused across requests with the same
+    (provider, credential, base_url, timeout); callers without a credential id get one slot
+    per API key. A changed API key for the same credential builds
+    new clients; the old ones are closed once ``LLM_PROVIDER_RETIRE_GRACE_SECONDS`` have
+    passed, so requests and streams already using them can finish.
+    """
+    now = time.monotonic()
+    _close_retired(now)
+    timeout = str((extra or {}).get("timeout_seconds", ""))
+    fp = _key_fingerprint(api_key)
+    # Without a credential id the key itself identifies the slot (e.g. primary and fallback
+    # environment keys), so alternating keys do not count as rotations
+    key = (provider.lower(), str(credential_id or f"key:{fp[:16]}"), base_url or "", timeout)
+    with _registry_lock:
+        entry = _registry.get(key)
+        if entry and entry[0] == fp:
+            return entry[1]
+        built = build_provider(provider, api_key=api_key, base_url=base_url, extra=extra)
+        _registry[key] = (fp, built)
+        if entry:
+            _retired.append((now + _RETIRE_GRACE_SECONDS, entry[1]))
+    if entry:
+        logger.info(f"LLM credential rotated for {key[0]} (credential {key[1] or '-'}); rebuilt client")
+    return built
+
+
+async def close_providers() -> None:
+    """Close every pooled provider client (called on application shutdown)."""
+    with _registry_lock:
+        entries = list(_registry.values()) + _retired
+        _registry.clear()
+        _retired.clear()
+    for _, prov in entries:
+        aclose = getattr(prov, "aclose", None)
+        try:
+            if aclose:
+                await aclose()
+            else:
+                _close_quietly(prov)
+        except Exception:
+            pass
+    http = _shared_async_http.reset()
+    if http is not None:
+        try:
+            await http.aclose()
+        except Exception:
+            pass
@@ -2,12 +2,70 @@ from __future__ import annotations
 from typing import List, Dict, Any, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from time import perf_counter
+from app.observability.metrics import rag_vector_search_seconds, rag_hybrid_search_seconds, rag_query_embed_cache, rag_context_tokens
+from app.services.cache_service import cache_service
+from array import array
+from collections import OrderedDict
 import os
+import re
+import threading
+
+
+# In-process LRU of normalized query vectors (packed float32), in front of the Redis tier
+_QUERY_EMBED_LRU_SIZE = int(os.getenv("RAG_QUERY_EMBED_CACHE_SIZE", "1024"))
+_QUERY_EMBED_TTL = int(os.getenv("RAG_QUERY_EMBED_CACHE_TTL", "86400"))
+_query_embed_lru: "OrderedDict[Tuple[str, str], array]" = OrderedDict()
+_query_embed_lock = threading.Lock()
+
+
+def _normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", (query or "").strip()).casefold()
+
+
+def _count_query_embed(result: str) -> None:
+    try:
+        if rag_query_embed_cache:
+            rag_query_embed_cache.labels(result=result).inc()
+    except Exception:
+        pass
 
 
 def embed_query(db: Session, *, provider, embedding_model: str, query: str) -> List[float]:
     """Return a normalized embedding for the query.
 
+    Served from a two-tier cache keyed by (embedding model, normalized query):
+    an in-process LRU, then Redis (float32 bytes). Misses go to the provider.
+    """
+    key = (embedding_model, _normalize_query(query))
+    if _QUERY_EMBED_LRU_SIZE > 0:
+        with _query_embed_lock:
+            hit = _query_embed_lru.get(key)
+            if hit is not None:
+                _query_embed_lru.move_to_end(key)
+                _count_query_embed("memory")
+                return hit.tolist()
+
+    vec = cache_service.get_query_embedding(*key)
+    if vec:
+        _count_query_embed("redis")
+    else:
+        _count_query_embed("miss")
+        vec = _embed_query_uncached(db, provider=provider, embedding_model=embedding_model, query=query)
+        cache_service.set_query_embedding(*key, vec, ttl_seconds=_QUERY_EMBED_TTL)
+
+    if _QUERY_EMBED_LRU_SIZE > 0:
+        with _query_embed_lock:
+            _query_embed_lru[key] = array("f", vec)
+            _query_embed_lru.move_to_end(key)
+            while len(_query_embed_lru) > _QUERY_EMBED_LRU_SIZE:
+                _query_embed_lru.popitem(last=False)
+    return vec
+
+
+def _embed_query_uncached(db: Session, *, provider, embedding_model: str, query: str) -> List[float]:
+    """Embed the query with the provider and normalize it.
+
     Attempts provider.embed first. If the active chat provider does not
     implement embeddings, falls back to an OpenAI-compatible embeddings
     provider using OPENAI_API_KEY (or resolves the embedding credential
@@ -17,7 +75,7 @@ def embed_query(db: Session, *, provider, embedding_model: str, query: str) -> L
         vec = provider.embed(model=embedding_model, texts=[query])[0]
     except Exception:
         # Fallback: try OpenAI embeddings safely
-        from app.services.llm.providers import build_provider  # local import to avoid cycles
+        from app.services.llm.providers import get_provider  # local import to avoid cycles
         from app.services.credential_service import CredentialService
 
         api_key = os.getenv("OPENAI_API_KEY") or ""
@@ -60,7 +118,7 @@ def embed_query(db: Session, *, provider, embedding_model: str, query: str) -> L
         if not api_key:
             raise RuntimeError("No embedding provider available: set OPENAI_API_KEY or configure an OpenAI credential")
 
-        fallback = build_provider("openai", api_key=api_key)
+        fallback = get_provider("openai", api_key=api_key)
         vec = fallback.embed(model=embedding_model, texts=[query])[0]
 
     # Normalize for cosine if needed: pg uses cosine ops; upstream vectors may not be unit length
@@ -68,138 +126,413 @@ def embed_query(db: Session, *, provider, embedding_model: str, query: str) -> L
     return [x / norm for x in vec]
 
 
-def vector_search(db: Session, *, qvec: List[float], model: str, k: int, score_threshold: Optional[float], portfolio_id: Optional[int] = None, tables_filter: Optional[List[str]] = None, language_code: Optional[str] = None) -> List[Dict[str, Any]]:
-    # Ensure query vector is cast to the correct dimensional type to match stored vectors
-    dim = max(1, len(qvec))
-    portfolio_filter = ""
+_ALLOWED_SOURCE_TABLES = {
+    "portfolios",
+    "experiences",
+    "projects",
+    "sections",
+    "portfolio_attachments",
+    "project_attachments",
+    "skills",
+    "skill_types",
+    "category_types",
+    "languages",
+    "translations",
+}
+
+RETRIEVAL_MODES = ("vector", "hybrid")
+
+
+def _build_chunk_filters(*, portfolio_id: Optional[int], tables_filter: Optional[List[str]], language_code: Optional[str], tenant_id: Optional[str] = None, visibility: Optional[List[str]] = None) -> Tuple[str, Dict[str, Any]]:
+    """Return the shared ``rag_chunk c`` WHERE fragment and its bind params."""
+    filters = ""
+    params: Dict[str, Any] = {}
+    if tenant_id is not None:
+        filters += "\n          AND c.tenant_id = :tid\n        "
+        params["tid"] = tenant_id
+    if visibility:
+        filters += "\n          AND c.visibility = ANY(:visibility)\n        "
+        params["visibility"] = list(visibility)
     if portfolio_id is not None:
         # Restrict to chunks sourced from this portfolio's entities or attachments
-        portfolio_filter = (
+        # via the precomputed rag_source_portfolio map (see app.rag.scope)
+        filters += (
             """
-            AND (
-                (c.source_table = 'portfolios' AND c.source_id = CAST(:pid AS TEXT))
-             OR (c.source_table = 'experiences' AND c.source_id IN (
-                    SELECT CAST(e.id AS TEXT) FROM portfolio_experiences pe JOIN experiences e ON e.id = pe.experience_id WHERE pe.portfolio_id = :pid
-                ))
-             OR (c.source_table = 'projects' AND c.source_id IN (
-                    SELECT CAST(p.id AS TEXT) FROM portfolio_projects pp JOIN projects p ON p.id = pp.project_id WHERE pp.portfolio_id = :pid
-                ))
-             OR (c.source_table = 'sections' AND c.source_id IN (
-                    SELECT CAST(s.id AS TEXT) FROM portfolio_sections ps JOIN sections s ON s.id = ps.section_id WHERE ps.portfolio_id = :pid
-                ))
-             OR (c.source_table = 'portfolio_attachments' AND c.source_id IN (
-                    SELECT CAST(pa.id AS TEXT) FROM portfolio_attachments pa WHERE pa.portfolio_id = :pid
-                ))
-             OR (c.source_table = 'project_attachments' AND c.source_id IN (
-                    SELECT CAST(pa.id AS TEXT) FROM project_attachments pa WHERE pa.project_id IN (
-                        SELECT pp.project_id FROM portfolio_projects pp WHERE pp.portfolio_id = :pid
-                    )
-                ))
+            AND EXISTS (
+                SELECT 1 FROM rag_source_portfolio sp
+                WHERE sp.portfolio_id = :pid AND sp.source_table = c.source_table AND sp.source_id = c.source_id
             )
             """
         )
+        params["pid"] = portfolio_id
 
     # Optional filter by source_table (whitelist to avoid SQL injection)
-    table_filter_sql = ""
     if tables_filter:
-        allowed = {
-            "portfolios",
-            "experiences",
-            "projects",
-            "sections",
-            "portfolio_attachments",
-            "project_attachments",
-            "skills",
-            "skill_types",
-            "category_types",
-            "languages",
-            "translations",
-        }
-        safe_tables = [t for t in tables_filter if t in allowed]
+        safe_tables = [t for t in tables_filter if t in _ALLOWED_SOURCE_TABLES]
         if safe_tables:
             quoted = ", ".join([f"'{t}'" for t in safe_tables])
-            table_filter_sql = f"\n          AND c.source_table IN ({quoted})\n        "
+            filters += f"\n          AND c.source_table IN ({quoted})\n        "
 
     # Optional filter by language code
-    language_filter_sql = ""
     if language_code:
-        language_filter_sql = "\n          AND (c.lang = :lang_code OR c.lang IS NULL)\n        "
+        filters += "\n          AND (c.lang = :lang_code OR c.lang IS NULL)\n        "
+        params["lang_code"] = language_code
+    return filters, params
+
+
+def _row_to_item(r: Any) -> Dict[str, Any]:
+    return {
+        "chunk_id": r["chunk_id"],
+        "source_table": r["source_table"],
+        "source_id": r["source_id"],
+        "source_field": r["source_field"],
+        "part_index": r["part_index"],
+        "version": r["version"],
+        "text": r["text"],
+        "score": 1.0 - float(r["distance"]),  # cosine similarity proxy
+    }
+
+
+# ANN candidate pool sizing: the HNSW scan returns the nearest ``candidates`` rows for the
+# model/dimension, and deleted/out-of-scope chunks are filtered afterwards.
+ANN_MIN_CANDIDATES = int(os.getenv("RAG_ANN_MIN_CANDIDATES", "40"))
+ANN_MAX_CANDIDATES = int(os.getenv("RAG_ANN_MAX_CANDIDATES", "1000"))
+ANN_FILTERED_OVERSAMPLE = int(os.getenv("RAG_ANN_FILTERED_OVERSAMPLE", "10"))
 
-    sql = text(
-        f"""  # nosec B608 - all interpolated fragments are hardcoded SQL or built from a validated whitelist, no user data
-        WITH q AS (SELECT CAST(:q AS vector({dim})) AS qvec)
+
+def _ann_candidate_count(k: int, filtered: bool) -> int:
+    factor = ANN_FILTERED_OVERSAMPLE if filtered else 4
+    return max(ANN_MIN_CANDIDATES, min(ANN_MAX_CANDIDATES, k * factor))
+
+
+def _ann_cte(dim: int) -> str:
+    """Nearest-neighbour CTE ordered directly on the indexed expression.
+
+    ``embedding_vec::vector(dim)`` and the literal ``dim = N`` predicate match the
+    partial ``idx_rag_embedding_hnsw_<dim>`` indexes, and the query vector is a bound
+    constant, so the planner can serve ORDER BY ... LIMIT from the HNSW index.
+    """
+    return f"""
+        ann AS (
+          SELECT e.chunk_id, (e.embedding_vec::vector({dim}) <=> CAST(:q AS vector({dim}))) AS distance
+          FROM rag_embedding e
+          WHERE e.dim = {dim}
+            AND e.model = :m
+            AND e.modality = 'text'
+          ORDER BY e.embedding_vec::vector({dim}) <=> CAST(:q AS vector({dim}))
+          LIMIT :cand
+        )"""
+
+
+def _set_ef_search(db: Session, candidates: int) -> None:
+    # hnsw.ef_search bounds how many rows one index scan can return (default 40)
+    if candidates <= 40:
+        return
+    try:
+        with db.begin_nested():
+            db.execute(text("SELECT set_config('hnsw.ef_search', :ef, true)"), {"ef": str(candidates)})
+    except Exception:
+        pass
+
+
+def _vector_search_sql(dim: int, filter_sql: str):
+    return text(  # nosec B608 - all interpolated fragments are hardcoded SQL, integers, or built from a validated whitelist, no user data
+        f"""
+        WITH {_ann_cte(dim)}
         SELECT c.id as chunk_id, c.source_table, c.source_id, c.source_field, c.part_index, c.version,
-               c.text, (COALESCE(e.embedding_vec, e.embedding::vector) <=> q.qvec) AS distance
-        FROM rag_embedding e
-        JOIN rag_chunk c ON c.id = e.chunk_id
-        JOIN q ON TRUE
-        WHERE e.model = :m
-          AND e.modality = 'text'
-          AND e.dim = :d
-          AND c.is_deleted = FALSE
-          {portfolio_filter}
-          {table_filter_sql}
-          {language_filter_sql}
-        ORDER BY distance
+               c.text, ann.distance
+        FROM ann
+        JOIN rag_chunk c ON c.id = ann.chunk_id
+        WHERE c.is_deleted = FALSE
+          {filter_sql}
+        ORDER BY ann.distance
         LIMIT :k
         """
     )
+
+
+def vector_search(db: Session, *, qvec: List[float], model: str, k: int, score_threshold: Optional[float], portfolio_id: Optional[int] = None, tables_filter: Optional[List[str]] = None, language_code: Optional[str] = None, tenant_id: Optional[str] = None, visibility: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    # Ensure query vector is cast to the correct dimensional type to match stored vectors
+    dim = max(1, int(len(qvec)))
+    filter_sql, filter_params = _build_chunk_filters(portfolio_id=portfolio_id, tables_filter=tables_filter, language_code=language_code, tenant_id=tenant_id, visibility=visibility)
+    filtered = bool(filter_sql.strip())
+    candidates = _ann_candidate_count(k, filtered)
+
+    sql = _vector_search_sql(dim, filter_sql)
     qparam = "[" + ", ".join(str(x) for x in qvec) + "]"
-    params = {"q": qparam, "m": model, "k": k, "d": dim}
-    if portfolio_id is not None:
-        params["pid"] = portfolio_id
-    if language_code:
-        params["lang_code"] = language_code
-    
+    params = {"q": qparam, "m": model, "k": k, "cand": candidates, **filter_params}
+
+    t0 = perf_counter()
     try:
-        rows = db.execute(sql, params).mappings().all()
-    except Exception as e:
-        # If vector search fails, rollback and return empty results
-        try:
-            db.rollback()
-        except Exception:
-            pass
+        _set_ef_search(db, candidates)
+        # A savepoint, so a failed search does not roll back the caller's transaction
+        with db.begin_nested():
+            rows = db.execute(sql, params).mappings().all()
+        if len(rows) < k and filtered:
+            # Sparse scope: the ANN pool was exhausted by out-of-scope chunks.
+            # Fall back to an exact scan restricted to the (small) scoped set.
+            exact = text(  # nosec B608 - all interpolated fragments are hardcoded SQL, integers, or built from a validated whitelist, no user data
+                f"""
+                SELECT c.id as chunk_id, c.source_table, c.source_id, c.source_field, c.part_index, c.version,
+                       c.text, (e.embedding_vec::vector({dim}) <=> CAST(:q AS vector({dim}))) AS distance
+                FROM rag_chunk c
+                JOIN rag_embedding e ON e.chunk_id = c.id
+                WHERE e.dim = {dim}
+                  AND e.model = :m
+                  AND e.modality = 'text'
+                  AND c.is_deleted = FALSE
+                  {filter_sql}
+                ORDER BY distance
+                LIMIT :k
+                """
+            )
+            with db.begin_nested():
+                rows = db.execute(exact, params).mappings().all()
+    except Exception:
+        # If vector search fails, return empty results
         return []
-    
+    finally:
+        if rag_vector_search_seconds:
+            try:
+                rag_vector_search_seconds.observe(perf_counter() - t0)
+            except Exception:
+                pass
+
     items: List[Dict[str, Any]] = []
     for r in rows:
-        score = 1.0 - float(r["distance"])  # cosine similarity proxy
-        if score_threshold is not None and score < score_threshold:
+        item = _row_to_item(r)
+        if score_threshold is not None and item["score"] < score_threshold:
             continue
-        items.append({
-            "chunk_id": r["chunk_id"],
-            "source_table": r["source_table"],
-            "source_id": r["source_id"],
-            "source_field": r["source_field"],
-            "part_index": r["part_index"],
-            "version": r["version"],
-            "text": r["text"],
-            "score": score,
-        })
+        items.append(item)
     return items
 
 
-def assemble_context(chunks: List[Dict[str, Any]], *, max_tokens: int) -> Tuple[str, List[Dict[str, Any]]]:
-    # Approximate by characters (rough heuristic 1 token ~ 4 chars)
-    budget_chars = max(200, int(max_tokens * 4 * 0.9))
-    used = 0
-    context_parts: List[str] = []
-    citations: List[Dict[str, Any]] = []
-    for ch in chunks:
-        txt = ch.get("text") or ""
-        if not txt:
+def hybrid_search(db: Session, *, qvec: List[float], query_text: str, model: str, k: int, score_threshold: Optional[float], portfolio_id: Optional[int] = None, tables_filter: Optional[List[str]] = None, language_code: Optional[str] = None, rrf_k: int = 60, tenant_id: Optional[str] = None, visibility: Optional[List[str]] = None, match_all_terms: bool = False) -> List[Dict[str, Any]]:
+    """Full-text + vector retrieval fused with reciprocal-rank fusion (RRF).
+
+    Shared by agent chat and ``/api/search/hybrid``. Both legs run in a single
+    round-trip. The full-text leg matches the query against the generated
+    ``rag_chunk.tsv`` column, so exact keyword hits (e.g. "Kubernetes") are found
+    even when their cosine score is low. By default any query lexeme matches (chat
+    questions are natural language; RRF and ``ts_rank_cd`` rank chunks with more
+    terms higher); ``match_all_terms`` uses ``websearch_to_tsquery`` semantics
+    (every term, quoted phrases, ``-exclusions``) for a search box. ``score_threshold`` only prunes
+    chunks found by the vector leg alone. Each item carries ``score`` (cosine
+    similarity) and ``rrf_score``; if the query fails, plain ``vector_search``
+    results are returned instead.
+    """
+    dim = max(1, int(len(qvec)))
+    pool = max(k * 3, 20)
+    filter_sql, filter_params = _build_chunk_filters(portfolio_id=portfolio_id, tables_filter=tables_filter, language_code=language_code, tenant_id=tenant_id, visibility=visibility)
+    candidates = max(pool, _ann_candidate_count(k, bool(filter_sql.strip())))
+    if match_all_terms:
+        tsquery_sql = "websearch_to_tsquery('english', :term)"
+    else:
+        # OR the normalized lexemes ('kubernet' & 'project' -> 'kubernet' | 'project')
+        tsquery_sql = "CAST(replace(CAST(plainto_tsquery('english', :term) AS TEXT), ' & ', ' | ') AS tsquery)"
+
+    sql = text(  # nosec B608 - all interpolated fragments are hardcoded SQL or built from a validated whitelist, no user data
+        f"""
+        WITH
+        q AS (
+          SELECT {tsquery_sql} AS tsq
+        ),
+        {_ann_cte(dim)},
+        vs AS (
+          SELECT ann.chunk_id, ann.distance
+          FROM ann
+          JOIN rag_chunk c ON c.id = ann.chunk_id
+          WHERE c.is_deleted = FALSE
+            {filter_sql}
+          ORDER BY ann.distance
+          LIMIT :pool
+        ),
+        fts AS (
+          SELECT c.id AS chunk_id, ts_rank_cd(c.tsv, q.tsq) AS fts_score
+          FROM rag_chunk c
+          JOIN q ON TRUE
+          WHERE c.tsv @@ q.tsq
+            AND c.is_deleted = FALSE
+            {filter_sql}
+          ORDER BY fts_score DESC
+          LIMIT :pool
+        ),
+        fused AS (
+          SELECT chunk_id, SUM(rrf) AS rrf_score, BOOL_OR(from_fts) AS fts_hit
+          FROM (
+            SELECT chunk_id, 1.0 / (:rrf_k + ROW_NUMBER() OVER (ORDER BY distance ASC)) AS rrf, FALSE AS from_fts FROM vs
+            UNION ALL
+            SELECT chunk_id, 1.0 / (:rrf_k + ROW_NUMBER() OVER (ORDER BY fts_score DESC)) AS rrf, TRUE AS from_fts FROM fts
+          ) ranked
+          GROUP BY chunk_id
+        )
+        SELECT c.id AS chunk_id, c.source_table, c.source_id, c.source_field, c.part_index, c.version, c.text,
+               f.rrf_score, f.fts_hit,
+               (e.embedding_vec::vector({dim}) <=> CAST(:q AS vector({dim}))) AS distance
+        FROM fused f
+        JOIN rag_chunk c ON c.id = f.chunk_id
+        LEFT JOIN rag_embedding e ON e.chunk_id = c.id AND e.model = :m AND e.modality = 'text' AND e.dim = {dim}
+        ORDER BY f.rrf_score DESC
+        LIMIT :k
+        """
+    )
+    qparam = "[" + ", ".join(str(x) for x in qvec) + "]"
+    params = {"q": qparam, "term": query_text or "", "m": model, "k": k, "pool": pool, "cand": candidates, "rrf_k": rrf_k, **filter_params}
+
+    t0 = perf_counter()
+    try:
+        _set_ef_search(db, candidates)
+        with db.begin_nested():
+            rows = db.execute(sql, params).mappings().all()
+    except Exception:
+        # Degrade to plain vector retrieval rather than returning nothing
+        return vector_search(db, qvec=qvec, model=model, k=k, score_threshold=score_threshold, portfolio_id=portfolio_id, tables_filter=tables_filter, language_code=language_code, tenant_id=tenant_id, visibility=visibility)
+    finally:
+        if rag_hybrid_search_seconds:
+            try:
+                rag_hybrid_search_seconds.observe(perf_counter() - t0)
+            except Exception:
+                pass
+
+    items: List[Dict[str, Any]] = []
+    for r in rows:
+        item = _row_to_item({**r, "distance": r["distance"] if r["distance"] is not None else 1.0})
+        if score_threshold is not None and item["score"] < score_threshold and not r["fts_hit"]:
+            continue
+        item["rrf_score"] = float(r["rrf_score"])
+        items.append(item)
+    return items
+
+
+def retrieve_chunks(db: Session, *, mode: Optional[str], qvec: List[float], query_text: str, model: str, k: int, score_threshold: Optional[float], portfolio_id: Optional[int] = None, tables_filter: Optional[List[str]] = None, language_code: Optional[str] = None, rerank_provider: Optional[str] = None, rerank_model: Optional[str] = None, rerank_candidates: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Dispatch to the retrieval strategy configured on the agent (``Agent.retrieval_mode``).
+
+    With a rerank provider, a larger candidate pool is retrieved and reranked down to ``k``.
+    """
+    from app.rag.rerank import candidate_pool, rerank
+
+    pool = candidate_pool(k, rerank_provider, rerank_candidates)
+    if (mode or "vector").lower() == "hybrid":
+        items = hybrid_search(db, qvec=qvec, query_text=query_text, model=model, k=pool, score_threshold=score_threshold, portfolio_id=portfolio_id, tables_filter=tables_filter, language_code=language_code)
+    else:
+        items = vector_search(db, qvec=qvec, model=model, k=pool, score_threshold=score_threshold, portfolio_id=portfolio_id, tables_filter=tables_filter, language_code=language_code)
+    return rerank(query_text, items, provider=rerank_provider, model=rerank_model, top_k=k)
+
+
+_CONTEXT_SEPARATOR = "\n\n---\n\n"
+# A partially included passage shorter than this is more noise than signal
+_MIN_PARTIAL_TOKENS = int(os.getenv("RAG_CONTEXT_MIN_PARTIAL_TOKENS", "64"))
+# Overlaps shorter than this are not trusted as chunk_text overlap
+_MIN_OVERLAP_CHARS = 20
+
+
+def _strip_overlap(prev: str, nxt: str) -> str:
+    """Return ``nxt`` without the prefix it shares with the end of ``prev``.
+
+    chunk_text repeats the last CHUNK_OVERLAP characters of a chunk at the start of the
+    next one; try that length first, then search shorter/longer overlaps (the setting may
+    have changed since indexing).
+    """
+    configured = int(os.getenv("CHUNK_OVERLAP", "500"))
+    limit = min(len(prev), len(nxt))
+    if _MIN_OVERLAP_CHARS <= configured <= limit and prev.endswith(nxt[:configured]):
+        return nxt[configured:]
+    for k in range(min(limit, max(2 * configured, 1000)), _MIN_OVERLAP_CHARS - 1, -1):
+        if prev.endswith(nxt[:k]):
+            return nxt[k:]
+    return nxt
+
+
+def _merge_adjacent_chunks(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Group chunks of the same source field into passages of consecutive ``part_index``.
+
+    Each passage keeps the rank of its best chunk and its merged text has the chunking
+    overlap removed. Chunks without ``part_index`` stay single passages.
+    """
+    groups: Dict[Tuple[Any, ...], List[Tuple[int, Dict[str, Any]]]] = {}
+    for rank, ch in enumerate(chunks):
+        if not (ch.get("text") or ""):
             continue
-        take = min(len(txt), max(0, budget_chars - used))
-        if take <= 0:
-            break
-        context_parts.append(txt[:take])
-        used += take
-        citations.append({
+        if ch.get("part_index") is None:
+            key: Tuple[Any, ...] = ("chunk", ch.get("chunk_id"), rank)
+        else:
+            key = (ch.get("source_table"), ch.get("source_id"), ch.get("source_field"), ch.get("version"), ch.get("lang"))
+        groups.setdefault(key, []).append((rank, ch))
+
+    passages: List[Dict[str, Any]] = []
+    for members in groups.values():
+        members.sort(key=lambda m: (m[1].get("part_index") or 0))
+        run: List[Tuple[int, Dict[str, Any]]] = []
+        for m in members:
+            if run and (m[1].get("part_index") or 0) == (run[-1][1].get("part_index") or 0):
+                continue  # duplicate hit for the same part
+            if run and (m[1].get("part_index") or 0) != (run[-1][1].get("part_index") or 0) + 1:
+                passages.append(_passage(run))
+                run = []
+            run.append(m)
+        if run:
+            passages.append(_passage(run))
+    passages.sort(key=lambda p: p["rank"])
+    return passages
+
+
+def _passage(run: List[Tuple[int, Dict[str, Any]]]) -> Dict[str, Any]:
+    text_parts = [run[0][1]["text"]]
+    for (_, prev), (_, cur) in zip(run, run[1:]):
+        text_parts.append(_strip_overlap(prev["text"], cur["text"]))
+    best_rank = min(r for r, _ in run)
+    # Cite members best-first so the strongest hit leads
+    members = sorted(run, key=lambda m: m[0])
+    return {
+        "rank": best_rank,
+        "text": "".join(text_parts),
+        "citations": [{
             "chunk_id": ch["chunk_id"],
             "source_table": ch["source_table"],
             "source_id": ch["source_id"],
             "score": ch["score"],
-        })
-    return "\n\n---\n\n".join(context_parts), citations
+        } for _, ch in members],
+    }
+
+
+def assemble_context(chunks: List[Dict[str, Any]], *, max_tokens: int) -> Tuple[str, List[Dict[str, Any]]]:
+    """Pack retrieved chunks into at most ``max_tokens`` tokens of context.
+
+    Adjacent parts of the same source are merged with their overlap removed, then
+    passages are packed by score: passages that do not fit are skipped in favour of
+    smaller lower-ranked ones, and the best skipped passage is truncated into any
+    remaining space. Tokens are counted with the local tokenizer (app.rag.tokenizer).
+    """
+    from app.rag.tokenizer import count_tokens, truncate_to_tokens
+
+    budget = max(0, int(max_tokens or 0))
+    sep_tokens = count_tokens(_CONTEXT_SEPARATOR)
+    used = 0
+    taken: List[Tuple[int, str, List[Dict[str, Any]]]] = []
+    first_skipped: Optional[Dict[str, Any]] = None
+    for passage in _merge_adjacent_chunks(chunks):
+        cost = count_tokens(passage["text"]) + (sep_tokens if taken else 0)
+        if used + cost <= budget:
+            taken.append((passage["rank"], passage["text"], passage["citations"]))
+            used += cost
+        elif first_skipped is None:
+            first_skipped = passage
+    if first_skipped is not None:
+        room = budget - used - (sep_tokens if taken else 0)
+        if room >= _MIN_PARTIAL_TOKENS or not taken:
+            partial = truncate_to_tokens(first_skipped["text"], room)
+            if partial:
+                taken.append((first_skipped["rank"], partial, first_skipped["citations"]))
+                used += count_tokens(partial) + (sep_tokens if len(taken) > 1 else 0)
+    taken.sort(key=lambda t: t[0])
+    try:
+        if rag_context_tokens:
+            rag_context_tokens.observe(used)
+    except Exception:
+        pass
+    # Citation i labels context passage i in the prompt, so passage leads come first and
+    # the other merged parts follow
+    citations = [t[2][0] for t in taken] + [c for t in taken for c in t[2][1:]]
+    return _CONTEXT_SEPARATOR.join(t[1] for t in taken), citations
 
 
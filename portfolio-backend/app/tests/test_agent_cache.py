@@ -0,0 +1,43 @@
+import pytest
+
+from app.models.agent import Agent
+from app.services import agent_cache
+
+
+@pytest.fixture(autouse=True)
+def _local_only(monkeypatch):
+    monkeypatch.setattr(agent_cache, "_redis", False)
+    monkeypatch.setattr(agent_cache, "_subscriber", False)
+    monkeypatch.setenv("AGENT_CACHE_TTL_SECONDS", "60")
+    agent_cache.clear_local()
+    yield
+    agent_cache.clear_local()
+
+
+def test_get_or_load_caches_until_invalidated():
+    calls = []
+
+    def _load():
+        calls.append(1)
+        return len(calls)
+
+    assert agent_cache.get_or_load(("bundle", 1, None), _load) == 1
+    assert agent_cache.get_or_load(("bundle", 1, None), _load) == 1
+    agent_cache.invalidate_agent_cache()
+    assert agent_cache.get_or_load(("bundle", 1, None), _load) == 2
+
+
+def test_loader_errors_are_not_cached():
+    def _fail():
+        raise ValueError("Agent not found or inactive")
+
+    with pytest.raises(ValueError):
+        agent_cache.get_or_load(("bundle", 2, None), _fail)
+    assert agent_cache.get_or_load(("bundle", 2, None), lambda: "ok") == "ok"
+
+
+def test_snapshot_is_detached_copy():
+    agent = Agent(id=5, name="a", chat_model="gpt-4o-mini", top_k=8)
+    snap = agent_cache.snapshot(agent)
+    assert snap is not agent
+    assert (snap.id, snap.name, snap.chat_model, snap.top_k) == (5, "a", "gpt-4o-mini", 8)
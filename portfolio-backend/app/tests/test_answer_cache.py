@@ -0,0 +1,101 @@
+from app.rag import answer_cache
+
+
+class _Result:
+    def __init__(self, row):
+        self.row = row
+
+    def mappings(self):
+        return self
+
+    def first(self):
+        return self.row
+
+
+class _Savepoint:
+    def __init__(self, db):
+        self.db = db
+
+    def commit(self):
+        self.db.savepoints.append("commit")
+
+    def rollback(self):
+        self.db.savepoints.append("rollback")
+
+
+class _Session:
+    def __init__(self, row=None, fail=False):
+        self.row = row
+        self.fail = fail
+        self.statements = []
+        self.savepoints = []
+        self.committed = False
+
+    def begin_nested(self):
+        return _Savepoint(self)
+
+    def execute(self, sql, params=None):
+        self.statements.append((" ".join(str(sql).split()), params or {}))
+        if self.fail:
+            raise RuntimeError('relation "rag_answer_cache" does not exist')
+        return _Result(self.row)
+
+    def commit(self):
+        self.committed = True
+
+
+def _lookup(db):
+    return answer_cache.lookup_answer(
+        db, agent_id=1, portfolio_id=2, language_id=None, model="m", qvec=[0.1, 0.2], generation="3:4",
+    )
+
+
+def _store(db, **kw):
+    answer_cache.store_answer(
+        db, agent_id=1, portfolio_id=2, language_id=None, model="m", qvec=[0.1, 0.2],
+        query="q", answer="a", citations=[{"id": 1}], generation="3:4", **kw,
+    )
+
+
+def test_lookup_hits_only_above_the_threshold(monkeypatch):
+    monkeypatch.setenv("RAG_SEMANTIC_CACHE_THRESHOLD", "0.9")
+    hit = _lookup(_Session({"answer": "cached", "citations": '[{"id": 1}]', "similarity": 0.95}))
+    assert hit == {"answer": "cached", "citations": [{"id": 1}], "similarity": 0.95}
+
+    assert _lookup(_Session({"answer": "cached", "citations": [], "similarity": 0.85})) is None
+    db = _Session()
+    assert _lookup(db) is None
+    sql, params = db.statements[0]
+    assert "expires_at > NOW()" in sql
+    # Rows answered under a superseded cache generation are never served
+    assert "generation = :g" in sql and params["g"] == "3:4"
+    assert params["d"] == 2 and params["p"] == 2
+
+
+def test_store_caps_the_scope_and_throttles_the_expiry_purge(monkeypatch):
+    monkeypatch.setattr(answer_cache, "_MAX_PER_SCOPE", 5)
+    monkeypatch.setattr(answer_cache, "_next_purge", 0.0)
+    db = _Session()
+    _store(db, ttl_seconds=60)
+    _store(db, ttl_seconds=60)
+
+    sqls = [sql for sql, _ in db.statements]
+    assert sqls[0].startswith("INSERT INTO rag_answer_cache")
+    assert db.statements[0][1]["g"] == "3:4"
+    assert "expires_at <= NOW() OR id NOT IN" in sqls[1] and "LIMIT :cap" in sqls[1]
+    assert db.statements[1][1]["cap"] == 5 and db.statements[1][1]["ttl"] == 60
+    # The table-wide purge runs once per interval, not on every store
+    assert sqls.count("DELETE FROM rag_answer_cache WHERE expires_at <= NOW()") == 1
+    assert len(sqls) == 5
+    assert db.savepoints == ["commit", "commit"]
+    assert not db.committed
+
+
+def test_failures_only_roll_back_the_savepoint():
+    db = _Session(fail=True)
+    assert _lookup(db) is None
+    _store(db)
+    answer_cache.invalidate_portfolios(db, [2])
+    answer_cache.invalidate_agent(db, 1)
+    assert db.savepoints == ["rollback"] * 4
+    assert not db.committed
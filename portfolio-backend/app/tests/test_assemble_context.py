@@ -0,0 +1,41 @@
+from app.rag.chunking import chunk_text
+from app.rag.tokenizer import count_tokens
+from app.services.rag_service import assemble_context
+
+
+def _chunks(source_id, text, score, target=400, overlap=100):
+    return [
+        {"chunk_id": f"{source_id}-{i}", "source_table": "projects", "source_id": source_id,
+         "source_field": "description", "part_index": i, "version": 1, "text": part, "score": score - i * 0.01}
+        for i, part in enumerate(chunk_text(text, target, overlap))
+    ]
+
+
+def test_adjacent_parts_are_merged_without_overlap(monkeypatch):
+    monkeypatch.setenv("CHUNK_OVERLAP", "100")
+    body = " ".join(f"word{i}" for i in range(200))
+    chunks = _chunks("1", body, 0.9)
+    assert len(chunks) > 2
+    # Retrieval order does not matter for the merged text; citations stay best-first
+    ranked = list(reversed(chunks))
+    context, citations = assemble_context(ranked, max_tokens=10_000)
+    assert context == body
+    assert [c["chunk_id"] for c in citations] == [c["chunk_id"] for c in ranked]
+
+    # With several passages, citation i is the lead of passage i
+    other = _chunks("2", "x" * 300, 0.95)
+    context, citations = assemble_context(other + ranked, max_tokens=10_000)
+    assert len(context.split("\n\n---\n\n")) == 2
+    assert [c["source_id"] for c in citations[:2]] == ["2", "1"]
+
+
+def test_packs_by_score_under_token_budget(monkeypatch):
+    monkeypatch.setenv("CHUNK_OVERLAP", "100")
+    big = _chunks("1", "a" * 2000, 0.9, target=4000)
+    small = _chunks("2", "b" * 200, 0.5, target=4000)
+    budget = count_tokens("b" * 200) + 80
+    context, citations = assemble_context(big + small, max_tokens=budget)
+    assert count_tokens(context) <= budget
+    # The small passage fits whole; the larger, better-scored one fills the remaining room
+    assert context.startswith("a") and context.endswith("b" * 200)
+    assert [c["source_id"] for c in citations] == ["1", "2"]
@@ -0,0 +1,64 @@
+from app.services.cache_service import CacheService
+
+
+class _MemoryRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, *keys):
+        return [self.data.get(k) for k in keys]
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key) or 0) + 1)
+        return int(self.data[key])
+
+    def keys(self, pattern):  # pragma: no cover - must not be used
+        raise AssertionError("invalidation must not scan the keyspace")
+
+
+def _service(monkeypatch):
+    svc = CacheService()
+    svc._enabled = True
+    client = _MemoryRedis()
+    monkeypatch.setattr(svc, "_get_client", lambda: client)
+    return svc
+
+
+def test_portfolio_and_agent_invalidation_bump_generation(monkeypatch):
+    svc = _service(monkeypatch)
+    svc.set_agent_response(1, "What projects?", {"answer": "A"}, portfolio_id=7)
+    svc.set_agent_response(1, "What projects?", {"answer": "B"}, portfolio_id=8)
+    assert svc.get_agent_response(1, "what projects?", portfolio_id=7) == {"answer": "A"}
+
+    assert svc.invalidate_portfolio(7) == 1
+    assert svc.get_agent_response(1, "What projects?", portfolio_id=7) is None
+    assert svc.get_agent_response(1, "What projects?", portfolio_id=8) == {"answer": "B"}
+
+    svc.invalidate_agent(1)
+    assert svc.get_agent_response(1, "What projects?", portfolio_id=8) is None
+
+
+def test_unscoped_entries_use_shared_generation(monkeypatch):
+    svc = _service(monkeypatch)
+    svc.set_rag_chunks("q", [{"id": 1}])
+    assert svc.get_rag_chunks("q") == [{"id": 1}]
+    svc.invalidate_portfolio(None)
+    assert svc.get_rag_chunks("q") is None
+
+
+def test_answer_is_cached_under_the_generations_read_before_the_llm_call(monkeypatch):
+    svc = _service(monkeypatch)
+    generations = svc.cache_generations(1, 7)
+    assert svc.get_agent_response(1, "What projects?", portfolio_id=7, generations=generations) is None
+
+    # Content changes while the LLM answers from the old context
+    svc.invalidate_portfolio(7)
+    svc.set_agent_response(1, "What projects?", {"answer": "stale"}, portfolio_id=7, generations=generations)
+    assert svc.get_agent_response(1, "What projects?", portfolio_id=7) is None
+    assert svc.cache_generations(1, 7) == {"agent_gen": "0", "portfolio_gen": "1"}
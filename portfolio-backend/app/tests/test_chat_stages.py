@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.observability.timing import StageTimer
+from app.services import chat_service, citation_service
+
+
+def test_stage_result_degrades_on_timeout_and_error():
+    release = threading.Event()
+    slow = chat_service._stage_pool.submit(release.wait)
+    assert chat_service._stage_result(slow, "history", 0.01, []) == []
+    release.set()
+
+    def _boom():
+        raise ValueError("down")
+
+    failed = chat_service._stage_pool.submit(_boom)
+    assert chat_service._stage_result(failed, "enrich", 1.0, "fallback") == "fallback"
+    failed = chat_service._stage_pool.submit(_boom)
+    with pytest.raises(ValueError):
+        chat_service._stage_result(failed, "embed", 1.0, None, propagate=True)
+
+
+def test_peek_cached_metadata_never_queries(monkeypatch):
+    citation_service.clear_metadata_cache()
+    monkeypatch.setattr(citation_service, "_load_table_metadata", lambda *a, **k: {1: {"title": "Alpha", "type": "Project"}})
+    citation_service.get_sources_metadata(None, [("projects", "1")], 2)
+
+    cites = [{"source_table": "projects", "source_id": "1"}, {"source_table": "skills", "source_id": "9"}]
+    peeked = citation_service.peek_cached_metadata(cites, language_id=2)
+    assert peeked[0]["title"] == "Alpha"
+    assert peeked[1] == cites[1]
+    citation_service.clear_metadata_cache()
+
+
+class _Nested:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _RequestSession:
+    def begin_nested(self):
+        return _Nested()
+
+
+def test_citations_are_enriched_on_the_request_session(monkeypatch):
+    db = _RequestSession()
+    seen = []
+
+    def _enrich(session, citations, language_id=None):
+        seen.append(session)
+        return [{**c, "title": "Alpha"} for c in citations]
+
+    monkeypatch.setattr(chat_service, "enrich_citations", _enrich)
+    plan = chat_service.ChatPlan(
+        agent_id=1, session_id=None, user_message="q", language_code="en",
+        citations=[{"source_table": "projects", "source_id": "1", "chunk_id": 1}],
+    )
+    assert plan.enriched_citations(db)[0]["title"] == "Alpha"
+    assert seen == [db]
+
+    def _boom(*a, **k):
+        raise RuntimeError("metadata table missing")
+
+    monkeypatch.setattr(chat_service, "enrich_citations", _boom)
+    assert plan.enriched_citations(db) == plan.citations
+
+
+def test_enrichment_overlaps_the_llm_call_on_its_own_session(monkeypatch):
+    db = Session(bind=create_engine("sqlite://"))
+    seen = []
+
+    def _enrich(session, citations, language_id=None):
+        seen.append(session)
+        return [{**c, "title": "Alpha"} for c in citations]
+
+    monkeypatch.setattr(chat_service, "enrich_citations", _enrich)
+    plan = chat_service.ChatPlan(
+        agent_id=1, session_id=None, user_message="q", language_code="en",
+        citations=[{"source_table": "projects", "source_id": "1", "chunk_id": 1}],
+    )
+    plan.start_enrichment(db, StageTimer(agent_id=1))
+    assert plan.enriched_citations(db)[0]["title"] == "Alpha"
+    assert len(seen) == 1 and seen[0] is not db
+
+    # A failed overlapped stage falls back to the request session
+    plan = chat_service.ChatPlan(agent_id=1, session_id=None, user_message="q", language_code="en", citations=plan.citations)
+    calls = []
+
+    def _flaky(session, citations, language_id=None):
+        calls.append(session)
+        if len(calls) == 1:
+            raise RuntimeError("pool exhausted")
+        return citations
+
+    monkeypatch.setattr(chat_service, "enrich_citations", _flaky)
+    plan.start_enrichment(db, StageTimer(agent_id=1))
+    assert plan.enriched_citations(db) == plan.citations
+    assert calls[-1] is db
+
+
+def test_only_opening_questions_seed_the_semantic_cache(monkeypatch):
+    stored = []
+    monkeypatch.setattr(chat_service, "store_answer", lambda db, **kw: stored.append(kw["query"]))
+    monkeypatch.setattr(chat_service, "_persist_exchange", lambda db, **kw: 7)
+    monkeypatch.setattr(chat_service.cache_service, "set_agent_response", lambda **kw: None)
+
+    class _Agent:
+        embedding_model = "e"
+
+    for question, cacheable in (("what projects?", True), ("and the second one?", False)):
+        plan = chat_service.ChatPlan(
+            agent_id=1, session_id=7, user_message=question, language_code="en",
+            agent=_Agent(), qvec=[0.1], semantic_cacheable=cacheable,
+            cache_generations={"agent_gen": "1", "portfolio_gen": "2"},
+        )
+        chat_service.finish_chat(None, plan, answer="a", usage={}, latency_ms=1, timer=StageTimer(agent_id=1))
+    assert stored == ["what projects?"]
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import threading
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.api.endpoints import website
+from app.observability.timing import StageTimer
+from app.services import chat_service_async
+from app.services.chat_service import ChatPlan
+
+
+def _collect(agen):
+    async def _run():
+        return [item async for item in agen]
+    return asyncio.run(_run())
+
+
+def test_failover_only_before_first_token(monkeypatch):
+    calls = []
+
+    async def fake_events(db, *, agent_id, raise_before_first_token, **kwargs):
+        calls.append(agent_id)
+        if agent_id == 1:
+            raise RuntimeError("provider down")
+        yield {"type": "token", "content": "Hi"}
+        if agent_id == 2:
+            raise RuntimeError("dropped mid-answer")
+
+    monkeypatch.setattr(website, "stream_chat_events", fake_events)
+    payload = website.PublicPortfolioChatRequest(message="What projects?")
+    events = _collect(website._failover_attempts(
+        None, portfolio_id=5, default_agent_id=1, candidate_agent_ids=[1, 2, 3], payload=payload,
+    ))
+    # Agent 1 failed before any token: agent 2 takes over. Agent 2 failed after its first
+    # token: no restart with agent 3, the stream ends with the error.
+    assert calls == [1, 2]
+    assert events[0] == {"type": "token", "content": "Hi"}
+    assert events[-1]["type"] == "error"
+
+
+def test_sse_stream_coalesces_tokens_queued_behind_a_slow_client():
+    async def events():
+        yield {"type": "token", "content": "a"}
+        await asyncio.sleep(0.01)
+        for piece in ["b", "c"]:
+            yield {"type": "token", "content": piece}
+        yield {"type": "done", "citations": []}
+
+    async def _run():
+        out = []
+        stream = chat_service_async.sse_stream(events())
+        out.append(await stream.__anext__())
+        # Client busy: the pipeline keeps producing into the queue meanwhile
+        await asyncio.sleep(0.05)
+        async for chunk in stream:
+            out.append(chunk)
+        return [json.loads(chunk[len("data: "):]) for chunk in out]
+
+    sent = asyncio.run(_run())
+    assert sent == [
+        {"type": "token", "content": "a"},
+        {"type": "token", "content": "bc"},
+        {"type": "done", "citations": []},
+    ]
+
+
+def test_stream_db_stages_run_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def fake_prepare(db, **kwargs):
+        threads.append(threading.get_ident())
+        return ChatPlan(agent_id=1, session_id=3, user_message="hi", language_code="en", response={"answer": "Hello", "session_id": 3})
+
+    monkeypatch.setattr(chat_service_async, "prepare_chat", fake_prepare)
+    events = _collect(chat_service_async.stream_chat_events(
+        None, agent_id=1, user_message="hi", session_id=None, timer=StageTimer(agent_id=1),
+    ))
+    assert threads and threads[0] != threading.get_ident()
+    assert [e["type"] for e in events] == ["token", "done"]
+
+
+class _AsyncOnlyProvider:
+    def chat(self, **kwargs):
+        raise AssertionError("the async path must not block on the sync client")
+
+    async def achat(self, *, model, system_prompt, messages):
+        await asyncio.sleep(0)
+        return {"text": "Answer", "usage": {"total_tokens": 7}, "latency_ms": 12}
+
+
+def test_non_streaming_async_chat_awaits_the_provider(monkeypatch):
+    plan = ChatPlan(agent_id=1, session_id=None, user_message="hi", language_code="en",
+                    provider=_AsyncOnlyProvider(), chat_model="m", messages=[])
+    monkeypatch.setattr(chat_service_async, "prepare_chat", lambda db, **kwargs: plan)
+    monkeypatch.setattr(
+        chat_service_async, "finish_chat",
+        lambda db, p, *, answer, usage, latency_ms, timer: {"answer": answer, "token_usage": usage, "latency_ms": latency_ms},
+    )
+    result = asyncio.run(chat_service_async.run_agent_chat_async(None, agent_id=1, user_message="hi", session_id=None))
+    assert result == {"answer": "Answer", "token_usage": {"total_tokens": 7}, "latency_ms": 12}
+
+
+def test_stream_returns_its_connection_to_the_pool_while_the_llm_generates(monkeypatch, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/chat.db", pool_size=1, max_overflow=0)
+    checked_out = []
+
+    class _Provider:
+        async def chat_stream(self, *, model, system_prompt, messages):
+            for word in ["Hello", " there"]:
+                checked_out.append(engine.pool.checkedout())
+                yield word
+
+    def fake_prepare(db, **kwargs):
+        db.execute(text("SELECT 1"))
+        return ChatPlan(agent_id=1, session_id=None, user_message="hi", language_code="en", provider=_Provider(), chat_model="m")
+
+    def fake_finish(db, plan, *, answer, usage, latency_ms, timer):
+        db.execute(text("SELECT 1"))
+        checked_out.append(engine.pool.checkedout())
+        db.commit()
+        return {"answer": answer, "citations": [], "session_id": 1}
+
+    monkeypatch.setattr(chat_service_async, "prepare_chat", fake_prepare)
+    monkeypatch.setattr(chat_service_async, "finish_chat", fake_finish)
+    with Session(bind=engine) as db:
+        events = _collect(chat_service_async.stream_chat_events(
+            db, agent_id=1, user_message="hi", session_id=None, timer=StageTimer(agent_id=1),
+        ))
+    assert [e["type"] for e in events] == ["token", "token", "done"]
+    assert checked_out == [0, 0, 1]
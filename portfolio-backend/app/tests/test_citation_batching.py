@@ -0,0 +1,64 @@
+from app.services import citation_service
+
+
+class _Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self._rows
+
+
+class _Savepoint:
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class _RecordingSession:
+    """Answers the per-table batch queries from canned rows and records each call."""
+
+    def __init__(self, rows_by_table):
+        self.rows_by_table = rows_by_table
+        self.calls = []
+
+    def begin_nested(self):
+        return _Savepoint()
+
+    def execute(self, sql, params):
+        table = next(t for t in self.rows_by_table if f"FROM {t} " in str(sql))
+        self.calls.append((table, sorted(params["ids"])))
+        return _Result([r for r in self.rows_by_table[table] if r["id"] in params["ids"]])
+
+
+def test_enrich_citations_batches_per_table_and_caches():
+    citation_service.clear_metadata_cache()
+    db = _RecordingSession({
+        "projects": [
+            {"id": 1, "url": "https://a", "title": "Alpha", "description": "first"},
+            {"id": 2, "url": None, "title": "Beta", "description": "second"},
+        ],
+        "skills": [{"id": 5, "name": "Python", "description": "", "proficiency_level": "Expert"}],
+    })
+    cites = [
+        {"source_table": "projects", "source_id": "1", "chunk_id": 10, "score": 0.9},
+        {"source_table": "projects", "source_id": "2", "chunk_id": 11, "score": 0.8},
+        {"source_table": "skills", "source_id": "5", "chunk_id": 12, "score": 0.7},
+        {"source_table": "projects", "source_id": "3", "chunk_id": 13, "score": 0.6},
+        {"source_table": "unknown", "source_id": "9", "chunk_id": 14, "score": 0.5},
+    ]
+
+    out = citation_service.enrich_citations(db, cites)
+    assert sorted(db.calls) == [("projects", [1, 2, 3]), ("skills", [5])]
+    assert [c["title"] for c in out] == ["Alpha", "Beta", "Python", "Projects #3", "Unknown #9"]
+    assert out[0]["url"] == "https://a"
+    assert out[1]["url"] == "/admin/projects/2"
+
+    db.calls.clear()
+    citation_service.enrich_citations(db, cites)
+    assert db.calls == []
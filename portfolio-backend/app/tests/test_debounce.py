@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+
+from app.rag import debounce
+from app.rag.debounce import DebounceScheduler
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def _ev(op, sid="1", fields=()):
+    return {"op": op, "source_table": "projects", "source_id": sid, "changed_fields": list(fields)}
+
+
+def test_events_for_one_record_are_coalesced_within_the_window(monkeypatch):
+    monkeypatch.delenv("RAG_DEBOUNCE_BACKEND", raising=False)
+    sched = DebounceScheduler()
+    calls = []
+    sched.schedule(_ev("insert", fields=["title"]), calls.append, 0.1)
+    sched.schedule(_ev("update", fields=["body"]), calls.append, 0.1)
+    time.sleep(0.03)
+    assert calls == []
+
+    assert _wait_for(lambda: calls)
+    time.sleep(0.15)
+    assert len(calls) == 1
+    assert calls[0]["op"] == "update"
+    assert sorted(calls[0]["changed_fields"]) == ["body", "title"]
+    sched.stop()
+
+
+def test_delete_wins_and_keeps_its_dispatcher(monkeypatch):
+    monkeypatch.delenv("RAG_DEBOUNCE_BACKEND", raising=False)
+    sched = DebounceScheduler()
+    deletes, updates = [], []
+    sched.schedule(_ev("delete"), deletes.append, 0.05)
+    sched.schedule(_ev("update"), updates.append, 0.05)
+    assert _wait_for(lambda: deletes)
+    assert deletes[0]["op"] == "delete" and updates == []
+    sched.stop()
+
+
+def test_dispatchers_travel_through_redis_by_name():
+    from app.queue.tasks import enqueue_delete_job, enqueue_index_job
+
+    assert debounce._dispatch_ref(enqueue_index_job) == "index"
+    assert debounce._dispatch_ref(enqueue_delete_job) == "delete"
+    assert debounce._dispatch_ref(None) == "default"
+    assert debounce._dispatch_ref(lambda ev: None) is None
+
+
+class _ClaimRedis:
+    """Python stand-in for the sorted set + hash and the claim script (atomic under a lock)."""
+
+    def __init__(self):
+        self.due = {}
+        self.events = {}
+        self.lock = threading.Lock()
+
+    def zrangebyscore(self, key, lo, hi, start=0, num=None):
+        with self.lock:
+            return [k for k, d in sorted(self.due.items(), key=lambda kv: kv[1]) if d <= hi][start:num]
+
+    def claim(self, keys, args):
+        with self.lock:
+            if self.due.pop(args[0], None) is None:
+                return None
+            return self.events.pop(args[0], None)
+
+
+def test_each_due_redis_entry_is_claimed_by_one_worker(monkeypatch):
+    client = _ClaimRedis()
+    dispatched = []
+    monkeypatch.setattr(debounce, "_default_dispatch", dispatched.append)
+    for i in range(50):
+        key = f"projects:{i}"
+        client.due[key] = 0
+        client.events[key] = json.dumps({**_ev("update", sid=str(i)), "_dispatch": "default"})
+
+    workers = [DebounceScheduler() for _ in range(4)]
+    claimed = []
+    for w in workers:
+        w._claim = client.claim
+    threads = [threading.Thread(target=lambda w=w: claimed.extend(w._claim_due_redis(client, time.time()))) for w in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(int(ev["source_id"]) for ev, _ in claimed) == list(range(50))
+    for ev, fn in claimed:
+        assert "_dispatch" not in ev
+        fn(ev)
+    assert len(dispatched) == 50
+
+
+def test_shutdown_flush_is_bounded_and_parks_what_did_not_start(monkeypatch):
+    monkeypatch.delenv("RAG_DEBOUNCE_BACKEND", raising=False)
+    monkeypatch.setenv("RAG_DEBOUNCE_DISPATCH_WORKERS", "1")
+    parked = []
+    monkeypatch.setattr(debounce, "_dead_letter_undispatched", parked.append)
+    release = threading.Event()
+    sched = DebounceScheduler()
+    sched.schedule(_ev("update", sid="1"), lambda ev: release.wait(5), 60)
+    sched.schedule(_ev("update", sid="2"), lambda ev: None, 60)
+
+    t0 = time.time()
+    sched.stop(timeout=0.1)
+    assert time.time() - t0 < 1.0
+    assert [ev["source_id"] for ev in parked] == ["2"]
+    release.set()
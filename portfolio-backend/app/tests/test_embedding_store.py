@@ -0,0 +1,75 @@
+from app.rag.embedding import embed_text_batch, is_stub_vector
+from app.rag.embedding_store import lookup_embeddings, store_embeddings
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class _Savepoint:
+    def __init__(self, db):
+        self.db = db
+
+    def commit(self):
+        self.db.savepoints.append("commit")
+
+    def rollback(self):
+        self.db.savepoints.append("rollback")
+
+
+class _Session:
+    def __init__(self, rows=(), fail=False):
+        self.rows = list(rows)
+        self.fail = fail
+        self.statements = []
+        self.savepoints = []
+
+    def begin_nested(self):
+        return _Savepoint(self)
+
+    def execute(self, sql, params=None):
+        self.statements.append((str(sql), params or {}))
+        if self.fail:
+            raise RuntimeError('relation "rag_embedding_store" does not exist')
+        return _Result(self.rows)
+
+
+def test_lookup_ignores_vectors_of_another_dimension():
+    db = _Session([
+        {"checksum": "a", "dim": 3, "embedding": "[1,0,0]"},
+        {"checksum": "b", "dim": 1536, "embedding": "[...]"},
+    ])
+    assert lookup_embeddings(db, "m", ["a", "b", "a"], expected_dim=3) == {"a": (3, "[1,0,0]")}
+    assert sorted(db.statements[0][1]["cks"]) == ["a", "b"]
+    assert set(lookup_embeddings(db, "m", ["a", "b"])) == {"a", "b"}
+
+
+def test_missing_store_table_is_a_miss_and_only_rolls_back_the_savepoint():
+    db = _Session(fail=True)
+    assert lookup_embeddings(db, "m", ["a"]) == {}
+    store_embeddings(db, "m", [("a", 3, "[1,0,0]")])
+    assert db.savepoints == ["rollback", "rollback"]
+
+
+def test_store_upserts_one_multi_row_statement():
+    db = _Session()
+    store_embeddings(db, "m", [("a", 3, "[1,0,0]"), ("b", 3, "[0,1,0]")])
+    sql, params = db.statements[0]
+    assert "ON CONFLICT (model, checksum)" in sql
+    assert params == {"m": "m", "c0": "a", "d0": 3, "e0": "[1,0,0]", "c1": "b", "d1": 3, "e1": "[0,1,0]"}
+    assert db.savepoints == ["commit"]
+
+
+def test_placeholder_vectors_are_flagged(monkeypatch):
+    monkeypatch.delenv("EMBED_PROVIDER", raising=False)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    vectors = embed_text_batch(["hello"])
+    assert is_stub_vector(vectors[0])
+    assert not is_stub_vector(list(vectors[0]))
@@ -0,0 +1,88 @@
+from app.rag import embedding
+
+
+def test_embedding_dim_probe_runs_once_per_model(monkeypatch):
+    monkeypatch.setenv("EMBED_PROVIDER", "openai")
+    monkeypatch.setenv("EMBED_MODEL", "custom-embed")
+    embedding.reset_embedding_dims()
+    calls = []
+
+    def _fake_provider(provider, model, texts):
+        calls.append((provider, model, len(texts)))
+        return [[0.0] * 12 for _ in texts]
+
+    monkeypatch.setattr(embedding, "_embed_with_provider", _fake_provider)
+    assert embedding.get_embedding_dim() == 12
+    assert embedding.get_embedding_dim() == 12
+    assert len(calls) == 1
+
+    # Known models never hit the provider; a model switch resolves afresh
+    monkeypatch.setenv("EMBED_MODEL", "text-embedding-3-small")
+    assert embedding.get_embedding_dim() == 1536
+    assert len(calls) == 1
+
+    # A real embedding call fills the registry for models not seen yet
+    monkeypatch.setenv("EMBED_MODEL", "other-embed")
+    embedding.embed_text_batch(["hello"])
+    assert embedding.get_embedding_dim() == 12
+    assert len(calls) == 2
+    embedding.reset_embedding_dims()
+
+
+def test_failed_dimension_probe_is_not_retried_per_record(monkeypatch):
+    monkeypatch.setenv("EMBED_PROVIDER", "openai")
+    monkeypatch.setenv("EMBED_MODEL", "unreachable-embed")
+    embedding.reset_embedding_dims()
+    calls = []
+
+    def _down(provider, model, texts):
+        calls.append(model)
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(embedding, "_embed_with_provider", _down)
+    assert [embedding.get_embedding_dim() for _ in range(5)] == [0] * 5
+    assert len(calls) == 1
+
+    # Once the retry interval has passed the probe runs again
+    monkeypatch.setattr(embedding, "_DIM_RETRY_SECONDS", 0.0)
+    embedding.reset_embedding_dims()
+    assert embedding.get_embedding_dim() == 0
+    monkeypatch.setattr(embedding, "_embed_with_provider", lambda provider, model, texts: [[0.0] * 4])
+    assert embedding.get_embedding_dim() == 4
+    embedding.reset_embedding_dims()
+
+
+def test_embedding_batcher_coalesces_concurrent_producers():
+    import threading
+
+    calls = []
+
+    def _fake_embed(texts):
+        calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    batcher = embedding.EmbeddingBatcher(embed_fn=_fake_embed, max_items=64, max_wait_ms=2000)
+    results = {}
+    start = threading.Barrier(4)
+
+    def _worker(n):
+        with batcher.producer():
+            start.wait()
+            results[n] = batcher.embed(["x" * n, "y" * (n + 10)])
+
+    threads = [threading.Thread(target=_worker, args=(n,)) for n in range(1, 5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+
+    # All four producers were waiting, so one provider call served everyone ("idle" flush)
+    assert len(calls) == 1 and len(calls[0]) == 8
+    for n in range(1, 5):
+        assert results[n] == [[float(n)], [float(n + 10)]]
+
+    # Size cap splits the work
+    small = embedding.EmbeddingBatcher(embed_fn=_fake_embed, max_items=3, max_wait_ms=0)
+    calls.clear()
+    assert len(small.embed(["a"] * 7)) == 7
+    assert [len(c) for c in calls] == [3, 3, 1]
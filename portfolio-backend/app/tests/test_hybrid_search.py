@@ -0,0 +1,75 @@
+from contextlib import contextmanager
+
+from app.services import rag_service
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class _Session:
+    def __init__(self, rows, fail_hybrid=False):
+        self.rows = rows
+        self.fail_hybrid = fail_hybrid
+        self.statements = []
+        self.rolled_back = False
+
+    @contextmanager
+    def begin_nested(self):
+        yield
+
+    def execute(self, sql, params=None):
+        sql = str(sql)
+        self.statements.append((sql, params or {}))
+        if self.fail_hybrid and "tsquery" in sql:
+            raise RuntimeError("tsvector column missing")
+        return _Result(self.rows)
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def _row(chunk_id, distance, **extra):
+    return {
+        "chunk_id": chunk_id, "source_table": "projects", "source_id": chunk_id, "source_field": "description",
+        "part_index": 0, "version": 1, "text": f"chunk {chunk_id}", "distance": distance, **extra,
+    }
+
+
+def test_hybrid_keeps_keyword_hits_below_threshold_and_scopes_by_tenant():
+    db = _Session([
+        _row(1, 0.1, rrf_score=0.03, fts_hit=False),
+        _row(2, 0.9, rrf_score=0.02, fts_hit=True),
+        _row(3, 0.9, rrf_score=0.01, fts_hit=False),
+    ])
+    items = rag_service.retrieve_chunks(
+        db, mode="hybrid", qvec=[0.1, 0.2], query_text="kubernetes", model="m", k=5, score_threshold=0.5,
+    )
+    assert [it["chunk_id"] for it in items] == [1, 2]
+    assert items[1]["rrf_score"] == 0.02
+    # Chat questions match on any term; the search box requires all of them
+    assert "' & ', ' | '" in db.statements[-1][0] and "websearch_to_tsquery" not in db.statements[-1][0]
+
+    rag_service.hybrid_search(
+        db, qvec=[0.1, 0.2], query_text="kubernetes", model="m", k=5, score_threshold=None,
+        tenant_id="default", visibility=["public", "internal"], match_all_terms=True,
+    )
+    sql, params = db.statements[-1]
+    assert "websearch_to_tsquery('english', :term)" in sql
+    assert "c.tenant_id = :tid" in sql and "c.visibility = ANY(:visibility)" in sql
+    assert params["tid"] == "default" and params["visibility"] == ["public", "internal"]
+
+
+def test_hybrid_falls_back_to_vector_search_without_rolling_back_the_caller():
+    db = _Session([_row(4, 0.2)], fail_hybrid=True)
+    items = rag_service.hybrid_search(db, qvec=[0.1, 0.2], query_text="q", model="m", k=5, score_threshold=None)
+    assert [it["chunk_id"] for it in items] == [4]
+    assert "rrf_score" not in items[0]
+    assert not db.rolled_back
@@ -3,10 +3,7 @@ from sqlalchemy.orm import sessionmaker
 from app.rag.indexer import index_record, retire_record
 
 
-def test_indexer_upsert_and_retire_smoke(tmp_path):
-    # Use in-memory sqlite for a fast structural smoke (will skip vector specifics)
-    engine = create_engine('sqlite:///:memory:', future=True)
-    Session = sessionmaker(bind=engine, future=True)
+def _chunk_tables(engine):
     # Create minimal tables the indexer touches
     with engine.begin() as conn:
         conn.execute(text(
@@ -35,8 +32,8 @@ def test_indexer_upsert_and_retire_smoke(tmp_path):
         ))
         conn.execute(text(
             """
-            CREATE UNIQUE INDEX uq_rag_chunk_logical
-            ON rag_chunk(source_table, source_id, source_field, part_index, version);
+            CREATE UNIQUE INDEX uq_rag_chunk_logical_lang
+            ON rag_chunk(source_table, source_id, source_field, part_index, version, (COALESCE(lang, '')));
             """
         ))
         conn.execute(text(
@@ -47,11 +44,19 @@ def test_indexer_upsert_and_retire_smoke(tmp_path):
                 modality TEXT NOT NULL,
                 dim INTEGER NOT NULL,
                 embedding TEXT NOT NULL,
+                embedding_vec TEXT,
                 PRIMARY KEY(chunk_id, model, modality)
             );
             """
         ))
 
+
+def test_indexer_upsert_and_retire_smoke(tmp_path):
+    # Use in-memory sqlite for a fast structural smoke (will skip vector specifics)
+    engine = create_engine('sqlite:///:memory:', future=True)
+    Session = sessionmaker(bind=engine, future=True)
+    _chunk_tables(engine)
+
     with Session() as db:
         # Indexing a non-existent source results in retire (no-op here)
         retire_record(db, 'categories', '999')
@@ -65,3 +70,116 @@ def test_indexer_upsert_and_retire_smoke(tmp_path):
         assert rows[0][0] >= 1
 
 
+
+
+class _Counter:
+    def __init__(self):
+        self.total = 0
+
+    def inc(self, n=1):
+        self.total += n
+
+
+def test_bulk_upsert_path_diffs_against_existing_chunks(tmp_path, monkeypatch):
+    from app.rag import indexer
+
+    engine = create_engine(f"sqlite:///{tmp_path}/bulk.db", future=True)
+    Session = sessionmaker(bind=engine, future=True)
+    _chunk_tables(engine)
+
+    fields = {"title": "Kubernetes platform", "description": "Built a deployment pipeline"}
+    embedded = []
+    counters = {name: _Counter() for name in ("rag_chunks_new", "rag_chunks_updated", "rag_chunks_skipped")}
+    for name, counter in counters.items():
+        monkeypatch.setattr(indexer, name, counter)
+    monkeypatch.setattr(indexer, "_build_canonical_fields", lambda record, table, lang: dict(fields))
+    monkeypatch.setattr(indexer, "get_embedding_dim", lambda db, model: 3)
+    monkeypatch.setattr(indexer, "_set_status", lambda db, table, rid, error: None)
+
+    def _embed(texts):
+        embedded.extend(texts)
+        return [[1.0, 0.0, 0.0] for _ in texts]
+
+    monkeypatch.setattr(indexer, "embed_texts", _embed)
+
+    def _state(db):
+        chunks = {r[1]: r[0] for r in db.execute(text("SELECT id, source_field FROM rag_chunk WHERE is_deleted = 0"))}
+        embeddings = [r[0] for r in db.execute(text("SELECT chunk_id FROM rag_embedding ORDER BY chunk_id"))]
+        return chunks, embeddings
+
+    with Session() as db:
+        indexer._index_record_for_language(db, "projects", "1", {"id": 1}, None)
+        first_ids, first_embeddings = _state(db)
+        assert counters["rag_chunks_new"].total == 2
+        assert sorted(first_embeddings) == sorted(first_ids.values())
+
+        fields["description"] = "Built a GitOps deployment pipeline"
+        embedded.clear()
+        indexer._index_record_for_language(db, "projects", "1", {"id": 1}, None)
+        ids, embeddings = _state(db)
+
+    assert counters["rag_chunks_new"].total == 2
+    assert counters["rag_chunks_updated"].total == 1
+    assert counters["rag_chunks_skipped"].total == 1
+    assert ids == first_ids
+    assert embedded == ["Built a GitOps deployment pipeline"]
+    assert sorted(embeddings) == sorted(ids.values())
+
+
+def test_cached_answers_are_invalidated_only_when_chunks_change(monkeypatch):
+    from app.rag import indexer
+
+    changed = {"en": False, "fr": False}
+    invalidated = []
+    record = {"id": 1, "texts": [{"language_code": "en"}, {"language_code": "fr"}]}
+    monkeypatch.setattr(indexer, "_load_current_state", lambda db, table, rid: record)
+    monkeypatch.setattr(indexer, "_index_record_for_language", lambda db, table, rid, rec, lang: changed[lang])
+    monkeypatch.setattr(indexer, "retire_other_languages", lambda db, table, rid, langs: 0)
+    monkeypatch.setattr(indexer, "sync_source_scope", lambda db, table, rid: None)
+    monkeypatch.setattr(indexer, "_invalidate_cached_answers", lambda db, table, rid: invalidated.append((table, rid)))
+
+    index_record(None, "projects", "1")
+    assert invalidated == []
+
+    changed["fr"] = True
+    index_record(None, "projects", "1")
+    assert invalidated == [("projects", "1")]
+
+
+def test_languages_keep_their_own_chunks(tmp_path, monkeypatch):
+    from app.rag import indexer
+
+    engine = create_engine(f"sqlite:///{tmp_path}/langs.db", future=True)
+    Session = sessionmaker(bind=engine, future=True)
+    _chunk_tables(engine)
+
+    record = {"id": 1, "texts": [
+        {"language_code": "en", "name": "Platform", "description": "Built a deployment pipeline"},
+        {"language_code": "es", "name": "Plataforma", "description": "Construí un pipeline de despliegue"},
+    ]}
+    invalidated = []
+    monkeypatch.setattr(indexer, "_load_current_state", lambda db, table, rid: record)
+    monkeypatch.setattr(indexer, "get_embedding_dim", lambda db, model: 3)
+    monkeypatch.setattr(indexer, "_set_status", lambda db, table, rid, error: None)
+    monkeypatch.setattr(indexer, "embed_texts", lambda texts: [[1.0, 0.0, 0.0] for _ in texts])
+    monkeypatch.setattr(indexer, "sync_source_scope", lambda db, table, rid: None)
+    monkeypatch.setattr(indexer, "_invalidate_cached_answers", lambda db, table, rid: invalidated.append(rid))
+
+    def _live(db):
+        return sorted(r[0] for r in db.execute(text("SELECT lang FROM rag_chunk WHERE is_deleted = 0")))
+
+    with Session() as db:
+        index_record(db, "projects", "1", raise_errors=True)
+        assert _live(db) == ["en", "es"]
+        assert invalidated == ["1"]
+
+        # Re-indexing unchanged content rewrites nothing and keeps cached answers
+        index_record(db, "projects", "1", raise_errors=True)
+        assert _live(db) == ["en", "es"]
+        assert invalidated == ["1"]
+
+        # A dropped translation retires only that language's chunks
+        record["texts"] = record["texts"][:1]
+        index_record(db, "projects", "1", raise_errors=True)
+        assert _live(db) == ["en"]
+        assert invalidated == ["1", "1"]
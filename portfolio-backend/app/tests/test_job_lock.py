@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+from app.queue import job_lock
+
+
+def test_local_lease_dedups_and_reruns_once():
+    started = threading.Event()
+    release = threading.Event()
+    runs = []
+
+    def _slow_job():
+        runs.append(1)
+        if len(runs) == 1:
+            started.set()
+            release.wait(timeout=5)
+
+    holder = threading.Thread(target=lambda: job_lock.run_exclusive("index", "projects", "1", _slow_job, backend="local"))
+    holder.start()
+    assert started.wait(timeout=5)
+    # Duplicates while the job runs do not execute; they collapse into a single rerun
+    assert job_lock.run_exclusive("index", "projects", "1", _slow_job, backend="local") is False
+    assert job_lock.run_exclusive("index", "projects", "1", _slow_job, backend="local") is False
+    release.set()
+    holder.join(timeout=5)
+    assert len(runs) == 2
+
+
+def test_local_lease_released_on_failure():
+    def _boom():
+        raise RuntimeError("fail")
+
+    with pytest.raises(RuntimeError):
+        job_lock.run_exclusive("index", "projects", "2", _boom, backend="local")
+    ran = []
+    assert job_lock.run_exclusive("index", "projects", "2", lambda: ran.append(1), backend="local") is True
+    assert ran == [1]
+
+
+class _PgState:
+    """Advisory locks and rag_job_rerun rows shared by the fake connections."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.holders = {}
+        self.marks = set()
+
+
+class _Scalar:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+    def first(self):
+        return (1,) if self.value else None
+
+
+class _PgConn:
+    def __init__(self, state):
+        self.state = state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        sql, key = str(sql), params["k"]
+        with self.state.lock:
+            if "pg_try_advisory_lock" in sql:
+                if self.state.holders.get(key, self) is not self:
+                    return _Scalar(False)
+                self.state.holders[key] = self
+                return _Scalar(True)
+            if "pg_advisory_unlock" in sql:
+                self.state.holders.pop(key, None)
+            elif sql.startswith("INSERT INTO rag_job_rerun"):
+                self.state.marks.add(key)
+            elif sql.startswith("DELETE FROM rag_job_rerun"):
+                self.state.marks.discard(key)
+            elif "FROM rag_job_rerun" in sql:
+                return _Scalar(key in self.state.marks)
+        return _Scalar(None)
+
+    def commit(self):
+        pass
+
+    def invalidate(self):
+        pass
+
+
+def test_postgres_duplicate_leaves_a_rerun_mark_for_the_holder(monkeypatch):
+    from app.core import database
+
+    state = _PgState()
+    monkeypatch.setattr(database, "engine", type("Engine", (), {"connect": lambda self: _PgConn(state)})())
+    started = threading.Event()
+    release = threading.Event()
+    runs = []
+
+    def _slow_job():
+        runs.append(1)
+        if len(runs) == 1:
+            started.set()
+            release.wait(timeout=5)
+
+    holder = threading.Thread(target=lambda: job_lock.run_exclusive("index", "projects", "3", _slow_job, backend="postgres"))
+    holder.start()
+    assert started.wait(timeout=5)
+    # The duplicate returns at once instead of waiting; its event is not lost
+    assert job_lock.run_exclusive("index", "projects", "3", _slow_job, backend="postgres") is False
+    release.set()
+    holder.join(timeout=5)
+    assert len(runs) == 2
+    assert state.marks == set() and state.holders == {}
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+from app.core import security_decorators
+from app.core.security_decorators import PermissionChecker, _invalidate_after_commit, mark_permissions_changed
+from app.services.cache_service import CacheService
+
+
+class _MemoryRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    def mget(self, *keys):
+        return [self.data.get(k) for k in keys]
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+        self.ttls[key] = ttl
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key) or 0) + 1)
+        return int(self.data[key])
+
+
+def _user(user_id, *permission_names):
+    role = SimpleNamespace(permissions=[SimpleNamespace(name=n) for n in permission_names])
+    return SimpleNamespace(id=user_id, username=f"user{user_id}", roles=[role])
+
+
+def _checker(monkeypatch):
+    svc = CacheService()
+    svc._enabled = True
+    client = _MemoryRedis()
+    monkeypatch.setattr(svc, "_get_client", lambda: client)
+    monkeypatch.setattr(security_decorators, "cache_service", svc)
+    checker = PermissionChecker()
+    monkeypatch.setattr(security_decorators, "permission_checker", checker)
+    return checker
+
+
+def test_manage_permissions_are_expanded_and_shared_between_workers(monkeypatch):
+    checker = _checker(monkeypatch)
+    assert checker.user_has_permission(_user(1, "MANAGE_PROJECTS"), "EDIT_PROJECT_IMAGES")
+    assert not checker.user_has_permission(_user(1, "MANAGE_PROJECTS"), "EDIT_PORTFOLIO")
+
+    # Another worker finds the flattened set in Redis without touching the roles
+    other = PermissionChecker()
+    assert "DELETE_PROJECT" in other.effective_permissions(SimpleNamespace(id=1, username="user1"))
+
+
+def test_redis_entries_expire_with_the_local_cache(monkeypatch):
+    monkeypatch.setattr(security_decorators, "_PERMISSION_CACHE_TTL", 45.0)
+    checker = _checker(monkeypatch)
+    checker.user_has_permission(_user(3, "VIEW_ROLES"), "VIEW_ROLES")
+    # A lost INCR leaves the entry stale for at most the same bound as a process-local copy
+    assert security_decorators.cache_service._get_client().ttls == {"authz:user:3": 45}
+
+
+def test_committed_role_changes_invalidate_cached_sets(monkeypatch):
+    checker = _checker(monkeypatch)
+    assert not checker.user_has_permission(_user(2, "VIEW_ROLES"), "EDIT_ROLE")
+    # Stale until the change is committed
+    assert not checker.user_has_permission(_user(2, "MANAGE_ROLES"), "EDIT_ROLE")
+
+    session = SimpleNamespace(info={})
+    mark_permissions_changed(session)
+    _invalidate_after_commit(session)
+    assert checker.user_has_permission(_user(2, "MANAGE_ROLES"), "EDIT_ROLE")
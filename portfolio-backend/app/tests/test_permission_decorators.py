@@ -0,0 +1,72 @@
+import asyncio
+import inspect
+import threading
+
+from fastapi import Depends, FastAPI
+
+from app.core.security_decorators import require_any_permission, require_permission
+from app.models.user import User
+
+
+def _call(app, path):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [], "client": ("test", 1), "server": ("test", 80),
+    }
+
+    async def _run():
+        await app(scope, receive, send)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(_run())
+    status = next(m["status"] for m in messages if m["type"] == "http.response.start")
+    return status, loop_thread
+
+
+def test_sync_endpoints_stay_sync_and_run_in_threadpool():
+    app = FastAPI()
+    seen = {}
+
+    def admin():
+        return User(username="systemadmin")
+
+    def visitor():
+        return User(username="visitor")
+
+    @app.get("/admin")
+    @require_permission("EDIT_PROJECT")
+    def admin_endpoint(current_user: User = Depends(admin)):
+        seen["thread"] = threading.get_ident()
+        return {"ok": True}
+
+    @app.get("/visitor")
+    @require_any_permission(["EDIT_PROJECT", "MANAGE_PROJECTS"])
+    def visitor_endpoint(current_user: User = Depends(visitor)):
+        return {"ok": True}
+
+    assert not inspect.iscoroutinefunction(admin_endpoint)
+
+    status, loop_thread = _call(app, "/admin")
+    assert status == 200
+    assert seen["thread"] != loop_thread
+
+    status, _ = _call(app, "/visitor")
+    assert status == 403
+
+
+def test_async_endpoints_stay_async():
+    @require_permission("EDIT_PROJECT")
+    async def endpoint(current_user=None):
+        return "done"
+
+    assert inspect.iscoroutinefunction(endpoint)
+    assert asyncio.run(endpoint(current_user=User(username="systemadmin"))) == "done"
@@ -0,0 +1,62 @@
+import asyncio
+
+from app.services.llm import providers
+
+
+class _FakeProvider:
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_get_provider_reuses_and_rebuilds_on_rotation(monkeypatch):
+    monkeypatch.setattr(providers, "build_provider", lambda name, *, api_key, base_url=None, extra=None: _FakeProvider(api_key))
+    monkeypatch.setattr(providers, "_registry", {})
+    monkeypatch.setattr(providers, "_retired", [])
+    clock = [1000.0]
+    monkeypatch.setattr(providers.time, "monotonic", lambda: clock[0])
+
+    a = providers.get_provider("openai", api_key="k1", credential_id=7)
+    assert providers.get_provider("openai", api_key="k1", credential_id=7) is a
+    # Different credential or timeout gets its own pool
+    assert providers.get_provider("openai", api_key="k1", credential_id=8) is not a
+    assert providers.get_provider("openai", api_key="k1", credential_id=7, extra={"timeout_seconds": 10}) is not a
+
+    rotated = providers.get_provider("openai", api_key="k2", credential_id=7)
+    assert rotated is not a and rotated.api_key == "k2"
+    # In-flight users of the old provider keep working through the grace period
+    assert not a.closed
+    clock[0] += providers._RETIRE_GRACE_SECONDS + 1
+    assert providers.get_provider("openai", api_key="k2", credential_id=7) is rotated
+    assert a.closed
+
+    providers.get_provider("openai", api_key="k3", credential_id=7)
+    asyncio.run(providers.close_providers())
+    assert rotated.closed
+    assert providers._registry == {} and providers._retired == []
+
+
+def test_env_keys_without_credential_get_their_own_slots(monkeypatch):
+    monkeypatch.setattr(providers, "build_provider", lambda name, *, api_key, base_url=None, extra=None: _FakeProvider(api_key))
+    monkeypatch.setattr(providers, "_registry", {})
+    monkeypatch.setattr(providers, "_retired", [])
+
+    primary = providers.get_provider("anthropic", api_key="primary")
+    fallback = providers.get_provider("anthropic", api_key="fallback")
+    assert providers.get_provider("anthropic", api_key="primary") is primary
+    assert providers.get_provider("anthropic", api_key="fallback") is fallback
+    assert providers._retired == []
+
+
+def test_google_providers_do_not_share_a_process_wide_key(monkeypatch):
+    monkeypatch.setattr(providers, "_google_client", lambda api_key, use_async=False: ("async" if use_async else "sync", api_key))
+    first = providers.GoogleProvider(providers.ProviderConfig(name="google", api_key="tenant-a"))
+    second = providers.GoogleProvider(providers.ProviderConfig(name="google", api_key="tenant-b"))
+
+    model = first._model("gemini-1.5-flash", "system")
+    assert model._client == ("sync", "tenant-a")
+    assert model._async_client == ("async", "tenant-a")
+    assert second._model("gemini-1.5-flash", "system")._client == ("sync", "tenant-b")
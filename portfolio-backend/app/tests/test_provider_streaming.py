@@ -0,0 +1,73 @@
+import asyncio
+
+from app.services.llm import providers
+
+
+class _Delta:
+    def __init__(self, content):
+        self.content = content
+
+
+class _Chunk:
+    def __init__(self, content):
+        choice = type("Choice", (), {"delta": _Delta(content)})()
+        self.data = type("Data", (), {"choices": [choice]})()
+
+
+class _EventStream:
+    def __init__(self):
+        self.closed = False
+
+    async def __aenter__(self):
+        return self._events()
+
+    async def __aexit__(self, *exc):
+        self.closed = True
+
+    async def _events(self):
+        for word in ["Hello", " there", " friend"]:
+            await asyncio.sleep(0.01)
+            yield _Chunk(word)
+
+
+class _AsyncMistral:
+    def __init__(self):
+        self.stream = _EventStream()
+
+        async def stream_async(**kwargs):
+            return self.stream
+
+        self.chat = type("Chat", (), {"stream_async": staticmethod(stream_async)})()
+
+
+def _provider(client):
+    prov = providers.MistralProvider.__new__(providers.MistralProvider)
+    prov._async = providers._PerLoop(lambda: client)
+    return prov
+
+
+def test_mistral_stream_does_not_block_the_loop_and_closes_on_disconnect():
+    client = _AsyncMistral()
+    prov = _provider(client)
+
+    async def _run():
+        ticks = 0
+
+        async def _ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.001)
+                ticks += 1
+
+        ticker = asyncio.create_task(_ticker())
+        stream = prov.chat_stream(model="m", system_prompt="s", messages=[])
+        first = await stream.__anext__()
+        # Client goes away after the first token
+        await stream.aclose()
+        ticker.cancel()
+        return first, ticks
+
+    first, ticks = asyncio.run(_run())
+    assert first == "Hello"
+    assert ticks > 0
+    assert client.stream.closed
@@ -0,0 +1,38 @@
+import pytest
+
+from app.services import rag_service
+
+
+class _Provider:
+    def __init__(self):
+        self.calls = 0
+
+    def embed(self, *, model, texts):
+        self.calls += 1
+        return [[3.0, 4.0] for _ in texts]
+
+
+def test_embed_query_two_tier_cache(monkeypatch):
+    redis_store = {}
+    monkeypatch.setattr(rag_service.cache_service, "get_query_embedding", lambda model, q: redis_store.get((model, q)))
+    monkeypatch.setattr(rag_service.cache_service, "set_query_embedding", lambda model, q, v, ttl_seconds=0: redis_store.__setitem__((model, q), list(v)))
+    monkeypatch.setattr(rag_service, "_query_embed_lru", rag_service.OrderedDict())
+
+    provider = _Provider()
+    first = rag_service.embed_query(None, provider=provider, embedding_model="m", query="What projects  has he built?")
+    assert first == [0.6, 0.8]
+    assert redis_store == {("m", "what projects has he built?"): [0.6, 0.8]}
+
+    # Same normalized question is served from memory
+    again = rag_service.embed_query(None, provider=provider, embedding_model="m", query="  what projects has he BUILT? ")
+    assert provider.calls == 1
+    assert again == pytest.approx([0.6, 0.8], rel=1e-6)
+
+    # Another worker (empty LRU) hits Redis instead of the provider
+    rag_service._query_embed_lru.clear()
+    rag_service.embed_query(None, provider=provider, embedding_model="m", query="what projects has he built?")
+    assert provider.calls == 1
+
+    # A different model is a different key
+    rag_service.embed_query(None, provider=provider, embedding_model="other", query="what projects has he built?")
+    assert provider.calls == 2
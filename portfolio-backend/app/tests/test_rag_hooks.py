@@ -0,0 +1,56 @@
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+
+from app.rag.hooks import register_after_commit_hook
+from app.rag.rag_events import stage_event
+from app.services.cache_service import cache_service
+
+
+class _HookedSession(Session):
+    pass
+
+
+register_after_commit_hook(_HookedSession)
+
+
+def test_portfolios_resolve_on_the_session_connection_and_bump_after_commit(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/hooks.db")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE rag_source_portfolio(portfolio_id INTEGER, source_table TEXT, source_id TEXT)"))
+        conn.execute(text("INSERT INTO rag_source_portfolio VALUES (3, 'projects', '1'), (5, 'projects', '1'), (7, 'skills', '2')"))
+
+    checkouts = []
+    statements = []
+    event.listen(engine, "checkout", lambda *a: checkouts.append(1))
+    event.listen(engine, "before_cursor_execute", lambda conn, cur, sql, *a: statements.append(sql))
+    bumped = []
+    monkeypatch.setattr(cache_service, "invalidate_portfolio", lambda pid: bumped.append(pid))
+
+    with _HookedSession(bind=engine) as db:
+        for ev in (
+            {"op": "update", "source_table": "projects", "source_id": "1", "changed_fields": []},
+            {"op": "update", "source_table": "projects", "source_id": "1", "changed_fields": []},
+            {"op": "update", "source_table": "portfolios", "source_id": "9", "changed_fields": []},
+        ):
+            stage_event(db, ev)
+        db.execute(text("SELECT 1"))
+        assert bumped == []
+        db.commit()
+
+    assert bumped == [None, 3, 5, 9]
+    assert len(checkouts) == 1
+    assert sum("rag_source_portfolio" in sql for sql in statements) == 1
+
+
+def test_missing_scope_table_still_bumps_unscoped_entries(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/hooks.db")
+    bumped = []
+    monkeypatch.setattr(cache_service, "invalidate_portfolio", lambda pid: bumped.append(pid))
+
+    with _HookedSession(bind=engine) as db:
+        stage_event(db, {"op": "delete", "source_table": "skills", "source_id": "2", "changed_fields": []})
+        db.execute(text("CREATE TABLE kept(id INTEGER)"))
+        db.commit()
+        assert db.execute(text("SELECT COUNT(*) FROM kept")).scalar() == 0
+
+    assert bumped == [None]
@@ -0,0 +1,80 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.rag import indexer, reindex
+
+
+def _setup(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/reindex.db", future=True)
+    with engine.begin() as conn:
+        conn.execute(text(
+            """
+            CREATE TABLE system_settings(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                value TEXT NOT NULL,
+                updated_at TEXT
+            )
+            """
+        ))
+        conn.execute(text("CREATE TABLE projects(id INTEGER PRIMARY KEY)"))
+        conn.execute(text("CREATE TABLE skill_types(code TEXT PRIMARY KEY)"))
+        for i in range(1, 26):
+            conn.execute(text("INSERT INTO projects(id) VALUES (:i)"), {"i": i})
+        for code in ("BE", "DB", "FE"):
+            conn.execute(text("INSERT INTO skill_types(code) VALUES (:c)"), {"c": code})
+    return engine, sessionmaker(bind=engine, future=True)
+
+
+def _settings(engine):
+    with engine.begin() as conn:
+        return {k: v for k, v in conn.execute(text("SELECT key, value FROM system_settings"))}
+
+
+def test_reindex_ranges_checkpoint_and_resume(tmp_path, monkeypatch):
+    engine, Session = _setup(tmp_path)
+    monkeypatch.setattr(reindex, "RANGE_SIZE", 10)
+    monkeypatch.setenv("RAG_REINDEX_EXECUTOR", "thread")
+    seen = []
+    fail_on = {"projects:15"}
+
+    errors = []
+
+    # The real index_record runs; it records failures in rag_index_status and swallows them
+    def _fake_index_language(db, table, rid, record, lang):
+        if f"{table}:{rid}" in fail_on:
+            raise RuntimeError("boom")
+        seen.append((table, rid))
+        return True
+
+    monkeypatch.setattr(indexer, "_load_current_state", lambda db, table, rid: {"id": rid})
+    monkeypatch.setattr(indexer, "_index_record_for_language", _fake_index_language)
+    monkeypatch.setattr(indexer, "retire_other_languages", lambda db, table, rid, langs: 0)
+    monkeypatch.setattr(indexer, "sync_source_scope", lambda db, table, rid: None)
+    monkeypatch.setattr(indexer, "_invalidate_cached_answers", lambda db, table, rid: None)
+    monkeypatch.setattr(indexer, "_set_status", lambda db, table, rid, error: errors.append(error) if error else None)
+
+    with Session() as db:
+        assert reindex.plan_ranges(db, "projects", None, 10) == [(None, 10), (10, 20), (20, None)]
+        assert reindex.plan_ranges(db, "skill_types", "BE", 10) == [("BE", None)]
+
+    # First run: the (10, 20] range fails, so the projects cursor stops at 10
+    reindex.run_reindex(["projects", "skill_types"], session_factory=Session)
+    s = _settings(engine)
+    assert s["rag.reindex.cursor.projects"] == "10"
+    assert s["rag.reindex.cursor.skill_types"] == ""
+    assert s["rag.reindex.total"] == "28"
+    assert errors == ["indexing failed: boom"]
+
+    # Resumed run only covers rows after the cursor and clears it on completion
+    fail_on.clear()
+    seen.clear()
+    processed = reindex.run_reindex(["projects"], session_factory=Session)
+    assert processed == 15
+    assert sorted(int(rid) for _, rid in seen) == list(range(11, 26))
+    assert _settings(engine)["rag.reindex.cursor.projects"] == ""
+
+    with Session() as db:
+        progress = reindex.reindex_progress(db)
+    assert progress["total"] == 15 and progress["processed"] == 15
+    assert progress["throughput_per_sec"] is not None
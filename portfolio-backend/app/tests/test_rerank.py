@@ -0,0 +1,57 @@
+from app.rag import rerank
+
+
+def _item(cid, text, score):
+    return {"chunk_id": cid, "source_table": "projects", "source_id": str(cid), "text": text, "score": score}
+
+
+def test_bm25_rerank_lifts_exact_term_matches():
+    items = [
+        _item(1, "Built a web shop with a modern frontend", 0.82),
+        _item(2, "Team lead for cloud migration projects", 0.80),
+        _item(3, "Deployed services on Kubernetes with Helm charts", 0.78),
+    ]
+    out = rerank.rerank("kubernetes experience", items, provider="bm25", top_k=2)
+    assert [it["chunk_id"] for it in out] == [3, 1]
+    # Retrieval score is preserved for citations
+    assert out[0]["score"] == 0.78 and "rerank_score" in out[0]
+
+
+def test_no_provider_keeps_order_and_pool_size():
+    items = [_item(i, f"text {i}", 1 - i / 10) for i in range(5)]
+    assert rerank.rerank("text", items, provider=None, top_k=3) == items[:3]
+    assert rerank.candidate_pool(5, None, 30) == 5
+    assert rerank.candidate_pool(5, "bm25", None) == rerank.DEFAULT_CANDIDATES
+    assert rerank.candidate_pool(40, "bm25", 30) == 40
+
+
+def test_cross_encoder_falls_back_to_bm25(monkeypatch):
+    def _missing(*a, **k):
+        raise ImportError("sentence_transformers not installed")
+
+    monkeypatch.setattr(rerank, "_cross_encoder_scores", _missing)
+    items = [_item(1, "python", 0.5), _item(2, "golang", 0.6)]
+    out = rerank.rerank("python", items, provider="cross-encoder", top_k=1)
+    assert out[0]["chunk_id"] == 1
+
+
+def test_failed_cross_encoder_load_is_not_retried_until_the_interval(monkeypatch):
+    attempts = []
+
+    def _load(name):
+        attempts.append(name)
+        raise ImportError("sentence_transformers not installed")
+
+    monkeypatch.setattr(rerank, "_cross_encoder", _load)
+    monkeypatch.setattr(rerank, "_unavailable_models", {})
+    items = [_item(1, "python", 0.5), _item(2, "golang", 0.6)]
+    for _ in range(3):
+        assert rerank.rerank("python", items, provider="cross-encoder", model="m", top_k=1)[0]["chunk_id"] == 1
+    assert attempts == ["m"]
+
+    # Once the retry interval has passed the model is loaded again
+    monkeypatch.setattr(rerank, "_MODEL_RETRY_SECONDS", 0.0)
+    rerank._unavailable_models.clear()
+    rerank.rerank("python", items, provider="cross-encoder", model="m", top_k=1)
+    rerank.rerank("python", items, provider="cross-encoder", model="m", top_k=1)
+    assert attempts == ["m", "m", "m"]
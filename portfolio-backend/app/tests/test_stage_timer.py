@@ -0,0 +1,37 @@
+from app.observability import timing
+from app.observability.timing import StageTimer
+
+
+class _Histogram:
+    def __init__(self):
+        self.observed = []
+
+    def labels(self, **labels):
+        hist = self
+
+        class _Child:
+            def observe(self, value):
+                hist.observed.append((labels, value))
+
+        return _Child()
+
+
+def test_stages_accumulate_and_render_server_timing(monkeypatch):
+    hist = _Histogram()
+    monkeypatch.setattr(timing, "chat_stage_seconds", hist)
+
+    timer = StageTimer(agent_id=3)
+    timer.label(provider="OpenAI")
+    timer.record("cache", 0.002)
+    timer.record("cache", 0.003)
+    with timer.stage("search"):
+        pass
+
+    header = timer.server_timing()
+    assert header.startswith("cache;dur=5.0, search;dur=")
+    assert ", total;dur=" in header
+
+    timer.observe()
+    timer.observe()
+    assert [labels["stage"] for labels, _ in hist.observed] == ["cache", "search"]
+    assert hist.observed[0][0] == {"stage": "cache", "agent": "3", "provider": "openai"}
@@ -0,0 +1,51 @@
+import os
+
+from app.rag import storage
+from app.rag.chunking import chunk_stream, chunk_text
+
+
+def test_chunk_stream_matches_chunk_text_over_the_joined_segments():
+    segments = ["a" * 7, "", "b" * 12, "c" * 3, "", "d" * 25]
+    for target, overlap in ((10, 3), (16, 0), (100, 10)):
+        joined = " ".join(s for s in segments if s)
+        assert list(chunk_stream(iter(segments), target, overlap)) == chunk_text(joined, target, overlap)
+    assert list(chunk_stream(iter(["", ""]), 10, 2)) == []
+
+
+def test_pdf_text_is_cached_by_content_and_served_without_parsing(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_TEXT_CACHE_DIR", str(tmp_path / "cache"))
+    pdf = tmp_path / "cv.pdf"
+    pdf.write_bytes(b"%PDF-1.4 fake")
+    parsed = []
+
+    def _pages(path):
+        parsed.append(path)
+        yield "page one"
+        yield "page\ftwo"
+
+    monkeypatch.setattr(storage, "_iter_segments_uncached", _pages)
+
+    assert list(storage.iter_text_from_uri(str(pdf))) == ["page one", "page two"]
+    assert list(storage.iter_text_from_uri(str(pdf))) == ["page one", "page two"]
+    assert len(parsed) == 1
+
+    # A partially consumed extraction is not published
+    pdf.write_bytes(b"%PDF-1.4 changed")
+    next(storage.iter_text_from_uri(str(pdf)))
+    assert len(list((tmp_path / "cache").glob("*.txt"))) == 1
+
+
+def test_cache_prunes_least_recently_used_entries(tmp_path):
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    for i, name in enumerate(["old", "used", "new"]):
+        f = cache / f"{name}.v1.txt"
+        f.write_text("x" * 100)
+        os.utime(f, (1000 + i, 1000 + i))
+    os.utime(cache / "used.v1.txt", (2000, 2000))
+    stale_tmp = cache / "abc.tmp"
+    stale_tmp.write_text("partial")
+    os.utime(stale_tmp, (0, 0))
+
+    storage._prune_cache(cache, max_bytes=250)
+    assert sorted(f.name for f in cache.iterdir()) == ["new.v1.txt", "used.v1.txt"]
@@ -0,0 +1,116 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+try:
+    from testcontainers.postgres import PostgresContainer  # type: ignore
+except Exception:  # pragma: no cover - tests will be skipped if not installed
+    PostgresContainer = None  # type: ignore
+
+from app.services import rag_service
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+        docker.from_env().version()
+        return True
+    except Exception:
+        return False
+
+
+pytestmark = pytest.mark.skipif(PostgresContainer is None or not _docker_available(), reason="testcontainers or docker not available")
+
+DIM = 1536
+
+
+def _create_schema(conn) -> None:
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    conn.execute(text(
+        """
+        CREATE TABLE rag_chunk(
+            id BIGSERIAL PRIMARY KEY,
+            source_table TEXT NOT NULL,
+            source_id TEXT NOT NULL,
+            source_field TEXT,
+            part_index INTEGER NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 1,
+            text TEXT,
+            lang TEXT,
+            is_deleted BOOLEAN NOT NULL DEFAULT FALSE
+        )
+        """
+    ))
+    conn.execute(text(
+        """
+        CREATE TABLE rag_embedding(
+            chunk_id BIGINT NOT NULL,
+            model TEXT NOT NULL,
+            modality TEXT NOT NULL,
+            dim INTEGER NOT NULL,
+            embedding TEXT,
+            embedding_vec vector,
+            PRIMARY KEY(chunk_id, model, modality)
+        )
+        """
+    ))
+    conn.execute(text(
+        """
+        CREATE TABLE rag_source_portfolio(
+            portfolio_id INTEGER NOT NULL,
+            source_table TEXT NOT NULL,
+            source_id TEXT NOT NULL,
+            PRIMARY KEY(portfolio_id, source_table, source_id)
+        )
+        """
+    ))
+    conn.execute(text(
+        f"CREATE INDEX idx_rag_embedding_hnsw_{DIM} ON rag_embedding "
+        f"USING hnsw ((embedding_vec::vector({DIM})) vector_cosine_ops) WHERE dim = {DIM}"
+    ))
+
+
+def _seed(conn, n: int) -> None:
+    conn.execute(text(
+        """
+        INSERT INTO rag_chunk(source_table, source_id, source_field, text)
+        SELECT 'projects', CAST(g % 500 AS TEXT), 'body', 'chunk ' || g
+        FROM generate_series(1, :n) g
+        """
+    ), {"n": n})
+    conn.execute(text(
+        f"""
+        INSERT INTO rag_embedding(chunk_id, model, modality, dim, embedding_vec)
+        SELECT c.id, 'text-embedding-3-small', 'text', {DIM},
+               (SELECT CAST(array_agg(random()) AS vector) FROM generate_series(1, {DIM}) WHERE c.id > 0)
+        FROM rag_chunk c
+        """
+    ))
+    conn.execute(text("INSERT INTO rag_source_portfolio SELECT 1, 'projects', CAST(g AS TEXT) FROM generate_series(0, 499) g"))
+    conn.execute(text("ANALYZE rag_chunk"))
+    conn.execute(text("ANALYZE rag_embedding"))
+
+
+def test_vector_search_uses_hnsw_index():
+    with PostgresContainer("pgvector/pgvector:pg16") as pg:
+        engine = create_engine(pg.get_connection_url())
+        with engine.begin() as conn:
+            _create_schema(conn)
+            _seed(conn, 2000)
+
+        qvec = [0.5] * DIM
+        qparam = "[" + ", ".join(str(x) for x in qvec) + "]"
+        for portfolio_id in (None, 1):
+            filter_sql, filter_params = rag_service._build_chunk_filters(portfolio_id=portfolio_id, tables_filter=None, language_code=None)
+            sql = rag_service._vector_search_sql(DIM, filter_sql)
+            params = {"q": qparam, "m": "text-embedding-3-small", "k": 5, "cand": 40, **filter_params}
+            with engine.begin() as conn:
+                conn.execute(text("SET LOCAL enable_seqscan = off"))
+                plan = "\n".join(r[0] for r in conn.execute(text("EXPLAIN " + sql.text), params))
+            assert f"idx_rag_embedding_hnsw_{DIM}" in plan, plan
+
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            items = rag_service.vector_search(db, qvec=qvec, model="text-embedding-3-small", k=5, score_threshold=None, portfolio_id=1)
+        assert len(items) == 5
+        assert all(items[i]["score"] >= items[i + 1]["score"] for i in range(len(items) - 1))
@@ -0,0 +1,31 @@
+"""add retrieval_mode to agents
+
+Revision ID: 20261016_01
+Revises: adc3d18db10d
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_01"
+down_revision: Union[str, None] = "adc3d18db10d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # vector | hybrid (full-text + vector fused with reciprocal-rank fusion)
+    op.add_column(
+        "agents",
+        sa.Column("retrieval_mode", sa.String(20), nullable=False, server_default="vector"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("agents", "retrieval_mode")
@@ -0,0 +1,92 @@
+"""make rag retrieval ANN-index friendly and add source->portfolio scope map
+
+- Backfill rag_embedding.embedding_vec for rows that only carry the text ``embedding``.
+- Replace the unusable dimensionless HNSW index with partial expression indexes per
+  dimension (pgvector requires a fixed dimension for HNSW).
+- Create rag_source_portfolio so retrieval can scope by portfolio with one indexed join.
+
+Revision ID: 20261016_02
+Revises: 20261016_01
+Create Date: 2026-10-16 00:10:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_02"
+down_revision: Union[str, None] = "20261016_01"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Dimensions that get a dedicated HNSW index (HNSW on ``vector`` supports up to 2000 dims).
+# 1536: text-embedding-3-small / ada-002; 1024 and 768: common open-source models.
+HNSW_DIMS = (1536, 1024, 768)
+
+
+def upgrade() -> None:
+    ctx = op.get_context()
+
+    # One-time backfill of text-only embeddings
+    op.execute(
+        """
+        UPDATE rag_embedding
+        SET embedding_vec = CAST(embedding AS vector)
+        WHERE embedding_vec IS NULL AND embedding IS NOT NULL
+        """
+    )
+
+    try:
+        with ctx.autocommit_block():
+            op.execute("DROP INDEX IF EXISTS idx_rag_embedding_hnsw")
+    except Exception:
+        pass
+    for dim in HNSW_DIMS:
+        try:
+            with ctx.autocommit_block():
+                op.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_rag_embedding_hnsw_{dim} ON rag_embedding "
+                    f"USING hnsw ((embedding_vec::vector({dim})) vector_cosine_ops) WHERE dim = {dim}"
+                )
+        except Exception:
+            pass
+
+    op.create_table(
+        "rag_source_portfolio",
+        sa.Column("portfolio_id", sa.Integer(), nullable=False),
+        sa.Column("source_table", sa.Text(), nullable=False),
+        sa.Column("source_id", sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint("portfolio_id", "source_table", "source_id"),
+    )
+    op.create_index("idx_rag_source_portfolio_source", "rag_source_portfolio", ["source_table", "source_id"])
+
+    op.execute(
+        """
+        INSERT INTO rag_source_portfolio (portfolio_id, source_table, source_id)
+        SELECT p.id, 'portfolios', CAST(p.id AS TEXT) FROM portfolios p
+        UNION
+        SELECT pe.portfolio_id, 'experiences', CAST(pe.experience_id AS TEXT) FROM portfolio_experiences pe
+        UNION
+        SELECT pp.portfolio_id, 'projects', CAST(pp.project_id AS TEXT) FROM portfolio_projects pp
+        UNION
+        SELECT ps.portfolio_id, 'sections', CAST(ps.section_id AS TEXT) FROM portfolio_sections ps
+        UNION
+        SELECT pa.portfolio_id, 'portfolio_attachments', CAST(pa.id AS TEXT) FROM portfolio_attachments pa
+        UNION
+        SELECT pp.portfolio_id, 'project_attachments', CAST(pa.id AS TEXT)
+        FROM project_attachments pa JOIN portfolio_projects pp ON pp.project_id = pa.project_id
+        ON CONFLICT DO NOTHING
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_rag_source_portfolio_source", table_name="rag_source_portfolio")
+    op.drop_table("rag_source_portfolio")
+    for dim in HNSW_DIMS:
+        op.execute(f"DROP INDEX IF EXISTS idx_rag_embedding_hnsw_{dim}")
@@ -0,0 +1,47 @@
+"""add content-addressed rag_embedding_store keyed by (model, checksum)
+
+Revision ID: 20261016_03
+Revises: 20261016_02
+Create Date: 2026-10-16 00:20:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_03"
+down_revision: Union[str, None] = "20261016_02"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "rag_embedding_store",
+        sa.Column("model", sa.Text(), nullable=False),
+        sa.Column("checksum", sa.Text(), nullable=False),
+        sa.Column("dim", sa.Integer(), nullable=False),
+        sa.Column("embedding", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("NOW()"), nullable=False),
+        sa.PrimaryKeyConstraint("model", "checksum"),
+    )
+    # Seed from vectors already paid for
+    op.execute(
+        """
+        INSERT INTO rag_embedding_store (model, checksum, dim, embedding)
+        SELECT DISTINCT ON (e.model, c.checksum) e.model, c.checksum, e.dim, e.embedding
+        FROM rag_embedding e
+        JOIN rag_chunk c ON c.id = e.chunk_id
+        WHERE c.checksum IS NOT NULL AND e.modality = 'text'
+        ORDER BY e.model, c.checksum, c.updated_at DESC
+        ON CONFLICT DO NOTHING
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("rag_embedding_store")
@@ -0,0 +1,51 @@
+"""add rag_answer_cache for semantic answer reuse
+
+Revision ID: 20261016_04
+Revises: 20261016_03
+Create Date: 2026-10-16 00:30:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_04"
+down_revision: Union[str, None] = "20261016_03"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "rag_answer_cache",
+        sa.Column("id", sa.BigInteger(), primary_key=True),
+        sa.Column("agent_id", sa.Integer(), nullable=False),
+        sa.Column("portfolio_id", sa.Integer(), nullable=True),
+        sa.Column("language_id", sa.Integer(), nullable=True),
+        sa.Column("model", sa.Text(), nullable=False),
+        sa.Column("dim", sa.Integer(), nullable=False),
+        sa.Column("query", sa.Text(), nullable=False),
+        sa.Column("answer", sa.Text(), nullable=False),
+        sa.Column("citations", postgresql.JSONB(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("NOW()"), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.execute("ALTER TABLE rag_answer_cache ADD COLUMN embedding_vec vector NOT NULL")
+    # Entries per (agent, portfolio, language) scope are few; an exact scan of the scope beats an ANN index
+    op.create_index(
+        "idx_rag_answer_cache_scope",
+        "rag_answer_cache",
+        ["agent_id", "portfolio_id", "language_id", "model", "dim"],
+    )
+    op.create_index("idx_rag_answer_cache_portfolio", "rag_answer_cache", ["portfolio_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_rag_answer_cache_portfolio", table_name="rag_answer_cache")
+    op.drop_index("idx_rag_answer_cache_scope", table_name="rag_answer_cache")
+    op.drop_table("rag_answer_cache")
@@ -0,0 +1,28 @@
+"""add rerank_candidates to agents
+
+Revision ID: 20261016_05
+Revises: 20261016_04
+Create Date: 2026-10-16 00:40:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_05"
+down_revision: Union[str, None] = "20261016_04"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Candidate pool retrieved before reranking down to top_k (NULL = RAG_RERANK_CANDIDATES)
+    op.add_column("agents", sa.Column("rerank_candidates", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("agents", "rerank_candidates")
@@ -0,0 +1,27 @@
+"""index rag_answer_cache expiry for purging
+
+Revision ID: 20261016_06
+Revises: 20261016_05
+Create Date: 2026-10-16 00:50:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_06"
+down_revision: Union[str, None] = "20261016_05"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Lets the periodic purge of expired answers avoid a full table scan
+    op.create_index("idx_rag_answer_cache_expires_at", "rag_answer_cache", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_rag_answer_cache_expires_at", table_name="rag_answer_cache")
@@ -0,0 +1,33 @@
+"""rag_job_rerun marks for postgres job leases
+
+Revision ID: 20261016_07
+Revises: 20261016_06
+Create Date: 2026-10-16 01:10:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_07"
+down_revision: Union[str, None] = "20261016_06"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A duplicate of a running job leaves a mark here; the lease holder re-runs before releasing
+    op.create_table(
+        "rag_job_rerun",
+        sa.Column("job_key", sa.Text(), nullable=False),
+        sa.Column("requested_at", sa.DateTime(timezone=True), server_default=sa.text("NOW()"), nullable=False),
+        sa.PrimaryKeyConstraint("job_key"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("rag_job_rerun")
@@ -0,0 +1,31 @@
+"""stamp rag_answer_cache rows with the cache generation
+
+Revision ID: 20261016_08
+Revises: 20261016_07
+Create Date: 2026-10-16 01:30:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_08"
+down_revision: Union[str, None] = "20261016_07"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Lookups only serve rows of the current agent/portfolio generation; existing rows match none
+    op.add_column(
+        "rag_answer_cache",
+        sa.Column("generation", sa.Text(), server_default="", nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("rag_answer_cache", "generation")
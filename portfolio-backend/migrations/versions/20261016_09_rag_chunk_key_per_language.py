@@ -0,0 +1,44 @@
+"""key rag_chunk rows per language
+
+Revision ID: 20261016_09
+Revises: 20261016_08
+Create Date: 2026-10-16 01:50:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_09"
+down_revision: Union[str, None] = "20261016_08"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Each language of a multilingual record keeps its own chunks instead of overwriting the
+    # previous language's rows; unlabelled chunks (lang NULL) still conflict with each other
+    op.drop_constraint("uq_rag_chunk_logical", "rag_chunk", type_="unique")
+    op.execute(
+        "CREATE UNIQUE INDEX uq_rag_chunk_logical_lang ON rag_chunk "
+        "(source_table, source_id, source_field, part_index, version, (COALESCE(lang, '')))"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS uq_rag_chunk_logical_lang")
+    # Keep one language per logical chunk (embeddings cascade); the indexer rebuilds the rest
+    op.execute(
+        """
+        DELETE FROM rag_chunk a USING rag_chunk b
+        WHERE a.source_table = b.source_table AND a.source_id = b.source_id
+          AND a.source_field IS NOT DISTINCT FROM b.source_field
+          AND a.part_index = b.part_index AND a.version = b.version AND a.id > b.id
+        """
+    )
+    op.create_unique_constraint(
+        "uq_rag_chunk_logical", "rag_chunk", ["source_table", "source_id", "source_field", "part_index", "version"]
+    )
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""
+Benchmark event-loop stalls and connection-pool pressure with many concurrent chat streams.
+
+Runs N simultaneous streams through chat_service_async.stream_chat_events on one event loop.
+Each stream owns a real SQLAlchemy session on a bounded QueuePool (--pool-size, no overflow,
+--pool-timeout), like the app engine. The database stages (prepare_chat / finish_chat) check
+out a connection, run a query and then block for --db-ms (the time a real pipeline spends
+in synchronous SQLAlchemy); the LLM is an async stream of --tokens tokens. A ticker task
+measures event-loop lag (how late a 5 ms timer fires), and a sampler records the peak of
+checked-out connections.
+
+Both modes run the DB stages on the stream DB thread pool:
+  held       the session keeps its connection through the LLM stream (the previous behaviour)
+  released   the connection goes back to the pool before the LLM call (current behaviour)
+
+By default the pool is backed by a temporary SQLite file, so no database or provider
+credentials are needed; pass --database-url to check out Postgres connections instead.
+
+Usage:
+    python scripts/benchmark_chat_streams.py [--streams 50] [--pool-size 20] [--db-ms 40] [--tokens 30] [--token-ms 20]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from sqlalchemy.pool import QueuePool  # noqa: E402
+
+from app.observability.timing import StageTimer  # noqa: E402
+from app.services import chat_service_async  # noqa: E402
+from app.services.chat_service import ChatPlan  # noqa: E402
+
+TICK_SECONDS = 0.005
+
+
+class _SimulatedProvider:
+    def __init__(self, tokens: int, token_ms: float):
+        self.tokens = tokens
+        self.token_ms = token_ms
+
+    async def chat_stream(self, *, model, system_prompt, messages):
+        for i in range(self.tokens):
+            await asyncio.sleep(self.token_ms / 1000.0)
+            yield f"tok{i} "
+
+
+def _simulated_stages(db_ms: float, provider: _SimulatedProvider):
+    def prepare_chat(db, *, agent_id, user_message, session_id, template_id, portfolio_id, portfolio_query, language_id, timer):
+        db.execute(text("SELECT 1"))
+        time.sleep(db_ms / 1000.0)
+        return ChatPlan(agent_id=agent_id, session_id=session_id, user_message=user_message, language_code="en", provider=provider, chat_model="sim")
+
+    def finish_chat(db, plan, *, answer, usage, latency_ms, timer):
+        db.execute(text("SELECT 1"))
+        time.sleep(db_ms / 1000.0)
+        db.commit()
+        return {"answer": answer, "citations": [], "latency_ms": latency_ms, "session_id": 1}
+
+    return prepare_chat, finish_chat
+
+
+def _keep_connection(db):
+    return None
+
+
+async def _one_stream(engine, i: int) -> tuple:
+    started = time.perf_counter()
+    ttft = None
+    failed = False
+    db = Session(bind=engine)
+    try:
+        async for event in chat_service_async.stream_chat_events(
+            db, agent_id=1, user_message=f"question {i}", session_id=None, timer=StageTimer(agent_id=1),
+        ):
+            if ttft is None and event.get("type") == "token":
+                ttft = time.perf_counter() - started
+            if event.get("type") == "error":
+                failed = True
+    finally:
+        await chat_service_async._run_db(db.close)
+    return ttft, failed
+
+
+async def _run(engine, streams: int) -> dict:
+    lags = []
+    peak = 0
+    stop = asyncio.Event()
+
+    async def _ticker():
+        nonlocal peak
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await asyncio.sleep(TICK_SECONDS)
+            lags.append(time.perf_counter() - t0 - TICK_SECONDS)
+            peak = max(peak, engine.pool.checkedout())
+
+    ticker = asyncio.create_task(_ticker())
+    started = time.perf_counter()
+    results = await asyncio.gather(*(_one_stream(engine, i) for i in range(streams)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await ticker
+    ttfts = sorted(t for t, failed in results if t is not None and not failed)
+    return {
+        "wall_s": wall,
+        "ttft_p50_ms": statistics.median(ttfts) * 1000 if ttfts else 0.0,
+        "ttft_p95_ms": ttfts[int(0.95 * (len(ttfts) - 1))] * 1000 if ttfts else 0.0,
+        "loop_lag_max_ms": max(lags) * 1000 if lags else 0.0,
+        "loop_lag_p95_ms": sorted(lags)[int(0.95 * (len(lags) - 1))] * 1000 if lags else 0.0,
+        "peak_checked_out": peak,
+        "errors": sum(1 for _, failed in results if failed),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=20, help="pooled connections (no overflow), as DB_POOL_SIZE")
+    parser.add_argument("--pool-timeout", type=float, default=5.0, help="seconds to wait for a pooled connection")
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    parser.add_argument("--db-ms", type=float, default=40.0, help="blocking DB time per stage")
+    parser.add_argument("--tokens", type=int, default=30)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    provider = _SimulatedProvider(args.tokens, args.token_ms)
+    chat_service_async.prepare_chat, chat_service_async.finish_chat = _simulated_stages(args.db_ms, provider)
+    release_connection = chat_service_async._release_connection
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    url = args.database_url or f"sqlite:///{os.path.join(tmp_dir.name, 'bench.db')}"
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+
+    print(f"{args.streams} streams, pool {args.pool_size} (timeout {args.pool_timeout:.0f}s), "
+          f"{args.db_ms:.0f} ms blocking DB per stage, {args.tokens} tokens x {args.token_ms:.0f} ms")
+    print(f"{'mode':<10} {'wall s':>8} {'ttft p50':>10} {'ttft p95':>10} {'lag p95':>9} {'lag max':>9} {'peak conn':>10} {'errors':>7}")
+    for mode, release in (("held", _keep_connection), ("released", release_connection)):
+        engine = create_engine(
+            url, poolclass=QueuePool, pool_size=args.pool_size, max_overflow=0,
+            pool_timeout=args.pool_timeout, connect_args=connect_args,
+        )
+        chat_service_async._release_connection = release
+        try:
+            r = asyncio.run(_run(engine, args.streams))
+        finally:
+            engine.dispose()
+        print(f"{mode:<10} {r['wall_s']:>8.2f} {r['ttft_p50_ms']:>8.0f}ms {r['ttft_p95_ms']:>8.0f}ms "
+              f"{r['loop_lag_p95_ms']:>7.1f}ms {r['loop_lag_max_ms']:>7.1f}ms {r['peak_checked_out']:>10} {r['errors']:>7}")
+    tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
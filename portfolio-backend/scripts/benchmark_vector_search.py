@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Benchmark vector_search latency on a synthetic corpus (default 100k chunks).
+
+Seeds rows tagged with source_table='bench' into rag_chunk/rag_embedding/rag_source_portfolio
+on the database pointed to by DATABASE_URL, times filtered and unfiltered searches,
+then removes the synthetic rows (unless --keep is given).
+
+Usage:
+    python scripts/benchmark_vector_search.py [--chunks 100000] [--dim 1536] [--queries 50] [--keep]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from sqlalchemy import text  # noqa: E402
+
+from app.core.database import SessionLocal  # noqa: E402
+from app.services.rag_service import vector_search  # noqa: E402
+
+BENCH_TABLE = "bench"
+BENCH_MODEL = "bench-embedding"
+BENCH_PORTFOLIO_ID = -1
+
+
+def seed(db, chunks: int, dim: int, sources: int = 5000) -> None:
+    print(f"Seeding {chunks} chunks (dim={dim}) ...")
+    db.execute(text(
+        """
+        INSERT INTO rag_chunk (source_table, source_id, source_field, part_index, version, modality, text, tokens, checksum)
+        SELECT :t, CAST(g % :sources AS TEXT), 'body', g / :sources, 1, 'text', 'synthetic chunk ' || g, 3, md5(g::text)
+        FROM generate_series(1, :n) g
+        """
+    ), {"t": BENCH_TABLE, "n": chunks, "sources": sources})
+    db.execute(text(
+        f"""
+        INSERT INTO rag_embedding (chunk_id, modality, model, dim, embedding, embedding_vec)
+        SELECT v.id, 'text', :m, {int(dim)}, CAST(v.vec AS TEXT), v.vec
+        FROM (
+            SELECT c.id, (SELECT CAST(array_agg(random()) AS vector) FROM generate_series(1, {int(dim)}) WHERE c.id > 0) AS vec
+            FROM rag_chunk c WHERE c.source_table = :t
+        ) v
+        """
+    ), {"t": BENCH_TABLE, "m": BENCH_MODEL})
+    # Scope a tenth of the sources to the synthetic portfolio
+    db.execute(text(
+        """
+        INSERT INTO rag_source_portfolio (portfolio_id, source_table, source_id)
+        SELECT :pid, :t, CAST(g AS TEXT) FROM generate_series(0, :sources - 1, 10) g
+        ON CONFLICT DO NOTHING
+        """
+    ), {"pid": BENCH_PORTFOLIO_ID, "t": BENCH_TABLE, "sources": sources})
+    db.commit()
+    db.execute(text("ANALYZE rag_chunk"))
+    db.execute(text("ANALYZE rag_embedding"))
+    db.commit()
+
+
+def cleanup(db) -> None:
+    db.execute(text("DELETE FROM rag_embedding WHERE model = :m"), {"m": BENCH_MODEL})
+    db.execute(text("DELETE FROM rag_chunk WHERE source_table = :t"), {"t": BENCH_TABLE})
+    db.execute(text("DELETE FROM rag_source_portfolio WHERE portfolio_id = :pid"), {"pid": BENCH_PORTFOLIO_ID})
+    db.commit()
+
+
+def run(db, dim: int, queries: int, portfolio_id, k: int = 8) -> list:
+    timings = []
+    for _ in range(queries):
+        qvec = [random.random() for _ in range(dim)]
+        t0 = time.perf_counter()
+        vector_search(db, qvec=qvec, model=BENCH_MODEL, k=k, score_threshold=None, portfolio_id=portfolio_id)
+        timings.append((time.perf_counter() - t0) * 1000.0)
+    return timings
+
+
+def report(label: str, timings: list) -> None:
+    timings = sorted(timings)
+    p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+    print(f"{label:<12} n={len(timings):<4} mean={statistics.mean(timings):8.1f}ms  p50={statistics.median(timings):8.1f}ms  p95={p95:8.1f}ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help="keep synthetic rows after the run")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        cleanup(db)
+        seed(db, args.chunks, args.dim)
+        try:
+            report("unfiltered", run(db, args.dim, args.queries, None))
+            report("portfolio", run(db, args.dim, args.queries, BENCH_PORTFOLIO_ID))
+        finally:
+            if not args.keep:
+                cleanup(db)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())